@@ -1,33 +1,50 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import io
+from fastapi.responses import StreamingResponse
 import torch
 import os
-
-from inference.inference_damage import load_checkpoint, predict_image_bytes
-from inference.inference_dirty import predict_image_path
+import asyncio
+import hashlib
+import json
+import time
+from functools import partial
+from typing import Dict, Optional
+
+from inference.batching import decode_image, draft_enabled
+from inference.embedding_index import embedding_tap, photo_index
+from inference.inference_damage import postprocess_probs as postprocess_damage, predict_batch as predict_damage_batch, predict_image_bytes
+from inference.inference_dirty import (
+    postprocess_probs as postprocess_dirty,
+    predict_batch as predict_dirty_batch,
+    predict_image_bytes as predict_dirty_bytes,
+    reencode_jpeg,
+)
 from inference.inference_damage_parts import (
-    load_checkpoint as load_damage_parts_ckpt,
+    postprocess_probs as postprocess_damage_parts,
+    predict_batch as predict_damage_parts_batch,
     predict_image_bytes as predict_damage_parts_bytes,
 )
 from inference.inference_damaged_windows import (
-    load_checkpoint as load_damaged_windows_ckpt,
+    postprocess_probs as postprocess_damaged_windows,
     predict_image_bytes as predict_damaged_windows_bytes,
 )
 from inference.inference_unified_windows import (
-    load_checkpoint as load_unified_windows_ckpt,
+    postprocess_probs as postprocess_unified_windows,
     predict_image_bytes as predict_unified_windows_bytes,
 )
-from inference.inference_scratch_dent import (
-    load_checkpoint as load_scratch_dent_ckpt,
-    predict_image_bytes as predict_scratch_dent_bytes,
-)
+from inference.inference_scratch_dent import postprocess_probs as postprocess_scratch_dent, predict_image_bytes as predict_scratch_dent_bytes
 from inference.inference_tire_classification import (
-    load_checkpoint as load_tire_classification_ckpt,
+    postprocess_probs as postprocess_tire_classification,
     predict_image_bytes as predict_tire_classification_bytes,
 )
-from services.llm_service import llm_service
+from inference.registry import registry
+from inference.tiling import parse_grid, positive_indices, predict_tiled
+from inference.tta import predict_tta
+from services.http_client import close_clients, pool_status
+from services.llm_service import LLM_DEADLINE_SECONDS, llm_service
+from services.report_cache import report_cache
+from services.report_jobs import report_jobs
+from services.storage import AnalysisRecord, storage
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -58,10 +75,105 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def preload_models():
+    # Load every available checkpoint once; compiled models keep compiling in the background
+    registry.preload()
+
+
+@app.on_event("startup")
+async def start_storage():
+    await storage.start()
+
+
+@app.on_event("shutdown")
+async def stop_storage():
+    # Flushes queued analyses before the pool closes
+    await storage.stop()
+
+
+@app.on_event("shutdown")
+async def stop_report_jobs():
+    # Before the HTTP clients close: pending generations are cancelled, not failed mid-request
+    await report_jobs.stop()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await close_clients()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok", "device": device}
 
+
+@app.get("/models")
+def models_status():
+    return registry.status()
+
+
+@app.get("/storage")
+def storage_status():
+    return storage.status()
+
+
+@app.get("/history")
+async def history(
+    vehicle_id: Optional[str] = None, driver_id: Optional[str] = None, image_hash: Optional[str] = None,
+    before: Optional[int] = None, limit: int = 20,
+):
+    """Past inspections for exactly one of vehicle_id / driver_id / image_hash, newest first.
+
+    Served from storage, so it never touches the models; ``next_before`` is the cursor for the next page.
+    """
+    filters = {name: value for name, value in (("vehicle_id", vehicle_id), ("driver_id", driver_id), ("image_hash", image_hash)) if value}
+    if len(filters) != 1:
+        return {"error": "Pass exactly one of vehicle_id, driver_id or image_hash"}
+    if not storage.available:
+        return {"error": "Analysis storage unavailable", "detail": storage.error}
+    (name, value), = filters.items()
+    return await storage.history(name, value, before, max(1, min(limit, 100)))
+
+
+@app.get("/history/{analysis_id}")
+async def history_item(analysis_id: int):
+    if not storage.available:
+        return {"error": "Analysis storage unavailable", "detail": storage.error}
+    row = await storage.get(analysis_id)
+    if row is None:
+        return {"error": "Analysis not found", "id": analysis_id}
+    return row
+
+
+@app.get("/http_pool")
+def http_pool_status():
+    return pool_status()
+
+
+@app.get("/report_jobs")
+def report_jobs_status():
+    return report_jobs.status()
+
+
+@app.get("/report_jobs/{job_id}")
+def report_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return {"error": "Unknown or expired job", "job_id": job_id}
+    return job
+
+
+@app.get("/report_cache")
+def report_cache_status():
+    return report_cache.status()
+
+
+@app.get("/photo_index")
+def photo_index_status():
+    return photo_index.status()
+
+
 @app.get("/analyze")
 def analyze_info():
     # Lightweight readiness/info endpoint for the frontend
@@ -72,72 +184,95 @@ def analyze_info():
 
 
 @app.post("/damage_local")
-async def damage_local(image: UploadFile = File(...)):
+async def damage_local(image: UploadFile = File(...), tta: bool = False):
     ckpt_path = os.path.join("models", "damage_binary.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with train_damage.py first.", "expected": ckpt_path}
-    model_local, tf, class_to_idx, damage_index = load_checkpoint(ckpt_path)
+    model_local, tf, class_to_idx, damage_index = registry.get("damage_binary")
     image_bytes = await image.read()
+    if tta:
+        return predict_tta(model_local, tf, image_bytes, partial(postprocess_damage, damage_index=damage_index))
     result = predict_image_bytes(model_local, tf, image_bytes, damage_index)
     return result
 
 
 # New endpoint: run damage parts classifier directly
 @app.post("/damage_parts_local")
-async def damage_parts_local(image: UploadFile = File(...)):
+async def damage_parts_local(image: UploadFile = File(...), tta: bool = False):
     ckpt_path = os.path.join("models", "damage_parts.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with trains/train_damage_parts.py first.", "expected": ckpt_path}
     image_bytes = await image.read()
-    model_p, tf_p, idx_to_class_p = load_damage_parts_ckpt(ckpt_path)
+    model_p, tf_p, idx_to_class_p = registry.get("damage_parts")
+    if tta:
+        return predict_tta(model_p, tf_p, image_bytes, partial(postprocess_damage_parts, idx_to_class=idx_to_class_p))
     out = predict_damage_parts_bytes(model_p, tf_p, image_bytes)
     pred_idx = int(out.get("pred_idx", -1))
     out["pred_label"] = idx_to_class_p.get(pred_idx, str(pred_idx))
     return out
 
+def check_tile_grid(tile_grid: Optional[str]) -> None:
+    """422 for a tile_grid that does not parse; oversized grids are clamped by the tiling settings."""
+    if tile_grid is None:
+        return
+    try:
+        parse_grid(tile_grid)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @app.post("/damaged_windows_local")
-async def damaged_windows_local(image: UploadFile = File(...)):
+async def damaged_windows_local(
+    image: UploadFile = File(...), tta: bool = False, tiled: bool = False, tile_grid: Optional[str] = None, tile_overlap: Optional[float] = None,
+):
+    check_tile_grid(tile_grid)
     ckpt_path = os.path.join("models", "damaged_windows.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with trains/train_damaged_windows.py first.", "expected": ckpt_path}
     image_bytes = await image.read()
-    model_w, tf_w, class_to_idx_w = load_damaged_windows_ckpt(ckpt_path)
+    model_w, tf_w, class_to_idx_w = registry.get("damaged_windows")
+    if tiled:
+        return predict_tiled(
+            model_w, tf_w, image_bytes, partial(postprocess_damaged_windows, class_to_idx=class_to_idx_w),
+            positive_indices("damaged_windows", class_to_idx_w), "damaged_windows", tile_grid, tile_overlap,
+        )
+    if tta:
+        return predict_tta(model_w, tf_w, image_bytes, partial(postprocess_damaged_windows, class_to_idx=class_to_idx_w))
     result = predict_damaged_windows_bytes(model_w, tf_w, image_bytes, class_to_idx_w)
     return result
 
 @app.post("/dirty_local")
-async def dirty_local(image: UploadFile = File(...)):
+async def dirty_local(image: UploadFile = File(...), tta: bool = False):
     ckpt_path = os.path.join("models", "dirty_binary.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with train_dirty.py first.", "expected": ckpt_path}
-    # Save uploaded image to a temporary file for convenience
     image_bytes = await image.read()
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=90)
-    buf.seek(0)
-    tmp_path = os.path.join("/tmp", f"dirty_{os.getpid()}.jpg")
-    with open(tmp_path, "wb") as f:
-        f.write(buf.getvalue())
-    try:
-        result = predict_image_path(ckpt_path, tmp_path)
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+    model_d, tf_d, idx_to_class_d, positive_index_d = registry.get("dirty_binary")
+    if tta:
+        return predict_tta(model_d, tf_d, reencode_jpeg(image_bytes), partial(postprocess_dirty, idx_to_class=idx_to_class_d, positive_index=positive_index_d))
+    result = predict_dirty_bytes(model_d, tf_d, image_bytes, idx_to_class_d, positive_index_d)
     return result
 
 
 @app.post("/damaged_windows_local")
-async def damaged_windows_local(image: UploadFile = File(...)):
+async def damaged_windows_local(
+    image: UploadFile = File(...), tta: bool = False, tiled: bool = False, tile_grid: Optional[str] = None, tile_overlap: Optional[float] = None,
+):
+    check_tile_grid(tile_grid)
     ckpt_path = os.path.join("models", "damaged_windows.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with trains/train_damaged_windows.py first.", "expected": ckpt_path}
     
     image_bytes = await image.read()
     try:
-        model_w, tf_w, class_to_idx_w = load_damaged_windows_ckpt(ckpt_path)
+        model_w, tf_w, class_to_idx_w = registry.get("damaged_windows")
+        if tiled:
+            return predict_tiled(
+                model_w, tf_w, image_bytes, partial(postprocess_damaged_windows, class_to_idx=class_to_idx_w),
+                positive_indices("damaged_windows", class_to_idx_w), "damaged_windows", tile_grid, tile_overlap,
+            )
+        if tta:
+            return predict_tta(model_w, tf_w, image_bytes, partial(postprocess_damaged_windows, class_to_idx=class_to_idx_w))
         result = predict_damaged_windows_bytes(model_w, tf_w, image_bytes, class_to_idx_w)
         return result
     except Exception as e:
@@ -145,14 +280,24 @@ async def damaged_windows_local(image: UploadFile = File(...)):
 
 
 @app.post("/unified_windows_local")
-async def unified_windows_local(image: UploadFile = File(...)):
+async def unified_windows_local(
+    image: UploadFile = File(...), tta: bool = False, tiled: bool = False, tile_grid: Optional[str] = None, tile_overlap: Optional[float] = None,
+):
+    check_tile_grid(tile_grid)
     ckpt_path = os.path.join("models", "unified_windows.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with trains/train_unified_windows.py first.", "expected": ckpt_path}
     
     image_bytes = await image.read()
     try:
-        model_uw, tf_uw, class_to_idx_uw = load_unified_windows_ckpt(ckpt_path)
+        model_uw, tf_uw, class_to_idx_uw = registry.get("unified_windows")
+        if tiled:
+            return predict_tiled(
+                model_uw, tf_uw, image_bytes, partial(postprocess_unified_windows, class_to_idx=class_to_idx_uw),
+                positive_indices("unified_windows", class_to_idx_uw), "unified_windows", tile_grid, tile_overlap,
+            )
+        if tta:
+            return predict_tta(model_uw, tf_uw, image_bytes, partial(postprocess_unified_windows, class_to_idx=class_to_idx_uw))
         result = predict_unified_windows_bytes(model_uw, tf_uw, image_bytes, class_to_idx_uw)
         return result
     except Exception as e:
@@ -160,14 +305,16 @@ async def unified_windows_local(image: UploadFile = File(...)):
 
 
 @app.post("/scratch_dent_local")
-async def scratch_dent_local(image: UploadFile = File(...)):
+async def scratch_dent_local(image: UploadFile = File(...), tta: bool = False):
     ckpt_path = os.path.join("models", "scratch_dent.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with trains/train_scratch_dent.py first.", "expected": ckpt_path}
     
     image_bytes = await image.read()
     try:
-        model_sd, tf_sd, class_to_idx_sd = load_scratch_dent_ckpt(ckpt_path)
+        model_sd, tf_sd, class_to_idx_sd = registry.get("scratch_dent")
+        if tta:
+            return predict_tta(model_sd, tf_sd, image_bytes, partial(postprocess_scratch_dent, class_to_idx=class_to_idx_sd))
         result = predict_scratch_dent_bytes(model_sd, tf_sd, image_bytes, class_to_idx_sd)
         return result
     except Exception as e:
@@ -175,34 +322,79 @@ async def scratch_dent_local(image: UploadFile = File(...)):
 
 
 @app.post("/tire_classification_local")
-async def tire_classification_local(image: UploadFile = File(...)):
+async def tire_classification_local(
+    image: UploadFile = File(...), tta: bool = False, tiled: bool = False, tile_grid: Optional[str] = None, tile_overlap: Optional[float] = None,
+):
+    check_tile_grid(tile_grid)
     ckpt_path = os.path.join("models", "tire_classification.pt")
     if not os.path.exists(ckpt_path):
         return {"error": "Local checkpoint not found. Train with trains/train_tire_classification.py first.", "expected": ckpt_path}
     
     image_bytes = await image.read()
     try:
-        model_tc, tf_tc, class_to_idx_tc = load_tire_classification_ckpt(ckpt_path)
+        model_tc, tf_tc, class_to_idx_tc = registry.get("tire_classification")
+        if tiled:
+            return predict_tiled(
+                model_tc, tf_tc, image_bytes, partial(postprocess_tire_classification, class_to_idx=class_to_idx_tc),
+                positive_indices("tire_classification", class_to_idx_tc), "tire_classification", tile_grid, tile_overlap,
+            )
+        if tta:
+            return predict_tta(model_tc, tf_tc, image_bytes, partial(postprocess_tire_classification, class_to_idx=class_to_idx_tc))
         result = predict_tire_classification_bytes(model_tc, tf_tc, image_bytes, class_to_idx_tc)
         return result
     except Exception as e:
         return {"error": f"Tire classification prediction failed: {str(e)}"}
 
 
-@app.post("/analyze")
-async def analyze(image: UploadFile = File(...)):
-    image_bytes = await image.read()
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000.0, 2)
+
+
+# Checkpoints run_analysis may use; a retrained one invalidates the photos analyzed with its predecessor
+ANALYSIS_MODELS = ("damage_binary", "damage_parts", "dirty_binary")
+
+
+def _checkpoint_mtimes(names) -> Dict[str, Optional[int]]:
+    # From disk rather than registry.versions(): models still unloaded at lookup time must compare equal later
+    mtimes = {}
+    for name in names:
+        path = os.path.join("models", f"{name}.pt")
+        mtimes[name] = int(os.path.getmtime(path)) if os.path.exists(path) else None
+    return mtimes
+
+
+def run_analysis(image_bytes: bytes, image_hash: str, tta: bool = False, timings: Optional[Dict[str, float]] = None) -> dict:
+    """The /analyze pipeline on raw bytes; per-step wall times (ms) are added to ``timings``."""
+    if timings is None:
+        timings = {}
 
     # 1) is_damaged: prefer local binary model; fallback to HF classifier threshold
+    # Decode once for all models, at reduced resolution when the upload is far larger than their inputs
+    start = time.perf_counter()
+    try:
+        image_input = decode_image(image_bytes, registry.max_image_size() if draft_enabled() else None)
+    except Exception:
+        image_input = image_bytes  # each model reports the decode error itself
+    timings["decode_ms"] = _elapsed_ms(start)
+
     is_damaged = None
     damage_source = None
     damage_local_result = None
+    embedding = None
 
     try:
         ckpt_path_damage = os.path.join("models", "damage_binary.pt")
         if os.path.exists(ckpt_path_damage):
-            model_local, tf, class_to_idx, damage_index = load_checkpoint(ckpt_path_damage)
-            damage_local_result = predict_image_bytes(model_local, tf, image_bytes, damage_index)
+            model_local, tf, class_to_idx, damage_index = registry.get("damage_binary")
+            start = time.perf_counter()
+            # The damage pass doubles as the photo's embedding for the near-duplicate index
+            with embedding_tap(model_local).capture() as tap:
+                if tta:
+                    damage_local_result = predict_tta(model_local, tf, image_input, partial(postprocess_damage, damage_index=damage_index))
+                else:
+                    damage_local_result = predict_damage_batch(model_local, tf, [image_input], damage_index)[0]
+            embedding = tap.features[0] if tap.features is not None else None
+            timings["damage_binary_ms"] = _elapsed_ms(start)
             if isinstance(damage_local_result, dict) and "damaged" in damage_local_result:
                 is_damaged = bool(damage_local_result["damaged"])
                 damage_source = "local"
@@ -211,6 +403,17 @@ async def analyze(image: UploadFile = File(...)):
 
     # Hugging Face inference removed; if no local damage model, is_damaged stays None
 
+    # Same photo (or a recompressed / recropped copy) seen before with the same options: serve its analysis again
+    options = {"tta": bool(tta), "draft": draft_enabled(), "checkpoints": _checkpoint_mtimes(ANALYSIS_MODELS)}
+    start = time.perf_counter()
+    reused = photo_index.lookup(embedding, image_hash, options)
+    timings["photo_lookup_ms"] = _elapsed_ms(start)
+    if reused is not None:
+        photo_id, payload, reuse = reused
+        timings["reused_photo_id"] = photo_id
+        print(f"Photo reuse: {image_hash[:12]} matches photo {photo_id} (similarity {reuse['similarity']}, exact {reuse['exact_match']})")
+        return {**payload["result"], "photo_id": photo_id, "possible_photo_reuse": True, "reuse": reuse}
+
     # 2.5) Rust/scratch classification removed
 
     # 2.6) If damaged, run parts-level multiclass classifier (same as /damage_parts_local)
@@ -219,12 +422,13 @@ async def analyze(image: UploadFile = File(...)):
         try:
             ckpt_path_parts = os.path.join("models", "damage_parts.pt")
             if os.path.exists(ckpt_path_parts):
-                model_p, tf_p, idx_to_class_p = load_damage_parts_ckpt(ckpt_path_parts)
-                parts = predict_damage_parts_bytes(model_p, tf_p, image_bytes)
-                # map index to label for convenience
-                pred_idx = int(parts.get("pred_idx", -1))
-                parts["pred_label"] = idx_to_class_p.get(pred_idx, str(pred_idx))
-                damage_parts_local = parts
+                model_p, tf_p, idx_to_class_p = registry.get("damage_parts")
+                start = time.perf_counter()
+                if tta:
+                    damage_parts_local = predict_tta(model_p, tf_p, image_input, partial(postprocess_damage_parts, idx_to_class=idx_to_class_p))
+                else:
+                    damage_parts_local = predict_damage_parts_batch(model_p, tf_p, [image_input], idx_to_class_p)[0]
+                timings["damage_parts_ms"] = _elapsed_ms(start)
             else:
                 damage_parts_local = {"error": "Local checkpoint not found. Train with trains/train_damage_parts.py first.", "expected": ckpt_path_parts}
         except Exception as e:
@@ -236,47 +440,116 @@ async def analyze(image: UploadFile = File(...)):
         try:
             ckpt_path_dirty = os.path.join("models", "dirty_binary.pt")
             if os.path.exists(ckpt_path_dirty):
-                img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-                buf = io.BytesIO()
-                img.save(buf, format="JPEG", quality=90)
-                buf.seek(0)
-                tmp_path = os.path.join("/tmp", f"dirty_{os.getpid()}.jpg")
-                with open(tmp_path, "wb") as f:
-                    f.write(buf.getvalue())
-                try:
-                    dirty_result = predict_image_path(ckpt_path_dirty, tmp_path)
-                finally:
-                    try:
-                        os.remove(tmp_path)
-                    except Exception:
-                        pass
+                model_d, tf_d, idx_to_class_d, positive_index_d = registry.get("dirty_binary")
+                start = time.perf_counter()
+                if tta:
+                    dirty_result = predict_tta(model_d, tf_d, reencode_jpeg(image_input), partial(postprocess_dirty, idx_to_class=idx_to_class_d, positive_index=positive_index_d))
+                else:
+                    dirty_result = predict_dirty_batch(model_d, tf_d, [image_input], idx_to_class_d, positive_index_d)[0]
+                timings["dirty_binary_ms"] = _elapsed_ms(start)
             else:
                 dirty_result = {"error": "Local checkpoint not found. Train with train_dirty.py first.", "expected": ckpt_path_dirty}
         except Exception as e:
             dirty_result = {"error": f"Dirty check failed: {str(e)}"}
 
 
-    return {
+    result = {
         "is_damaged": bool(is_damaged),
         "damage_source": damage_source,
         "damage_local": damage_local_result,
         "damage_parts_local": damage_parts_local,
         "dirty": dirty_result,
     }
+    photo_id = photo_index.add(embedding, result, image_hash, options)
+    return {**result, "photo_id": photo_id, "possible_photo_reuse": False}
+
+
+def record_analysis(
+    endpoint: str, image_hash: str, outputs: dict, timings: Dict[str, float], start: float,
+    condition_score: Optional[float] = None, vehicle_id: Optional[str] = None, driver_id: Optional[str] = None,
+) -> None:
+    """Queue the analysis for persistence; the write happens off the request path."""
+    timings["total_ms"] = _elapsed_ms(start)
+    storage.record(AnalysisRecord(
+        endpoint=endpoint,
+        image_hash=image_hash,
+        outputs=outputs,
+        model_versions=registry.versions(),
+        timings=timings,
+        condition_score=condition_score,
+        vehicle_id=vehicle_id,
+        driver_id=driver_id,
+    ))
+
+
+@app.post("/analyze")
+async def analyze(image: UploadFile = File(...), tta: bool = False, vehicle_id: Optional[str] = None, driver_id: Optional[str] = None):
+    start = time.perf_counter()
+    image_bytes = await image.read()
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    timings: Dict[str, float] = {}
+    result = run_analysis(image_bytes, image_hash, tta, timings)
+    record_analysis("analyze", image_hash, result, timings, start, vehicle_id=vehicle_id, driver_id=driver_id)
+    return result
+
+
+def comprehensive_response(technical_analysis: dict, llm_reports: dict, job_id: Optional[str] = None) -> dict:
+    """The structured /analyze-comprehensive body; with a job_id the reports are provisional templates."""
+    return {
+        "technical_analysis": technical_analysis,
+        "condition_score": llm_reports.get("condition_score", 0),
+        "reports": {
+            "driver": llm_reports.get("driver_report", ""),
+            "passenger": llm_reports.get("passenger_report", ""),
+            "business": llm_reports.get("business_report", "")
+        },
+        "recommendations": llm_reports.get("recommendations", []),
+        "metadata": {
+            "analysis_timestamp": "2025-09-14",
+            "model_version": "v1.0",
+            "output_type": "structured",
+            "confidence_threshold": 0.5,
+            "llm_usage": llm_reports.get("usage"),
+            "llm_fallback_sections": llm_reports.get("fallback_sections", []),
+            "llm_cache": llm_reports.get("cache", {"hit": False}),
+            "provisional": job_id is not None,
+            "job_id": job_id,
+        }
+    }
+
+
+def finish_report_job(technical_analysis: dict, photo_id: Optional[int], llm_reports: dict) -> dict:
+    # The generation already stored itself in report_cache; a reused photo gets the full reports too
+    response = comprehensive_response(technical_analysis, llm_reports)
+    photo_index.attach(photo_id, "comprehensive", response)
+    return response
 
 
 @app.post("/analyze-comprehensive")
-async def analyze_comprehensive(image: UploadFile = File(...), output_type: str = "structured"):
+async def analyze_comprehensive(
+    image: UploadFile = File(...), output_type: str = "structured", tta: bool = False,
+    vehicle_id: Optional[str] = None, driver_id: Optional[str] = None, llm_mode: Optional[str] = None,
+    llm_deadline: Optional[float] = None,
+):
     """
     Comprehensive car analysis with LLM-generated reports for different stakeholders
     
     Args:
         output_type: "structured" for detailed reports or "raw" for technical data only
+        llm_mode: "parallel" (four concurrent completions) or "combined" (one JSON completion); default LLM_REPORT_MODE
+        llm_deadline: seconds to wait for the LLM (default LLM_DEADLINE_SECONDS, <= 0 waits indefinitely).
+            Past it the response carries template reports with metadata.provisional and a job_id;
+            GET /report_jobs/{job_id} serves the LLM reports once they are done.
     """
     # Get technical analysis first
-    technical_analysis = await analyze(image)
+    start = time.perf_counter()
+    image_bytes = await image.read()
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    timings: Dict[str, float] = {}
+    technical_analysis = run_analysis(image_bytes, image_hash, tta, timings)
     
     if output_type == "raw":
+        record_analysis("analyze-comprehensive", image_hash, technical_analysis, timings, start, vehicle_id=vehicle_id, driver_id=driver_id)
         # Return raw technical analysis without LLM processing
         return {
             "technical_analysis": technical_analysis,
@@ -295,25 +568,104 @@ async def analyze_comprehensive(image: UploadFile = File(...), output_type: str
             }
         }
     else:
-        # Generate comprehensive reports using LLM (structured output)
-        llm_reports = llm_service.generate_comprehensive_report(technical_analysis)
-        
-        return {
-            "technical_analysis": technical_analysis,
-            "condition_score": llm_reports.get("condition_score", 0),
-            "reports": {
-                "driver": llm_reports.get("driver_report", ""),
-                "passenger": llm_reports.get("passenger_report", ""), 
-                "business": llm_reports.get("business_report", "")
-            },
-            "recommendations": llm_reports.get("recommendations", []),
-            "metadata": {
-                "analysis_timestamp": "2025-09-14",
-                "model_version": "v1.0",
-                "output_type": "structured",
-                "confidence_threshold": 0.5
-            }
-        }
+        # A reused photo whose reports were already generated skips the LLM
+        photo_id = technical_analysis.get("photo_id")
+        cached = photo_index.cached(photo_id, "comprehensive") if technical_analysis.get("possible_photo_reuse") else None
+        if cached is not None:
+            response = {**cached, "technical_analysis": technical_analysis}
+            record_analysis(
+                "analyze-comprehensive", image_hash, response, timings, start,
+                condition_score=response.get("condition_score"), vehicle_id=vehicle_id, driver_id=driver_id,
+            )
+            return response
+
+        # Generate comprehensive reports using LLM (structured output), bounded by the deadline:
+        # a late LLM gets template reports now and keeps running as a job
+        llm_start = time.perf_counter()
+        deadline = LLM_DEADLINE_SECONDS if llm_deadline is None else llm_deadline
+        generation = asyncio.ensure_future(llm_service.generate_comprehensive_report_async(technical_analysis, llm_mode))
+        try:
+            # shield: the timeout abandons the wait, not the generation
+            llm_reports = await asyncio.wait_for(asyncio.shield(generation), deadline if deadline > 0 else None)
+        except asyncio.TimeoutError:
+            job_id = report_jobs.submit(generation, partial(finish_report_job, technical_analysis, photo_id))
+            response = comprehensive_response(technical_analysis, llm_service.fallback_reports(technical_analysis), job_id)
+            timings["llm_ms"] = _elapsed_ms(llm_start)
+            record_analysis(
+                "analyze-comprehensive", image_hash, response, timings, start,
+                condition_score=response["condition_score"], vehicle_id=vehicle_id, driver_id=driver_id,
+            )
+            return response
+        timings["llm_ms"] = _elapsed_ms(llm_start)
+
+        response = comprehensive_response(technical_analysis, llm_reports)
+        photo_index.attach(photo_id, "comprehensive", response)
+        record_analysis(
+            "analyze-comprehensive", image_hash, response, timings, start,
+            condition_score=response["condition_score"], vehicle_id=vehicle_id, driver_id=driver_id,
+        )
+        return response
+
+
+STREAM_SECTIONS = {"driver_report": "driver", "passenger_report": "passenger", "business_report": "business", "recommendations": "recommendations"}
+
+
+@app.post("/analyze-comprehensive/stream")
+async def analyze_comprehensive_stream(
+    image: UploadFile = File(...), format: str = "ndjson", tta: bool = False,
+    vehicle_id: Optional[str] = None, driver_id: Optional[str] = None,
+):
+    """
+    Comprehensive analysis with the reports streamed as they are generated
+
+    Args:
+        format: "ndjson" (one JSON event per line) or "sse" (text/event-stream)
+
+    Events: technical_analysis, start, token (section, text), section (section, value, fallback), done.
+    The four sections stream concurrently, so token events of different sections interleave.
+    """
+    if format not in ("ndjson", "sse"):
+        return {"error": "format must be 'ndjson' or 'sse'"}
+    start = time.perf_counter()
+    image_bytes = await image.read()
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    timings: Dict[str, float] = {}
+    technical_analysis = run_analysis(image_bytes, image_hash, tta, timings)
+
+    def encode(event: dict) -> str:
+        data = json.dumps(event, ensure_ascii=False)
+        return f"data: {data}\n\n" if format == "sse" else f"{data}\n"
+
+    async def events():
+        yield encode({"type": "technical_analysis", "technical_analysis": technical_analysis})
+        llm_start = time.perf_counter()
+        response = {"technical_analysis": technical_analysis, "reports": {}, "recommendations": []}
+        fallback_sections = []
+        async for event in llm_service.stream_comprehensive_report(technical_analysis):
+            if event["type"] == "start":
+                response["condition_score"] = event["condition_score"]
+            elif event["type"] == "section":
+                section = STREAM_SECTIONS[event["section"]]
+                if section == "recommendations":
+                    response["recommendations"] = event["value"]
+                else:
+                    response["reports"][section] = event["value"]
+                if event["fallback"]:
+                    fallback_sections.append(event["section"])
+            elif event["type"] == "done":
+                timings["llm_ms"] = _elapsed_ms(llm_start)
+                timings["llm_first_token_ms"] = event["first_token_ms"]
+                response["metadata"] = {"output_type": "stream", "llm_fallback_sections": fallback_sections, "llm_cache": {"hit": event["cached"]}}
+            yield encode(event)
+        # Only reached when the client stayed to the end
+        record_analysis(
+            "analyze-comprehensive", image_hash, response, timings, start,
+            condition_score=response.get("condition_score"), vehicle_id=vehicle_id, driver_id=driver_id,
+        )
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    # no-transform / X-Accel-Buffering keep proxies from buffering the stream into one response
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
 
 
 
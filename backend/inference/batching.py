@@ -0,0 +1,164 @@
+"""Shared pieces of the batched predict API: input decoding, one forward pass, label maps."""
+
+import weakref
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+from inference.buffers import batch_buffer
+from inference.config import get_option
+from inference.decoders import Decoded, ImageInput, decode, decode_many
+from inference.preprocess import preprocessor_for
+
+
+BatchInput = Union[Sequence[ImageInput], torch.Tensor]
+
+# Models already moved to their serving device, so the per-request path skips Module.to
+_placed: "weakref.WeakKeyDictionary[nn.Module, str]" = weakref.WeakKeyDictionary()
+
+
+class BatchResult(NamedTuple):
+    """Compact batch output: arrays instead of per-image dicts of Python lists."""
+
+    probs: np.ndarray  # float32 [N, C]
+    pred_idx: np.ndarray  # int64 [N]
+    errors: List[Optional[str]]
+
+
+class LabelMap(dict):
+    """``class_to_idx`` with the reverse lookups precomputed once at load time."""
+
+    def __init__(self, class_to_idx: Dict[str, int]) -> None:
+        super().__init__(class_to_idx)
+        self.idx_to_class: Dict[int, str] = {v: k for k, v in class_to_idx.items()}
+        size = max(self.idx_to_class) + 1 if self.idx_to_class else 0
+        # Index-ordered class names, so a batch of predicted indices maps with one lookup each
+        self.names: List[str] = [self.idx_to_class.get(i, f"class_{i}") for i in range(size)]
+
+    def name(self, idx: int) -> str:
+        return self.names[idx] if 0 <= idx < len(self.names) else f"class_{idx}"
+
+
+def as_label_map(class_to_idx: Dict[str, int]) -> LabelMap:
+    return class_to_idx if isinstance(class_to_idx, LabelMap) else LabelMap(class_to_idx)
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
+
+
+def image_size(tf: transforms.Compose) -> int:
+    """Square input size of a Resize-first eval transform."""
+    for t in tf.transforms:
+        if isinstance(t, transforms.Resize):
+            size = t.size
+            return int(size[0] if isinstance(size, (tuple, list)) else size)
+    return 224
+
+
+def draft_enabled() -> bool:
+    """Reduced-resolution decoding shifts predictions slightly, so it is opt-in
+    (``INFERENCE_DECODE_DRAFT=on``) once tools/benchmark_decode.py shows the drift is acceptable."""
+    return get_option(None, "decode_draft", "off") == "on"
+
+
+def tensor_preprocess_enabled() -> bool:
+    """``preprocess=tensor`` swaps the per-image PIL transforms for the batched uint8 Preprocessor."""
+    return get_option(None, "preprocess", "pil") == "tensor"
+
+
+def decode_image(image: ImageInput, min_size: Optional[int] = None) -> Decoded:
+    """Decode one upload with the configured decoder backend (see ``inference.decoders``)."""
+    return decode(image, min_size)
+
+
+def preprocess(tf: transforms.Compose, image: Decoded) -> torch.Tensor:
+    """Apply an eval transform to a decoded PIL image or uint8 [3, H, W] tensor."""
+    if isinstance(image, Image.Image):
+        return tf(image)
+    x = image
+    for t in tf.transforms:
+        # Resize and Normalize take tensors as they are; the PIL converters do not
+        if isinstance(t, transforms.ToTensor):
+            x = x.float().div_(255)
+        elif not isinstance(t, transforms.PILToTensor):
+            x = t(x)
+    return x
+
+
+def on_device(model: nn.Module, device: str) -> nn.Module:
+    """Move ``model`` to ``device`` once; later calls for the same device are a dict lookup."""
+    if _placed.get(model) != device:
+        model.to(device)
+        _placed[model] = device
+    return model
+
+
+def build_batch(
+    tf: transforms.Compose, images: BatchInput, skip_errors: bool = False
+) -> Tuple[Optional[torch.Tensor], List[Optional[str]]]:
+    """Decode and preprocess ``images`` into one input batch (None when every image failed).
+
+    ``images`` is a list of encoded bytes / decoded images, or an already preprocessed
+    [N, 3, H, W] tensor. With ``skip_errors`` images that fail to decode are left out
+    of the batch and reported in the returned per-input error list instead of raising.
+    """
+    errors: List[Optional[str]] = [None] * len(images)
+    if isinstance(images, torch.Tensor):
+        return images, errors
+    min_size = image_size(tf) if draft_enabled() else None
+    batched = tensor_preprocess_enabled()
+    items = []
+    for i, decoded in enumerate(decode_many(images, min_size)):
+        try:
+            if isinstance(decoded, Exception):
+                raise decoded
+            items.append(decoded if batched else preprocess(tf, decoded))
+        except Exception as e:
+            if not skip_errors:
+                raise
+            errors[i] = str(e)
+    if not items:
+        return None, errors
+    if batched:
+        return preprocessor_for(tf)(items), errors
+    return torch.stack(items, out=batch_buffer(len(items), tuple(items[0].shape), items[0].dtype)), errors
+
+
+def run_batch(
+    model: nn.Module,
+    tf: transforms.Compose,
+    images: BatchInput,
+    device: Optional[str] = None,
+    skip_errors: bool = False,
+) -> Tuple[torch.Tensor, List[Optional[str]]]:
+    """Softmax probabilities (on CPU) for a batch from a single forward pass (see ``build_batch`` for inputs)."""
+    if device is None:
+        device = default_device()
+    x, errors = build_batch(tf, images, skip_errors)
+    if x is None:
+        return torch.empty(0, 0), errors
+    logits = on_device(model, device)(x.to(device))
+    return torch.softmax(logits.float(), dim=-1).cpu(), errors
+
+
+@torch.inference_mode()
+def predict_arrays(
+    model: nn.Module,
+    tf: transforms.Compose,
+    images: BatchInput,
+    device: Optional[str] = None,
+    skip_errors: bool = False,
+) -> BatchResult:
+    """``run_batch`` for callers that want arrays: probabilities and top-1 indices as NumPy, no dicts.
+
+    With ``skip_errors`` the arrays only hold rows for the images that decoded.
+    """
+    probs, errors = run_batch(model, tf, images, device, skip_errors)
+    if not len(probs):
+        return BatchResult(np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64), errors)
+    return BatchResult(probs.numpy(), probs.argmax(dim=1).numpy(), errors)
@@ -0,0 +1,65 @@
+"""Reusable input buffers for the steady-state request path.
+
+Batches are assembled into preallocated tensors, one per batch-size bucket, shape and
+dtype, instead of a fresh ``torch.stack`` / ``.float()`` allocation per request.
+Buffers are per thread (FastAPI runs sync endpoints on a thread pool), and a batch
+is a view that stays valid until the same thread asks for the same buffer again, so
+callers must consume it (run the forward pass) before preparing the next batch.
+
+Batches larger than the biggest bucket (e.g. a large ``tile_grid``) get a fresh tensor
+that is not kept, so the pool stays bounded by its buckets. Tensors created under
+``torch.inference_mode`` cannot be written outside it, so buffers are pooled separately
+per mode.
+"""
+
+import threading
+from typing import Dict, Sequence, Tuple
+
+import torch
+
+from inference.config import get_option
+
+
+BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class BufferPool:
+    def __init__(self, buckets: Sequence[int] = BUCKETS) -> None:
+        self.buckets = sorted(buckets)
+        self._local = threading.local()
+
+    def _buffers(self) -> Dict[Tuple[int, Tuple[int, ...], torch.dtype, bool], torch.Tensor]:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        return buffers
+
+    def get(self, n: int, shape: Tuple[int, ...], dtype: torch.dtype) -> torch.Tensor:
+        """An uninitialised [n, *shape] tensor backed by the smallest bucket that fits."""
+        bucket = next((b for b in self.buckets if b >= n), None)
+        if bucket is None:
+            return torch.empty((n,) + tuple(shape), dtype=dtype)
+        key = (bucket, tuple(shape), dtype, torch.is_inference_mode_enabled())
+        buffers = self._buffers()
+        buf = buffers.get(key)
+        if buf is None:
+            buf = buffers[key] = torch.empty((bucket,) + tuple(shape), dtype=dtype)
+        return buf[:n]
+
+    def allocated_bytes(self) -> int:
+        """Bytes held by the calling thread's buffers."""
+        return sum(b.numel() * b.element_size() for b in self._buffers().values())
+
+
+input_buffers = BufferPool()
+
+
+def reuse_enabled() -> bool:
+    return get_option(None, "reuse_buffers", "on") != "off"
+
+
+def batch_buffer(n: int, shape: Tuple[int, ...], dtype: torch.dtype) -> torch.Tensor:
+    """A pooled buffer when reuse is on (the default), otherwise a fresh tensor."""
+    if reuse_enabled():
+        return input_buffers.get(n, shape, dtype)
+    return torch.empty((n,) + tuple(shape), dtype=dtype)
@@ -0,0 +1,80 @@
+"""Confidence-gated two-stage serving: a small first-stage model answers when it is sure.
+
+The first stage is the same task trained with a light arch (``mobilenet_v2`` for the
+damage/parts/dirty trainers, ``mobilenet`` or ``simple`` for the others) into
+``models/first_stage/<stem>.pt``. ``tools/calibrate_cascade.py`` picks the confidence
+threshold that keeps validation accuracy within a target of the full model and writes
+it to ``<stem>.cascade.json`` next to the full checkpoint. With both present (and
+``cascade`` not ``off``) the registry serves the pair as one CascadeModel.
+"""
+
+import json
+import os
+import threading
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+from inference.config import MODELS_DIR, get_option
+
+
+FIRST_STAGE_DIR = os.getenv("FIRST_STAGE_DIR", os.path.join(MODELS_DIR, "first_stage"))
+
+
+def first_stage_path(name: str) -> str:
+    return os.path.join(FIRST_STAGE_DIR, f"{name}.pt")
+
+
+def cascade_config_path(ckpt_path: str) -> str:
+    return os.path.splitext(ckpt_path)[0] + ".cascade.json"
+
+
+class CascadeModel(nn.Module):
+    """Runs ``first`` on the whole batch and ``full`` only on the rows below ``threshold`` confidence."""
+
+    def __init__(self, first: nn.Module, full: nn.Module, threshold: float) -> None:
+        super().__init__()
+        self.first = first
+        self.full = full
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        logits = self.first(x).float()
+        uncertain = torch.softmax(logits, dim=-1).amax(dim=-1) < self.threshold
+        escalated = int(uncertain.sum())
+        if escalated:
+            logits[uncertain] = self.full(x[uncertain]).float()
+        with self._lock:
+            self.images += x.size(0)
+            self.escalated += escalated
+        return logits
+
+    def status(self) -> dict:
+        with self._lock:
+            images, escalated = self.images, self.escalated
+        return {
+            "threshold": self.threshold,
+            "images": images,
+            "escalated": escalated,
+            "escalation_rate": escalated / images if images else None,
+        }
+
+
+def load_cascade_threshold(name: str, ckpt_path: str) -> Optional[float]:
+    """The calibrated threshold when the cascade is enabled and both stage artifacts are fresh."""
+    if get_option(name, "cascade", "auto") == "off":
+        return None
+    config_path = cascade_config_path(ckpt_path)
+    first_path = first_stage_path(name)
+    if not (os.path.exists(config_path) and os.path.exists(first_path)):
+        return None
+    if os.path.getmtime(config_path) < max(os.path.getmtime(ckpt_path), os.path.getmtime(first_path)):
+        print(f"Warning: {config_path} is older than its checkpoints, serving {name} without cascade. Re-run tools/calibrate_cascade.py.")
+        return None
+    with open(config_path) as f:
+        threshold = json.load(f).get("threshold")
+    return float(threshold) if threshold is not None else None
@@ -0,0 +1,76 @@
+"""Checkpoint reading with memory-mapped weights.
+
+``tools/convert_checkpoints.py`` writes each ``<stem>.pt`` as ``<stem>.safetensors``
+(weights) plus ``<stem>.json`` (everything else). The weights file is mapped
+copy-on-write and wrapped with ``torch.frombuffer``, so tensors point straight into
+the page cache: nothing is unpickled or copied, and forked workers share the pages.
+Without a converted store, ``.pt`` files are loaded with ``torch.load(mmap=True)``.
+"""
+
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Tuple
+
+import torch
+
+from inference.config import get_option, model_name
+
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def store_paths(ckpt_path: str) -> Tuple[str, str]:
+    stem = os.path.splitext(ckpt_path)[0]
+    return stem + ".safetensors", stem + ".json"
+
+
+def load_safetensors_mmap(path: str) -> Dict[str, torch.Tensor]:
+    """Zero-copy safetensors reader: every tensor is a view over one private file mapping."""
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    base = 8 + header_len
+    tensors = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        if count:
+            tensor = torch.frombuffer(buf, dtype=dtype, count=count, offset=base + start)
+        else:
+            tensor = torch.empty(0, dtype=dtype)
+        tensors[key] = tensor.reshape(info["shape"])
+    return tensors
+
+
+def load_checkpoint_data(ckpt_path: str) -> Dict[str, Any]:
+    """Same dict ``torch.load(ckpt_path)`` returns, with memory-mapped weights."""
+    weights_path, meta_path = store_paths(ckpt_path)
+    use_store = get_option(model_name(ckpt_path), "safetensors", "auto") != "off"
+    if use_store and os.path.exists(weights_path) and os.path.exists(meta_path) \
+            and os.path.getmtime(weights_path) >= os.path.getmtime(ckpt_path):
+        with open(meta_path) as f:
+            data = json.load(f)
+        data["model_state_dict"] = load_safetensors_mmap(weights_path)
+        return data
+    try:
+        return torch.load(ckpt_path, map_location="cpu", mmap=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        return torch.load(ckpt_path, map_location="cpu")
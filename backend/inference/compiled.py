@@ -0,0 +1,161 @@
+"""Opt-in torch.compile serving mode.
+
+The eager model keeps serving while a background worker compiles one graph per
+batch-size bucket, one model at a time; requests switch to the compiled graphs once
+all buckets are warm.
+Inductor's FX graph cache and torch.compiler cache artifacts are kept on disk so a
+restart reuses earlier compilations instead of paying for them again.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+import torch
+import torch.nn as nn
+
+from inference.config import MODELS_DIR, get_option
+
+
+COMPILE_CACHE_DIR = os.getenv("INFERENCE_COMPILE_CACHE_DIR", os.path.join(MODELS_DIR, ".compile_cache"))
+
+
+def _enable_persistent_cache() -> None:
+    os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(COMPILE_CACHE_DIR, "inductor"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    import torch._inductor.config as inductor_config
+    inductor_config.fx_graph_cache = True
+
+
+# torch.compiler's cache artifacts cover every graph compiled in the process, so there is
+# one file for all of them rather than one per model (the cascade's first stage and the
+# full model share a name).
+ARTIFACTS_PATH = os.path.join(COMPILE_CACHE_DIR, "compiled.artifacts")
+
+
+def _load_cache_artifacts() -> None:
+    if not os.path.exists(ARTIFACTS_PATH) or not hasattr(torch.compiler, "load_cache_artifacts"):
+        return
+    with open(ARTIFACTS_PATH, "rb") as f:
+        torch.compiler.load_cache_artifacts(f.read())
+
+
+def _save_cache_artifacts() -> None:
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return
+    saved = torch.compiler.save_cache_artifacts()
+    if saved is None:
+        return
+    tmp_path = ARTIFACTS_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(saved[0])
+    os.replace(tmp_path, ARTIFACTS_PATH)
+
+
+# Compiles run one at a time on a single worker: concurrent torch.compile calls would
+# each occupy every core at startup and contend for the shared cache artifacts.
+_compile_queue: "queue.Queue[CompiledSwitch]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _compile_worker() -> None:
+    try:
+        _enable_persistent_cache()
+        _load_cache_artifacts()
+    except Exception as e:
+        print(f"Warning: could not load torch.compile cache artifacts: {e}")
+    while True:
+        switch = _compile_queue.get()
+        try:
+            switch._compile()
+        finally:
+            _compile_queue.task_done()
+
+
+def _submit(switch: "CompiledSwitch") -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_compile_worker, name="compile-worker", daemon=True)
+            _worker.start()
+    _compile_queue.put(switch)
+
+
+class CompiledSwitch(nn.Module):
+    """Serves eager until the compiled graphs are ready, then pads batches up to the nearest bucket."""
+
+    def __init__(
+        self, model: nn.Module, name: str, buckets: List[int], image_size: int,
+        mode: Optional[str] = None, input_dtype: torch.dtype = torch.float32,
+    ) -> None:
+        super().__init__()
+        self.model = model
+        self.name = name
+        self.buckets = sorted(set(buckets))
+        self.image_size = image_size
+        self.mode = mode
+        self.input_dtype = input_dtype
+        self.compiled = None
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self.compile_seconds: Optional[float] = None
+
+    def start(self) -> "CompiledSwitch":
+        _submit(self)
+        return self
+
+    def _compile(self) -> None:
+        start = time.perf_counter()
+        try:
+            compiled = torch.compile(self.model, dynamic=False, mode=self.mode)
+            with torch.inference_mode():
+                for bs in self.buckets:
+                    compiled(torch.zeros(bs, 3, self.image_size, self.image_size, dtype=self.input_dtype))
+            _save_cache_artifacts()
+            self.compiled = compiled
+            self.compile_seconds = time.perf_counter() - start
+            self.ready.set()
+            print(f"Compiled {self.name} for batch buckets {self.buckets} in {self.compile_seconds:.1f}s")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Warning: torch.compile failed for {self.name}, staying eager: {e}")
+
+    def _bucket(self, batch_size: int) -> int:
+        for bs in self.buckets:
+            if bs >= batch_size:
+                return bs
+        return self.buckets[-1]
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if not self.ready.is_set() or x.device.type != "cpu" or x.shape[-1] != self.image_size:
+            return self.model(x)
+        outputs = []
+        step = self.buckets[-1]
+        for chunk in x.split(step):
+            n = chunk.size(0)
+            bucket = self._bucket(n)
+            if bucket > n:
+                chunk = torch.cat([chunk, chunk.new_zeros((bucket - n,) + tuple(chunk.shape[1:]))])
+            outputs.append(self.compiled(chunk)[:n])
+        return torch.cat(outputs) if len(outputs) > 1 else outputs[0]
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready.is_set(),
+            "buckets": self.buckets,
+            "compile_seconds": self.compile_seconds,
+            "error": self.error,
+        }
+
+
+def apply_compile(model: nn.Module, name: str, image_size: int, input_dtype: torch.dtype = torch.float32) -> nn.Module:
+    """Wrap a model in CompiledSwitch when ``compile`` is on for it; compilation starts in the background."""
+    if get_option(name, "compile", "off") != "on":
+        return model
+    buckets = [int(b) for b in get_option(name, "compile_buckets", "1,4,8").split(",") if b.strip()]
+    mode = get_option(name, "compile_mode")
+    return CompiledSwitch(model, name, buckets, image_size, mode=mode, input_dtype=input_dtype).start()
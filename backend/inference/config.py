@@ -0,0 +1,63 @@
+"""Per-model inference settings.
+
+Every setting is looked up for a model name (the checkpoint file stem, e.g.
+``damage_binary``) in this order: programmatic overrides, then the
+``INFERENCE_<KEY>_<MODEL>`` environment variable, then ``INFERENCE_<KEY>``.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+
+# Checkpoint stem -> inference module serving it
+MODEL_MODULES: Dict[str, str] = {
+    "damage_binary": "inference.inference_damage",
+    "damage_parts": "inference.inference_damage_parts",
+    "dirty_binary": "inference.inference_dirty",
+    "damaged_windows": "inference.inference_damaged_windows",
+    "unified_windows": "inference.inference_unified_windows",
+    "scratch_dent": "inference.inference_scratch_dent",
+    "tire_classification": "inference.inference_tire_classification",
+}
+
+_overrides: Dict[str, str] = {}
+
+
+def model_name(ckpt_path: str) -> str:
+    """Model name used for settings lookups: the checkpoint file stem."""
+    return os.path.splitext(os.path.basename(ckpt_path))[0]
+
+
+def checkpoint_path(name: str) -> str:
+    return os.path.join(MODELS_DIR, f"{name}.pt")
+
+
+def get_option(name: Optional[str], key: str, default: Optional[str] = None) -> Optional[str]:
+    """Resolve setting ``key`` for model ``name`` (None for settings that are not per model)."""
+    for scope in ((f"{key}:{name}", key) if name else (key,)):
+        if scope in _overrides:
+            return _overrides[scope]
+    env_key = f"INFERENCE_{key.upper()}"
+    value = os.getenv(f"{env_key}_{name.upper()}", os.getenv(env_key)) if name else os.getenv(env_key)
+    if value is None or value == "":
+        return default
+    return value
+
+
+@contextmanager
+def override(name: Optional[str] = None, **options: str) -> Iterator[None]:
+    """Temporarily force settings, for one model or (name=None) for all of them."""
+    keys = {(f"{key}:{name}" if name else key): str(value) for key, value in options.items()}
+    previous = {key: _overrides.get(key) for key in keys}
+    _overrides.update(keys)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                _overrides.pop(key, None)
+            else:
+                _overrides[key] = value
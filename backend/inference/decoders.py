@@ -0,0 +1,168 @@
+"""Image decoder backends.
+
+The ``decoder`` setting picks the JPEG decoder for encoded uploads:
+
+- ``pil`` (default): Pillow, with DCT-domain downscaling via ``draft``.
+- ``torchvision``: ``torchvision.io.decode_jpeg`` (libjpeg-turbo), decoding a whole
+  batch in one call. It has no DCT scaling, so the model's Resize does all the work.
+- ``simplejpeg`` / ``turbojpeg``: libjpeg-turbo bindings with DCT scaling, used when
+  the package is installed.
+
+Non-JPEG data, PIL images and anything a backend fails on go through Pillow. Backends
+other than ``pil`` return a uint8 [3, H, W] tensor instead of a PIL image.
+"""
+
+import io
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.io import ImageReadMode, decode_jpeg
+
+from inference.config import get_option
+
+try:
+    import simplejpeg
+except ImportError:  # optional decoder backend
+    simplejpeg = None
+
+try:
+    from turbojpeg import TJPF_RGB, TurboJPEG
+except ImportError:  # optional decoder backend (PyTurboJPEG)
+    TurboJPEG = None
+
+
+Decoded = Union[Image.Image, torch.Tensor]
+# Encoded bytes, or an image some earlier step already decoded
+ImageInput = Union[bytes, Decoded]
+
+_JPEG_MAGIC = b"\xff\xd8\xff"
+_turbo = None
+_warned = set()
+
+
+def is_jpeg(data: bytes) -> bool:
+    return data[:3] == _JPEG_MAGIC
+
+
+def decode_pil(image: ImageInput, min_size: Optional[int] = None) -> Image.Image:
+    """Decode to RGB.
+
+    With ``min_size``, large uploads are decoded at reduced resolution while both sides
+    stay >= min_size: JPEGs via DCT-domain scaling (``draft``, down to 1/8), then any
+    remaining integer factor with a box ``reduce``. The model's own Resize does the rest,
+    so a 3000x4000 phone photo never gets materialised at full size.
+    """
+    img = image if isinstance(image, Image.Image) else Image.open(io.BytesIO(image))
+    if min_size:
+        if img.format == "JPEG" and getattr(img, "tile", None):
+            img.draft("RGB", (min_size, min_size))
+        factor = min(img.size[0] // min_size, img.size[1] // min_size)
+        if factor >= 2:
+            img = img.reduce(factor)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.load()
+    return img
+
+
+def _hwc_to_tensor(array: np.ndarray) -> torch.Tensor:
+    return torch.from_numpy(array).permute(2, 0, 1)
+
+
+def decode_simplejpeg(data: bytes, min_size: Optional[int] = None) -> torch.Tensor:
+    if min_size:
+        array = simplejpeg.decode_jpeg(data, colorspace="RGB", min_height=min_size, min_width=min_size)
+    else:
+        array = simplejpeg.decode_jpeg(data, colorspace="RGB")
+    return _hwc_to_tensor(array)
+
+
+def decode_turbojpeg(data: bytes, min_size: Optional[int] = None) -> torch.Tensor:
+    global _turbo
+    if _turbo is None:
+        _turbo = TurboJPEG()
+    scaling = None
+    if min_size:
+        width, height, _, _ = _turbo.decode_header(data)
+        # Smallest libjpeg-turbo scaling factor that keeps both sides >= min_size
+        fits = [
+            (num, den) for num, den in _turbo.scaling_factors
+            if (width * num + den - 1) // den >= min_size and (height * num + den - 1) // den >= min_size
+        ]
+        if fits:
+            scaling = min(fits, key=lambda f: f[0] / f[1])
+    return _hwc_to_tensor(_turbo.decode(data, pixel_format=TJPF_RGB, scaling_factor=scaling))
+
+
+def decode_torchvision(data: bytes, min_size: Optional[int] = None) -> torch.Tensor:
+    return decode_jpeg(torch.frombuffer(bytearray(data), dtype=torch.uint8), mode=ImageReadMode.RGB)
+
+
+DECODERS: Dict[str, Callable[[bytes, Optional[int]], Decoded]] = {
+    "pil": decode_pil,
+    "torchvision": decode_torchvision,
+    "simplejpeg": decode_simplejpeg,
+    "turbojpeg": decode_turbojpeg,
+}
+
+
+def available_decoders() -> List[str]:
+    return [
+        name for name in DECODERS
+        if not (name == "simplejpeg" and simplejpeg is None) and not (name == "turbojpeg" and TurboJPEG is None)
+    ]
+
+
+def decoder_backend() -> str:
+    """The configured ``decoder``, or ``pil`` (with a warning) when it is not installed."""
+    name = get_option(None, "decoder", "pil")
+    if name not in DECODERS:
+        raise ValueError(f"Unsupported decoder: {name}. Known: {list(DECODERS)}")
+    if name not in available_decoders():
+        if name not in _warned:
+            print(f"Warning: decoder {name} is not installed, decoding with pil")
+            _warned.add(name)
+        return "pil"
+    return name
+
+
+def decode(image: ImageInput, min_size: Optional[int] = None, backend: Optional[str] = None) -> Decoded:
+    """Decode one upload with ``backend`` (default: the configured decoder)."""
+    if isinstance(image, torch.Tensor):
+        return image
+    backend = backend or decoder_backend()
+    if backend == "pil" or isinstance(image, Image.Image) or not is_jpeg(image):
+        return decode_pil(image, min_size)
+    try:
+        return DECODERS[backend](image, min_size)
+    except Exception:
+        # Formats the backend does not handle (e.g. CMYK or arithmetic-coded JPEGs)
+        return decode_pil(image, min_size)
+
+
+def decode_many(
+    images: Sequence[ImageInput], min_size: Optional[int] = None, backend: Optional[str] = None
+) -> List[Union[Decoded, Exception]]:
+    """Decode a batch; a failed image gets its exception in place of a result."""
+    backend = backend or decoder_backend()
+    results: List[Union[Decoded, Exception, None]] = [None] * len(images)
+    if backend == "torchvision":
+        jpegs = [i for i, image in enumerate(images) if isinstance(image, bytes) and is_jpeg(image)]
+        if jpegs:
+            try:
+                # One call decodes the whole batch (in parallel on CUDA builds)
+                data = [torch.frombuffer(bytearray(images[i]), dtype=torch.uint8) for i in jpegs]
+                for i, tensor in zip(jpegs, decode_jpeg(data, mode=ImageReadMode.RGB)):
+                    results[i] = tensor
+            except Exception:
+                pass  # decode individually below, falling back to pil per image
+    for i, image in enumerate(images):
+        if results[i] is not None:
+            continue
+        try:
+            results[i] = decode(image, min_size, backend)
+        except Exception as e:
+            results[i] = e
+    return results
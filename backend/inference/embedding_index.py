@@ -0,0 +1,380 @@
+"""Near-duplicate photo lookup on pooled backbone embeddings.
+
+Every analyzed photo's embedding (the input of the damage model's final Linear, i.e.
+the pooled EfficientNet/ResNet/MobileNet features) goes into an in-process
+``EmbeddingIndex``: an L2-normalized float16 matrix that grows by doubling, so appends
+are amortized O(1), and searches are chunked matrix-vector products, so a query over
+a million rows is a hundred-odd BLAS calls rather than a Python loop. Removed or expired rows
+are only masked out and the matrix is compacted once they pass ``compact_ratio``.
+
+Pooled features are non-negative, so raw cosine similarity is high even between photos
+of different cars. Near-duplicate matching therefore needs a calibration written by
+``python -m tools.calibrate_photo_index`` for the current damage checkpoint
+(``<MODELS_DIR>/photo_index.json``): embeddings are centered on its mean embedding, and
+its threshold is the one whose measured false-match rate on held-out photo pairs is
+acceptable (``duplicate_threshold`` overrides it). Without a valid calibration only
+byte-identical uploads are reused.
+
+A match must also have been analyzed with the same options (TTA, decoding, checkpoint
+versions); otherwise the photo is recomputed and stored as an entry of its own.
+``photo_index=off`` disables the lookup. The index is sized from ``photo_index_mb``
+(default 256 MB of embedding storage, headroom for a doubling included);
+``photo_index_max`` caps the entry count further. Oldest photos are dropped first.
+"""
+
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from inference.config import MODELS_DIR, checkpoint_path, get_option
+
+
+class EmbeddingIndex:
+    """Cosine-similarity index over float16 vectors with integer ids and an arbitrary payload per id."""
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024, compact_ratio: float = 0.25, chunk_rows: int = 8192) -> None:
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._matrix: Optional[np.ndarray] = None  # [capacity, dim] float16, rows [0, _size) in use
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        self._live = 0
+        self._row_of: Dict[int, int] = {}
+        self._payloads: Dict[int, Any] = {}
+        self._next_id = 0
+        self.searches = 0
+        self.hits = 0
+        self.compactions = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if self._matrix is not None and capacity != self._matrix.shape[0]:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float16)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+            self._ids = np.resize(self._ids, capacity)
+            valid = np.zeros(capacity, dtype=bool)
+            valid[:self._size] = self._valid[:self._size]
+            self._valid = valid
+        self._capacity = capacity
+
+    def add(self, vector: np.ndarray, payload: Any = None) -> int:
+        vector = self._normalize(vector)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector.shape[0]
+            if vector.shape[0] != self.dim:
+                raise ValueError(f"Expected a {self.dim}-d embedding, got {vector.shape[0]}")
+            if self._matrix is None:
+                self._matrix = np.zeros((self._capacity, self.dim), dtype=np.float16)
+            if self._size == self._capacity:
+                # Reclaim masked rows before paying for a bigger matrix
+                if self._size - self._live > self.compact_ratio * self._size:
+                    self._compact()
+                else:
+                    self._grow(self._size + 1)
+            row = self._size
+            entry_id = self._next_id
+            self._next_id += 1
+            self._matrix[row] = vector
+            self._ids[row] = entry_id
+            self._valid[row] = True
+            self._row_of[entry_id] = row
+            self._payloads[entry_id] = payload
+            self._size += 1
+            self._live += 1
+            return entry_id
+
+    def remove(self, entry_id: int) -> bool:
+        with self._lock:
+            row = self._row_of.pop(entry_id, None)
+            if row is None:
+                return False
+            self._valid[row] = False
+            self._payloads.pop(entry_id, None)
+            self._live -= 1
+            if self._size and (self._size - self._live) > self.compact_ratio * self._size:
+                self._compact()
+            return True
+
+    def remove_oldest(self, count: int) -> int:
+        """Drop the ``count`` oldest entries (ids are increasing, so the lowest live ids)."""
+        with self._lock:
+            # Rows stay in insertion order through compaction, so the oldest are the first live rows
+            oldest = self._ids[np.flatnonzero(self._valid[:self._size])[:count]].tolist()
+        return sum(self.remove(entry_id) for entry_id in oldest)
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self._valid[:self._size])
+        n = keep.size
+        self._matrix[:n] = self._matrix[keep]
+        self._ids[:n] = self._ids[keep]
+        self._valid[:n] = True
+        self._valid[n:] = False
+        self._size = n
+        self._row_of = {int(entry_id): row for row, entry_id in enumerate(self._ids[:n])}
+        self.compactions += 1
+
+    def payload(self, entry_id: int) -> Any:
+        with self._lock:
+            return self._payloads.get(entry_id)
+
+    def compact(self) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._compact()
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[int, float, Any]]:
+        """Top-``k`` (id, cosine, payload), best first."""
+        query = self._normalize(vector)
+        with self._lock:
+            self.searches += 1
+            if self._matrix is None or not self._live or query.shape[0] != self.dim:
+                return []
+            best_scores = np.empty(0, dtype=np.float32)
+            best_rows = np.empty(0, dtype=np.int64)
+            for start in range(0, self._size, self.chunk_rows):
+                stop = min(start + self.chunk_rows, self._size)
+                # float16 storage halves memory; the product runs in float32 so it goes through BLAS
+                scores = self._matrix[start:stop].astype(np.float32) @ query
+                scores[~self._valid[start:stop]] = -np.inf
+                top = min(k, scores.size)
+                rows = np.argpartition(-scores, top - 1)[:top]
+                best_scores = np.concatenate([best_scores, scores[rows]])
+                best_rows = np.concatenate([best_rows, rows + start])
+            order = np.argsort(-best_scores)[:k]
+            results = []
+            for i in order:
+                if not np.isfinite(best_scores[i]):
+                    continue
+                entry_id = int(self._ids[best_rows[i]])
+                results.append((entry_id, float(best_scores[i]), self._payloads.get(entry_id)))
+            return results
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "entries": self._live,
+                "rows": self._size,
+                "capacity": self._capacity,
+                "dim": self.dim,
+                "memory_mb": round(self._matrix.nbytes / 2 ** 20, 2) if self._matrix is not None else 0.0,
+                "searches": self.searches,
+                "hits": self.hits,
+                "compactions": self.compactions,
+            }
+
+
+def last_linear(model: nn.Module) -> Optional[nn.Module]:
+    """The classifier's final Linear (dynamic-quantized Linears included); its input is the pooled embedding."""
+    found = None
+    for module in model.modules():
+        if isinstance(module, nn.Linear) or (hasattr(module, "in_features") and hasattr(module, "out_features")):
+            found = module
+    return found
+
+
+class EmbeddingTap:
+    """Forward pre-hook that captures the embedding on the threads that asked for it.
+
+    The hook stays registered; ``capture()`` only arms it for the calling thread, so
+    concurrent requests on the same model do not see each other's features.
+    """
+
+    def __init__(self, model: nn.Module) -> None:
+        # A cascade always runs its first stage, so that is where the embedding is taken
+        target = model.first if hasattr(model, "first") else getattr(model, "model", model)
+        self.layer = last_linear(target)
+        self._local = threading.local()
+        if self.layer is not None:
+            self.layer.register_forward_pre_hook(self._hook)
+
+    def _hook(self, module: nn.Module, inputs: Tuple[torch.Tensor, ...]) -> None:
+        # Only the first pass: with TTA that is the plain single view
+        if getattr(self._local, "armed", False) and self._local.features is None:
+            self._local.features = inputs[0].detach().float().flatten(1).cpu()
+
+    @contextmanager
+    def capture(self) -> Iterator["EmbeddingTap"]:
+        self._local.armed = True
+        self._local.features = None
+        try:
+            yield self
+        finally:
+            self._local.armed = False
+
+    @property
+    def features(self) -> Optional[torch.Tensor]:
+        """[N, D] embeddings from the last captured forward pass, or None (e.g. ONNX or compiled graphs)."""
+        return getattr(self._local, "features", None)
+
+
+_taps: "weakref.WeakKeyDictionary[nn.Module, EmbeddingTap]" = weakref.WeakKeyDictionary()
+_taps_lock = threading.Lock()
+
+
+def embedding_tap(model: nn.Module) -> EmbeddingTap:
+    with _taps_lock:
+        tap = _taps.get(model)
+        if tap is None:
+            tap = _taps[model] = EmbeddingTap(model)
+        return tap
+
+
+def photo_index_enabled() -> bool:
+    return get_option(None, "photo_index", "on") != "off"
+
+
+def calibration_path() -> str:
+    return os.path.join(MODELS_DIR, "photo_index.json")
+
+
+def load_calibration(path: Optional[str] = None, model: str = "damage_binary") -> Optional[Dict[str, Any]]:
+    """The calibration at ``path`` when it was made for the current ``model`` checkpoint, else None."""
+    path = path or calibration_path()
+    try:
+        with open(path) as f:
+            calibration = json.load(f)
+        current = int(os.path.getmtime(checkpoint_path(model)))
+    except (OSError, ValueError):
+        return None
+    if calibration.get("model") != model or calibration.get("checkpoint_mtime") != current:
+        print(f"Warning: {path} was calibrated for another {model} checkpoint; only exact photo matches are reused")
+        return None
+    calibration["center"] = np.asarray(calibration["center"], dtype=np.float32)
+    return calibration
+
+
+class PhotoIndex:
+    """The service-wide index of analyzed photos: embedding -> cached analysis."""
+
+    # Near-duplicates considered per lookup: a photo has one entry per set of options it was analyzed with
+    candidates = 8
+
+    def __init__(self, calibration: Optional[Dict[str, Any]] = None) -> None:
+        self.index = EmbeddingIndex()
+        self.option_mismatches = 0
+        # A calibration passed in is used as is; otherwise the one on disk is followed
+        self._fixed = calibration is not None
+        self._calibration = calibration
+        self._calibration_key: Any = None
+
+    @property
+    def calibration(self) -> Optional[Dict[str, Any]]:
+        """Reloaded whenever the calibration file or the damage checkpoint changes."""
+        if self._fixed:
+            return self._calibration
+        try:
+            key = (os.path.getmtime(calibration_path()), os.path.getmtime(checkpoint_path("damage_binary")))
+        except OSError:
+            key = None
+        if key != self._calibration_key:
+            calibration = load_calibration() if key is not None else None
+            if self._calibration is not None or calibration is not None:
+                # Stored vectors were centered on the old mean (or not at all)
+                self.index = EmbeddingIndex()
+            self._calibration, self._calibration_key = calibration, key
+        return self._calibration
+
+    def _vector(self, embedding: torch.Tensor) -> np.ndarray:
+        vector = embedding.numpy().astype(np.float32).reshape(-1)
+        calibration = self.calibration
+        if calibration is not None and calibration["center"].shape == vector.shape:
+            vector = vector - calibration["center"]
+        return vector
+
+    def max_entries(self) -> int:
+        budget = float(get_option(None, "photo_index_mb", "256")) * 2 ** 20
+        # float16 rows, with room for the copy made while the matrix doubles
+        limit = int(budget // (2 * 2 * (self.index.dim or 1280)))
+        explicit = get_option(None, "photo_index_max")
+        return max(1, min(limit, int(explicit)) if explicit else limit)
+
+    def lookup(
+        self, embedding: Optional[torch.Tensor], image_hash: Optional[str] = None, options: Optional[Dict] = None,
+    ) -> Optional[Tuple[int, Dict, Dict]]:
+        """(photo_id, stored payload, reuse info) when ``embedding`` is a near-duplicate of an earlier photo analyzed with ``options``."""
+        if embedding is None or not photo_index_enabled():
+            return None
+        calibration = self.calibration
+        threshold = float(get_option(None, "duplicate_threshold", str(calibration["threshold"]) if calibration else "0.0"))
+        match = None
+        for entry_id, score, payload in self.index.search(self._vector(embedding), k=self.candidates):
+            if score < threshold:
+                break
+            if payload is None:
+                continue
+            if calibration is None and (image_hash is None or payload["image_hash"] != image_hash):
+                # Uncalibrated, cosine says little: only byte-identical uploads count as the same photo
+                continue
+            if payload.get("options") == options:
+                match = entry_id, score, payload
+                break
+            self.option_mismatches += 1
+        if match is None:
+            return None
+        entry_id, score, payload = match
+        self.index.hits += 1
+        reuse = {
+            "photo_id": entry_id,
+            "similarity": round(score, 4),
+            "exact_match": image_hash is not None and image_hash == payload["image_hash"],
+            "first_seen": payload["indexed_at"],
+        }
+        return entry_id, payload, reuse
+
+    def add(self, embedding: Optional[torch.Tensor], result: Dict, image_hash: Optional[str] = None, options: Optional[Dict] = None) -> Optional[int]:
+        if embedding is None or not photo_index_enabled():
+            return None
+        max_entries = self.max_entries()
+        if len(self.index) >= max_entries:
+            self.index.remove_oldest(len(self.index) - max_entries + 1)
+        return self.index.add(self._vector(embedding), {"result": result, "image_hash": image_hash, "options": options, "indexed_at": time.time()})
+
+    def attach(self, photo_id: Optional[int], key: str, value: Any) -> None:
+        """Store a further result for an indexed photo (e.g. its LLM report) to serve on reuse."""
+        payload = self.index.payload(photo_id) if photo_id is not None else None
+        if payload is not None:
+            payload[key] = value
+
+    def cached(self, photo_id: Optional[int], key: str) -> Any:
+        payload = self.index.payload(photo_id) if photo_id is not None else None
+        return payload.get(key) if payload is not None else None
+
+    def status(self) -> dict:
+        calibration = self.calibration
+        return {
+            "enabled": photo_index_enabled(),
+            "calibrated": calibration is not None,
+            "threshold": calibration["threshold"] if calibration else None,
+            "false_match_rate": calibration.get("false_match_rate") if calibration else None,
+            "max_entries": self.max_entries(),
+            "option_mismatches": self.option_mismatches,
+            **self.index.status(),
+        }
+
+
+photo_index = PhotoIndex()
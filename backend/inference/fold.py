@@ -0,0 +1,105 @@
+"""Fold the input Normalize into the model's first convolution.
+
+For normalized input y = (x - m) / s and a first conv (W, b):
+
+    conv(y) = conv_{W/s}(x) + b - conv_{W/s}(m)
+
+where m is the constant mean image. With zero padding the last term is not constant
+near the borders (padded taps see 0 in y, i.e. x = m, not x = 0), so it is kept as a
+bias map, precomputed by convolving the zero-padded mean image at the serving size.
+That makes the folded model exact, not just exact in the interior.
+
+``fold_normalization``: ``off`` (default), ``unit`` (model takes ToTensor's [0, 1]
+input) or ``uint8`` (model takes raw [0, 255] uint8 tensors from PILToTensor).
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+from torchvision import transforms
+
+from inference.config import get_option
+
+
+class FoldedConv(nn.Module):
+    """First conv with the input normalization folded into its weights and a border-exact bias map."""
+
+    def __init__(self, conv: nn.Conv2d, mean: Sequence[float], std: Sequence[float], scale: float, image_size: int) -> None:
+        super().__init__()
+        std_t = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1) * scale
+        self.conv = nn.Conv2d(
+            conv.in_channels, conv.out_channels, conv.kernel_size, stride=conv.stride, padding=conv.padding,
+            dilation=conv.dilation, groups=conv.groups, bias=False, padding_mode=conv.padding_mode,
+        )
+        self.conv.weight = nn.Parameter(conv.weight.detach().float() / std_t, requires_grad=False)
+        self.register_buffer("mean", torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1) * scale)
+        self.register_buffer("bias", conv.bias.detach().float() if conv.bias is not None else None)
+        self.image_size = (image_size, image_size)
+        with torch.no_grad():
+            self.register_buffer("bias_map", self.compute_bias_map(self.image_size))
+
+    def compute_bias_map(self, size: Tuple[int, int]) -> torch.Tensor:
+        """b - conv_{W/s}(pad0(m)) for an input of ``size``: [1, C_out, H_out, W_out]."""
+        mean_image = self.mean.expand(1, -1, *size)
+        bias_map = -self.conv(mean_image)
+        if self.bias is not None:
+            bias_map = bias_map + self.bias.view(1, -1, 1, 1)
+        return bias_map
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if not x.is_floating_point():
+            x = x.to(self.conv.weight.dtype)
+        bias_map = self.bias_map
+        if tuple(x.shape[-2:]) != self.image_size:
+            bias_map = self.compute_bias_map(tuple(x.shape[-2:]))
+        return self.conv(x) + bias_map
+
+
+def first_conv(model: nn.Module) -> Optional[Tuple[nn.Module, str, nn.Conv2d]]:
+    """(parent, attribute, conv) of the first RGB Conv2d in module order, or None."""
+    for qualname, module in model.named_modules():
+        if isinstance(module, nn.Conv2d):
+            if module.in_channels != 3:
+                return None
+            parent_name, _, attr = qualname.rpartition(".")
+            return model.get_submodule(parent_name), attr, module
+    return None
+
+
+def fold_normalization(model: nn.Module, tf: transforms.Compose, name: str, image_size: int) -> Tuple[nn.Module, transforms.Compose]:
+    """Apply the ``fold_normalization`` setting: returns the (possibly folded) model and its matching transform.
+
+    The fold is checked against the unfolded model on a random batch and dropped
+    (with a warning) if the outputs disagree, e.g. when the first conv is not the
+    first op applied to the input.
+    """
+    mode = get_option(name, "fold_normalization", "off")
+    if mode == "off":
+        return model, tf
+    if mode not in ("unit", "uint8"):
+        raise ValueError(f"Unsupported fold_normalization for {name}: {mode}")
+    normalize = next((t for t in tf.transforms if isinstance(t, transforms.Normalize)), None)
+    found = first_conv(model)
+    if normalize is None or found is None:
+        print(f"Warning: no Normalize transform or RGB first conv to fold for {name}, serving unfolded")
+        return model, tf
+    parent, attr, conv = found
+
+    scale = 255.0 if mode == "uint8" else 1.0
+    folded = FoldedConv(conv, normalize.mean, normalize.std, scale, image_size)
+
+    with torch.inference_mode():
+        x = torch.rand(2, 3, image_size, image_size, generator=torch.Generator().manual_seed(0))
+        reference = model(transforms.functional.normalize(x, normalize.mean, normalize.std))
+        setattr(parent, attr, folded)
+        candidate = model(x * scale)
+    if not torch.allclose(reference, candidate, rtol=1e-3, atol=1e-3):
+        setattr(parent, attr, conv)
+        print(f"Warning: folded {name} disagrees with the original (max diff {float((reference - candidate).abs().max()):.2e}), serving unfolded")
+        return model, tf
+
+    steps = [t for t in tf.transforms if not isinstance(t, transforms.Normalize)]
+    if mode == "uint8":
+        steps = [transforms.PILToTensor() if isinstance(t, transforms.ToTensor) else t for t in steps]
+    return model, transforms.Compose(steps)
@@ -1,35 +1,41 @@
-import io
 import json
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
-from PIL import Image
 from torchvision import transforms, models
 
+from inference.batching import BatchInput, run_batch
+from inference.checkpoint_io import load_checkpoint_data
+from inference.runtime import prepare_model
+
 
 def load_checkpoint(ckpt_path: str):
-    data = torch.load(ckpt_path, map_location="cpu")
+    data = load_checkpoint_data(ckpt_path)
     arch = data.get("arch", "efficientnet_b0")
     image_size = int(data.get("image_size", 224))
     class_to_idx = data["class_to_idx"]
     damage_index = int(data["damage_class_index"])
 
-    if arch == "resnet18":
-        weights = models.ResNet18_Weights.IMAGENET1K_V1
-        model = models.resnet18(weights=weights)
-        in_features = model.fc.in_features
-        model.fc = nn.Linear(in_features, len(class_to_idx))
-    elif arch == "efficientnet_b0":
-        weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1
-        model = models.efficientnet_b0(weights=weights)
-        in_features = model.classifier[-1].in_features
-        model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
-    else:
-        raise ValueError(f"Unsupported arch: {arch}")
+    # Build on the meta device (no init, no ImageNet download) and adopt the checkpoint tensors as-is
+    with torch.device("meta"):
+        if arch == "resnet18":
+            model = models.resnet18(weights=None)
+            in_features = model.fc.in_features
+            model.fc = nn.Linear(in_features, len(class_to_idx))
+        elif arch == "efficientnet_b0":
+            model = models.efficientnet_b0(weights=None)
+            in_features = model.classifier[-1].in_features
+            model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
+        elif arch == "mobilenet_v2":
+            model = models.mobilenet_v2(weights=None)
+            in_features = model.classifier[-1].in_features
+            model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
+        else:
+            raise ValueError(f"Unsupported arch: {arch}")
 
-    model.load_state_dict(data["model_state_dict"])
+    model.load_state_dict(data["model_state_dict"], assign=True)
     model.eval()
 
     mean = data.get("mean", [0.485, 0.456, 0.406])
@@ -41,25 +47,35 @@ def load_checkpoint(ckpt_path: str):
             transforms.Normalize(mean=mean, std=std),
         ]
     )
+    model, tf = prepare_model(model, ckpt_path, tf)
 
     return model, tf, class_to_idx, damage_index
 
 
-@torch.no_grad()
-def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, damage_index: int, device: Optional[str] = None) -> Dict:
-    if device is None:
-        device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    x = tf(img).unsqueeze(0).to(device)
-    model = model.to(device)
-    logits = model(x)[0]
-    probs = torch.softmax(logits, dim=-1).cpu().numpy()
-    pred_idx = int(probs.argmax())
-    damaged = bool(probs[damage_index] >= 0.5)
-    return {
-        "pred_idx": pred_idx,
-        "probs": probs.tolist(),
-        "damaged": damaged,
-        "damage_prob": float(probs[damage_index]),
-    }
+def postprocess_probs(probs: torch.Tensor, damage_index: int) -> List[Dict]:
+    """Per-image result dicts from a [N, C] probability batch."""
+    pred_idx = probs.argmax(dim=1).tolist()
+    damage_prob = probs[:, damage_index]
+    damaged = (damage_prob >= 0.5).tolist()
+    damage_prob = damage_prob.tolist()
+    rows = probs.tolist()
+    return [
+        {
+            "pred_idx": pred_idx[i],
+            "probs": rows[i],
+            "damaged": damaged[i],
+            "damage_prob": damage_prob[i],
+        }
+        for i in range(len(rows))
+    ]
+
 
+@torch.inference_mode()
+def predict_batch(model: nn.Module, tf: transforms.Compose, images: BatchInput, damage_index: int, device: Optional[str] = None) -> List[Dict]:
+    """Predict a list of images (bytes or PIL) or a preprocessed [N, 3, H, W] tensor in one forward pass."""
+    probs, _ = run_batch(model, tf, images, device)
+    return postprocess_probs(probs, damage_index)
+
+
+def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, damage_index: int, device: Optional[str] = None) -> Dict:
+    return predict_batch(model, tf, [image_bytes], damage_index, device)[0]
@@ -1,32 +1,38 @@
-import io
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
-from PIL import Image
 from torchvision import transforms, models
 
+from inference.batching import BatchInput, run_batch
+from inference.checkpoint_io import load_checkpoint_data
+from inference.runtime import prepare_model
+
 
 def load_checkpoint(ckpt_path: str):
-    data = torch.load(ckpt_path, map_location="cpu")
+    data = load_checkpoint_data(ckpt_path)
     arch = data.get("arch", "efficientnet_b0")
     image_size = int(data.get("image_size", 224))
     class_to_idx = data["class_to_idx"]
 
-    if arch == "resnet18":
-        weights = models.ResNet18_Weights.IMAGENET1K_V1
-        model = models.resnet18(weights=weights)
-        in_features = model.fc.in_features
-        model.fc = nn.Linear(in_features, len(class_to_idx))
-    elif arch == "efficientnet_b0":
-        weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1
-        model = models.efficientnet_b0(weights=weights)
-        in_features = model.classifier[-1].in_features
-        model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
-    else:
-        raise ValueError(f"Unsupported arch: {arch}")
-
-    model.load_state_dict(data["model_state_dict"])
+    # Build on the meta device (no init, no ImageNet download) and adopt the checkpoint tensors as-is
+    with torch.device("meta"):
+        if arch == "resnet18":
+            model = models.resnet18(weights=None)
+            in_features = model.fc.in_features
+            model.fc = nn.Linear(in_features, len(class_to_idx))
+        elif arch == "efficientnet_b0":
+            model = models.efficientnet_b0(weights=None)
+            in_features = model.classifier[-1].in_features
+            model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
+        elif arch == "mobilenet_v2":
+            model = models.mobilenet_v2(weights=None)
+            in_features = model.classifier[-1].in_features
+            model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
+        else:
+            raise ValueError(f"Unsupported arch: {arch}")
+
+    model.load_state_dict(data["model_state_dict"], assign=True)
     model.eval()
 
     mean = data.get("mean", [0.485, 0.456, 0.406])
@@ -38,24 +44,38 @@ def load_checkpoint(ckpt_path: str):
             transforms.Normalize(mean=mean, std=std),
         ]
     )
+    model, tf = prepare_model(model, ckpt_path, tf)
 
     idx_to_class = {v: k for k, v in class_to_idx.items()}
     return model, tf, idx_to_class
 
 
-@torch.no_grad()
-def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, device: Optional[str] = None) -> Dict:
-    if device is None:
-        device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    x = tf(img).unsqueeze(0).to(device)
-    model = model.to(device)
-    logits = model(x)[0]
-    probs = torch.softmax(logits, dim=-1).cpu().numpy()
-    pred_idx = int(probs.argmax())
-    return {
-        "pred_idx": pred_idx,
-        "pred_score": float(probs[pred_idx]),
-        "probs": probs.tolist(),
-    }
+def postprocess_probs(probs: torch.Tensor, idx_to_class: Optional[Dict[int, str]] = None) -> List[Dict]:
+    """Per-image result dicts from a [N, C] probability batch; adds pred_label when idx_to_class is given."""
+    pred_score, pred_idx = probs.max(dim=1)
+    pred_idx = pred_idx.tolist()
+    pred_score = pred_score.tolist()
+    rows = probs.tolist()
+    results = [
+        {
+            "pred_idx": pred_idx[i],
+            "pred_score": pred_score[i],
+            "probs": rows[i],
+        }
+        for i in range(len(rows))
+    ]
+    if idx_to_class is not None:
+        for result in results:
+            result["pred_label"] = idx_to_class.get(result["pred_idx"], str(result["pred_idx"]))
+    return results
+
 
+@torch.inference_mode()
+def predict_batch(model: nn.Module, tf: transforms.Compose, images: BatchInput, idx_to_class: Optional[Dict[int, str]] = None, device: Optional[str] = None) -> List[Dict]:
+    """Predict a list of images (bytes or PIL) or a preprocessed [N, 3, H, W] tensor in one forward pass."""
+    probs, _ = run_batch(model, tf, images, device)
+    return postprocess_probs(probs, idx_to_class)
+
+
+def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, device: Optional[str] = None) -> Dict:
+    return predict_batch(model, tf, [image_bytes], device=device)[0]
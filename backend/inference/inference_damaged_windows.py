@@ -1,20 +1,22 @@
-import io
 import json
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
-from PIL import Image
 from torchvision import transforms, models
 
+from inference.batching import BatchInput, LabelMap, as_label_map, run_batch
+from inference.checkpoint_io import load_checkpoint_data
+from inference.runtime import prepare_model
 
-def build_model(arch: str, num_classes: int) -> nn.Module:
+
+def build_model(arch: str, num_classes: int, pretrained: bool = True) -> nn.Module:
     """Build the same model architecture as in training"""
     arch = arch.lower()
     if arch == "resnet18":
         try:
-            model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
+            model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
         except:
             model = models.resnet18(weights=None)
         in_features = model.fc.in_features
@@ -22,7 +24,7 @@ def build_model(arch: str, num_classes: int) -> nn.Module:
         return model
     elif arch == "mobilenet":
         try:
-            model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.IMAGENET1K_V1)
+            model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.IMAGENET1K_V1 if pretrained else None)
         except:
             model = models.mobilenet_v2(weights=None)
         in_features = model.classifier[-1].in_features
@@ -48,15 +50,16 @@ def build_model(arch: str, num_classes: int) -> nn.Module:
 
 def load_checkpoint(ckpt_path: str):
     """Load the damaged windows model checkpoint."""
-    data = torch.load(ckpt_path, map_location="cpu")
+    data = load_checkpoint_data(ckpt_path)
     arch = data.get("arch", "resnet18")
     image_size = int(data.get("image_size", 224))
     class_to_idx = data["class_to_idx"]
     num_classes = data.get("num_classes", len(class_to_idx))
 
-    # Build model
-    model = build_model(arch, num_classes)
-    model.load_state_dict(data["model_state_dict"])
+    # Build on the meta device (no init, no ImageNet download) and adopt the checkpoint tensors as-is
+    with torch.device("meta"):
+        model = build_model(arch, num_classes, pretrained=False)
+    model.load_state_dict(data["model_state_dict"], assign=True)
     model.eval()
 
     # Create transforms
@@ -67,55 +70,66 @@ def load_checkpoint(ckpt_path: str):
         transforms.ToTensor(),
         transforms.Normalize(mean=mean, std=std),
     ])
+    model, tf = prepare_model(model, ckpt_path, tf)
 
-    return model, tf, class_to_idx
+    return model, tf, LabelMap(class_to_idx)
 
 
-@torch.no_grad()
-def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, class_to_idx: Dict[str, int], device: Optional[str] = None) -> Dict:
-    """Predict damaged window type from image bytes."""
-    if device is None:
-        device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-    
-    try:
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        x = tf(img).unsqueeze(0).to(device)
-        model = model.to(device)
-        
-        logits = model(x)[0]
-        probs = torch.softmax(logits, dim=-1).cpu().numpy()
-        pred_idx = int(probs.argmax())
-        
-        # Create reverse mapping from index to class name
-        idx_to_class = {v: k for k, v in class_to_idx.items()}
-        predicted_class = idx_to_class.get(pred_idx, f"class_{pred_idx}")
-        
-        # Get confidence score
-        confidence = float(probs[pred_idx])
-        
-        # Create class probabilities dictionary
-        class_probs = {class_name: float(probs[idx]) for class_name, idx in class_to_idx.items()}
-        
-        return {
+def _error_result(message: str) -> Dict:
+    return {
+        "error": f"Prediction failed: {message}",
+        "predicted_class": "unknown",
+        "confidence": 0.0,
+        "pred_idx": -1,
+        "probs": [],
+        "class_probs": {},
+        "damaged": False,
+        "window_type": "unknown"
+    }
+
+
+def postprocess_probs(probs: torch.Tensor, class_to_idx: Dict[str, int]) -> List[Dict]:
+    """Per-image result dicts from a [N, C] probability batch."""
+    labels = as_label_map(class_to_idx)
+    confidence, pred_idx = probs.max(dim=1)
+    pred_idx = pred_idx.tolist()
+    confidence = confidence.tolist()
+    rows = probs.tolist()
+    class_items = list(labels.items())
+
+    results = []
+    for i, row in enumerate(rows):
+        idx = pred_idx[i]
+        predicted_class = labels.name(idx)
+        results.append({
             "predicted_class": predicted_class,
-            "confidence": confidence,
-            "pred_idx": pred_idx,
-            "probs": probs.tolist(),
-            "class_probs": class_probs,
+            "confidence": confidence[i],
+            "pred_idx": idx,
+            "probs": row,
+            "class_probs": {class_name: row[class_idx] for class_name, class_idx in class_items},
             "damaged": True,  # All classes represent some type of damage
             "window_type": predicted_class.replace("damaged-", "").replace("-", " "),
-        }
+        })
+    return results
+
+
+@torch.inference_mode()
+def predict_batch(model: nn.Module, tf: transforms.Compose, images: BatchInput, class_to_idx: Dict[str, int], device: Optional[str] = None) -> List[Dict]:
+    """Predict damaged window type for a list of images (bytes or PIL) or a preprocessed [N, 3, H, W] tensor in one forward pass.
+
+    Images that fail to decode get an error result; the rest of the batch is still predicted.
+    """
+    try:
+        probs, errors = run_batch(model, tf, images, device, skip_errors=True)
     except Exception as e:
-        return {
-            "error": f"Prediction failed: {str(e)}",
-            "predicted_class": "unknown",
-            "confidence": 0.0,
-            "pred_idx": -1,
-            "probs": [],
-            "class_probs": {},
-            "damaged": False,
-            "window_type": "unknown"
-        }
+        return [_error_result(str(e)) for _ in range(len(images))]
+    predicted = iter(postprocess_probs(probs, class_to_idx) if len(probs) else [])
+    return [_error_result(error) if error else next(predicted) for error in errors]
+
+
+def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, class_to_idx: Dict[str, int], device: Optional[str] = None) -> Dict:
+    """Predict damaged window type from image bytes."""
+    return predict_batch(model, tf, [image_bytes], class_to_idx, device)[0]
 
 
 def predict_image_file(model_path: str, image_path: str, device: Optional[str] = None) -> Dict:
@@ -1,35 +1,62 @@
 import io
 import json
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
 from PIL import Image
 from torchvision import transforms, models
+from torchvision.transforms.functional import to_pil_image
+
+from inference.batching import BatchInput, run_batch
+from inference.checkpoint_io import load_checkpoint_data
+from inference.decoders import ImageInput
+from inference.runtime import prepare_model
+
+# The service has always fed this model the upload re-encoded as a JPEG at this quality
+JPEG_QUALITY = 90
+
+
+def reencode_jpeg(image: ImageInput) -> ImageInput:
+    """The image as JPEG bytes at JPEG_QUALITY; input that does not decode is returned unchanged, to fail later."""
+    try:
+        if isinstance(image, torch.Tensor):
+            img = to_pil_image(image)
+        else:
+            img = image if isinstance(image, Image.Image) else Image.open(io.BytesIO(image))
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=JPEG_QUALITY)
+    except Exception:
+        return image
+    return buf.getvalue()
 
 
 def load_checkpoint(ckpt_path: str):
-    data = torch.load(ckpt_path, map_location="cpu")
+    data = load_checkpoint_data(ckpt_path)
     arch = data.get("arch", "efficientnet_b0")
     image_size = int(data.get("image_size", 224))
     class_to_idx = data["class_to_idx"]
     positive_label = data.get("positive_label")
 
-    if arch == "resnet18":
-        weights = models.ResNet18_Weights.IMAGENET1K_V1
-        model = models.resnet18(weights=weights)
-        in_features = model.fc.in_features
-        model.fc = nn.Linear(in_features, len(class_to_idx))
-    elif arch == "efficientnet_b0":
-        weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1
-        model = models.efficientnet_b0(weights=weights)
-        in_features = model.classifier[-1].in_features
-        model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
-    else:
-        raise ValueError(f"Unsupported arch: {arch}")
+    # Build on the meta device (no init, no ImageNet download) and adopt the checkpoint tensors as-is
+    with torch.device("meta"):
+        if arch == "resnet18":
+            model = models.resnet18(weights=None)
+            in_features = model.fc.in_features
+            model.fc = nn.Linear(in_features, len(class_to_idx))
+        elif arch == "efficientnet_b0":
+            model = models.efficientnet_b0(weights=None)
+            in_features = model.classifier[-1].in_features
+            model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
+        elif arch == "mobilenet_v2":
+            model = models.mobilenet_v2(weights=None)
+            in_features = model.classifier[-1].in_features
+            model.classifier[-1] = nn.Linear(in_features, len(class_to_idx))
+        else:
+            raise ValueError(f"Unsupported arch: {arch}")
 
-    model.load_state_dict(data["model_state_dict"])
+    model.load_state_dict(data["model_state_dict"], assign=True)
     model.eval()
 
     mean = data.get("mean", [0.485, 0.456, 0.406])
@@ -41,31 +68,52 @@ def load_checkpoint(ckpt_path: str):
             transforms.Normalize(mean=mean, std=std),
         ]
     )
+    model, tf = prepare_model(model, ckpt_path, tf)
 
     idx_to_class = {v: k for k, v in class_to_idx.items()}
     positive_index = class_to_idx.get(positive_label) if positive_label in class_to_idx else None
     return model, tf, idx_to_class, positive_index
 
 
-@torch.no_grad()
-def predict_image_path(ckpt_path: str, image_path: str) -> Dict:
-    model, tf, idx_to_class, positive_index = load_checkpoint(ckpt_path)
-    img = Image.open(image_path).convert("RGB")
-    x = tf(img).unsqueeze(0)
-    device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-    model = model.to(device)
-    x = x.to(device)
-    logits = model(x)[0]
-    probs = torch.softmax(logits, dim=-1).cpu().numpy()
-    pred_idx = int(probs.argmax())
-    is_dirty = None
+def postprocess_probs(probs: torch.Tensor, idx_to_class: Dict[int, str], positive_index: Optional[int]) -> List[Dict]:
+    """Per-image result dicts from a [N, C] probability batch."""
+    pred_score, pred_idx = probs.max(dim=1)
+    pred_idx = pred_idx.tolist()
+    pred_score = pred_score.tolist()
     if positive_index is not None:
-        is_dirty = bool(probs[positive_index] >= 0.5)
-    return {
-        "pred_idx": pred_idx,
-        "pred_label": idx_to_class[pred_idx],
-        "pred_score": float(probs[pred_idx]),
-        "probs": probs.tolist(),
-        "is_dirty": is_dirty,
-    }
+        is_dirty = (probs[:, positive_index] >= 0.5).tolist()
+    else:
+        is_dirty = [None] * len(pred_idx)
+    rows = probs.tolist()
+    return [
+        {
+            "pred_idx": pred_idx[i],
+            "pred_label": idx_to_class[pred_idx[i]],
+            "pred_score": pred_score[i],
+            "probs": rows[i],
+            "is_dirty": is_dirty[i],
+        }
+        for i in range(len(rows))
+    ]
 
+
+@torch.inference_mode()
+def predict_batch(model: nn.Module, tf: transforms.Compose, images: BatchInput, idx_to_class: Dict[int, str], positive_index: Optional[int], device: Optional[str] = None) -> List[Dict]:
+    """Predict a list of images (bytes or PIL) or a preprocessed [N, 3, H, W] tensor in one forward pass.
+
+    Images are re-encoded with ``reencode_jpeg`` first; a tensor batch is used as is.
+    """
+    if not isinstance(images, torch.Tensor):
+        images = [reencode_jpeg(image) for image in images]
+    probs, _ = run_batch(model, tf, images, device)
+    return postprocess_probs(probs, idx_to_class, positive_index)
+
+
+def predict_image_bytes(model: nn.Module, tf: transforms.Compose, image_bytes: bytes, idx_to_class: Dict[int, str], positive_index: Optional[int], device: Optional[str] = None) -> Dict:
+    return predict_batch(model, tf, [image_bytes], idx_to_class, positive_index, device)[0]
+
+
+def predict_image_path(ckpt_path: str, image_path: str) -> Dict:
+    model, tf, idx_to_class, positive_index = load_checkpoint(ckpt_path)
+    img = Image.open(image_path)
+    return predict_batch(model, tf, [img], idx_to_class, positive_index)[0]
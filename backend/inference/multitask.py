@@ -0,0 +1,122 @@
+"""One shared backbone with a classification head per task.
+
+Trained either by distilling the seven task checkpoints (``trains/train_distill_multitask.py``)
+or jointly on the task datasets (``trains/train_multitask.py``). Both save the same
+checkpoint: the backbone arch, one eval transform, per-task metadata (the task
+checkpoint's ``class_to_idx`` and extras such as ``damage_class_index``) and the
+weights. One forward pass then answers every task.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from torchvision import models, transforms
+
+from inference.batching import BatchInput, build_batch, default_device, on_device
+from inference.checkpoint_io import load_checkpoint_data
+from inference.config import MODELS_DIR
+
+
+MULTITASK_CKPT = os.path.join(MODELS_DIR, "multitask.pt")
+
+# Task metadata copied from the task checkpoints; the rest (weights, history, ...) is not needed
+TASK_META_KEYS = ("class_to_idx", "num_classes", "damage_class_index", "positive_label")
+
+
+def build_backbone(arch: str, pretrained: bool = False) -> Tuple[nn.Module, int]:
+    """Feature extractor (classifier removed) and its output width."""
+    arch = arch.lower()
+    if arch == "resnet18":
+        model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
+        dim = model.fc.in_features
+        model.fc = nn.Identity()
+    elif arch == "efficientnet_b0":
+        model = models.efficientnet_b0(weights=models.EfficientNet_B0_Weights.IMAGENET1K_V1 if pretrained else None)
+        dim = model.classifier[-1].in_features
+        model.classifier = nn.Identity()
+    elif arch == "mobilenet_v2":
+        model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.IMAGENET1K_V1 if pretrained else None)
+        dim = model.classifier[-1].in_features
+        model.classifier = nn.Identity()
+    else:
+        raise ValueError(f"Unsupported arch: {arch}")
+    return model, dim
+
+
+def task_num_classes(meta: dict) -> int:
+    return int(meta.get("num_classes", len(meta["class_to_idx"])))
+
+
+class MultiTaskModel(nn.Module):
+    """Shared backbone -> {task: logits}."""
+
+    def __init__(self, arch: str, num_classes: Dict[str, int], pretrained: bool = False, dropout: float = 0.2) -> None:
+        super().__init__()
+        self.arch = arch
+        self.backbone, dim = build_backbone(arch, pretrained)
+        self.heads = nn.ModuleDict({
+            task: nn.Sequential(nn.Dropout(dropout), nn.Linear(dim, n)) for task, n in num_classes.items()
+        })
+
+    def forward(self, x: torch.Tensor) -> Dict[str, torch.Tensor]:
+        features = self.backbone(x)
+        return {task: head(features) for task, head in self.heads.items()}
+
+
+class TaskView(nn.Module):
+    """Single-task logits from a MultiTaskModel, with the task models' call interface."""
+
+    def __init__(self, model: MultiTaskModel, task: str) -> None:
+        super().__init__()
+        self.model = model
+        self.task = task
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model.heads[self.task](self.model.backbone(x))
+
+
+def eval_transform(image_size: int, mean: List[float], std: List[float]) -> transforms.Compose:
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=mean, std=std),
+    ])
+
+
+def save_checkpoint(path: str, model: MultiTaskModel, image_size: int, mean: List[float], std: List[float], tasks: Dict[str, dict], **extra) -> None:
+    torch.save(
+        {
+            "model_state_dict": model.state_dict(),
+            "arch": model.arch,
+            "image_size": image_size,
+            "mean": mean,
+            "std": std,
+            "tasks": {task: {k: v for k, v in meta.items() if k in TASK_META_KEYS} for task, meta in tasks.items()},
+            **extra,
+        },
+        path,
+    )
+
+
+def load_checkpoint(ckpt_path: str = MULTITASK_CKPT):
+    """(model, tf, tasks) where ``tasks`` maps each task to its checkpoint metadata."""
+    data = load_checkpoint_data(ckpt_path)
+    tasks = data["tasks"]
+    with torch.device("meta"):
+        model = MultiTaskModel(data["arch"], {task: task_num_classes(meta) for task, meta in tasks.items()})
+    model.load_state_dict(data["model_state_dict"], assign=True)
+    model.eval()
+    tf = eval_transform(int(data.get("image_size", 224)), data.get("mean", [0.485, 0.456, 0.406]), data.get("std", [0.229, 0.224, 0.225]))
+    return model, tf, tasks
+
+
+@torch.inference_mode()
+def predict_batch(model: MultiTaskModel, tf: transforms.Compose, images: BatchInput, device: Optional[str] = None) -> Dict[str, torch.Tensor]:
+    """Softmax probabilities (on CPU) for every task from one backbone pass: {task: [N, C]}."""
+    if device is None:
+        device = default_device()
+    x, _ = build_batch(tf, images)
+    logits = on_device(model, device)(x.to(device))
+    return {task: torch.softmax(out.float(), dim=-1).cpu() for task, out in logits.items()}
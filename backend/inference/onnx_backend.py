@@ -0,0 +1,75 @@
+"""ONNX export and an onnxruntime (CPU) predictor with the eager model's call interface."""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional: only needed when a model is served with backend=onnx
+    ort = None
+
+
+def onnx_path(ckpt_path: str) -> str:
+    return os.path.splitext(ckpt_path)[0] + ".onnx"
+
+
+def export_onnx(model: nn.Module, image_size: int, out_path: str, opset: int = 17) -> str:
+    """Export an eager classifier with a dynamic batch dimension."""
+    model = model.cpu().eval()
+    dummy = torch.randn(1, 3, image_size, image_size)
+    torch.onnx.export(
+        model,
+        dummy,
+        out_path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+        dynamo=False,
+    )
+    return out_path
+
+
+class OnnxPredictor:
+    """Drop-in replacement for the eager model: NCHW float tensor in, logits tensor out."""
+
+    def __init__(self, path: str, num_threads: Optional[int] = None) -> None:
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    # The inference modules call model.to(device) / model.eval(); both are no-ops here
+    def to(self, *args, **kwargs) -> "OnnxPredictor":
+        return self
+
+    def eval(self) -> "OnnxPredictor":
+        return self
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        feed = {self.input_name: x.detach().to("cpu", torch.float32).contiguous().numpy()}
+        return torch.from_numpy(self.session.run(None, feed)[0])
+
+
+_sessions: Dict[Tuple[str, float], OnnxPredictor] = {}
+_sessions_lock = threading.Lock()
+
+
+def load_predictor(path: str, num_threads: Optional[int] = None) -> OnnxPredictor:
+    """Return a cached predictor; sessions are rebuilt only when the .onnx file changes."""
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    with _sessions_lock:
+        predictor = _sessions.get(key)
+        if predictor is None:
+            predictor = OnnxPredictor(path, num_threads=num_threads)
+            _sessions[key] = predictor
+        return predictor
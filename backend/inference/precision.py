@@ -0,0 +1,60 @@
+"""bf16 autocast / channels_last serving mode for CPU inference."""
+
+import functools
+
+import torch
+import torch.nn as nn
+
+from inference.config import get_option
+
+
+@functools.lru_cache(maxsize=1)
+def cpu_supports_bf16() -> bool:
+    """True when the CPU has native bf16 dot products (AVX512-BF16 or AMX), which oneDNN needs to be faster than fp32."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        pass
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        return False
+
+
+class PrecisionWrapper(nn.Module):
+    """Runs the wrapped model on channels_last inputs and/or under CPU bf16 autocast, returning fp32 logits."""
+
+    def __init__(self, model: nn.Module, bf16: bool, channels_last: bool) -> None:
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last) if channels_last else model
+        self.bf16 = bf16
+        self.channels_last = channels_last
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        if not self.bf16:
+            return self.model(x)
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return self.model(x).float()
+
+
+def apply_precision(model: nn.Module, name: str) -> nn.Module:
+    """Wrap an eager model according to the ``precision`` (fp32|bf16) and ``memory_format`` (contiguous|channels_last) settings."""
+    precision = get_option(name, "precision", "fp32")
+    memory_format = get_option(name, "memory_format", "contiguous")
+    if precision not in ("fp32", "bf16"):
+        raise ValueError(f"Unsupported precision for {name}: {precision}")
+    if memory_format not in ("contiguous", "channels_last"):
+        raise ValueError(f"Unsupported memory_format for {name}: {memory_format}")
+
+    bf16 = precision == "bf16"
+    if bf16 and (torch.cuda.is_available() or not cpu_supports_bf16()):
+        print(f"Warning: CPU bf16 not supported here, serving {name} in fp32")
+        bf16 = False
+    channels_last = memory_format == "channels_last"
+    if not bf16 and not channels_last:
+        return model
+    return PrecisionWrapper(model, bf16=bf16, channels_last=channels_last).eval()
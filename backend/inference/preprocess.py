@@ -0,0 +1,100 @@
+"""Batched uint8 tensor preprocessing, equivalent to the modules' Resize/ToTensor/Normalize transforms.
+
+The PIL path runs the Compose per image and allocates a float tensor for ToTensor and
+another for Normalize. ``Preprocessor`` instead keeps images as uint8 HWC views of the
+decoded buffers, resizes each group of equally sized images with one antialiased
+bilinear ``interpolate`` (still uint8, so rounding matches PIL's), and converts the
+whole batch to normalized float with a single fused multiply-add.
+"""
+
+import weakref
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torchvision import transforms
+
+from inference.buffers import batch_buffer
+from inference.decoders import Decoded
+
+
+class Preprocessor:
+    """Callable: list of decoded images -> normalized [N, 3, H, W] batch."""
+
+    def __init__(
+        self, size: Tuple[int, int], mean: Sequence[float], std: Sequence[float],
+        dtype: torch.dtype = torch.float32, raw_uint8: bool = False,
+    ) -> None:
+        self.size = size
+        self.dtype = dtype
+        # PILToTensor transforms (normalization folded into a uint8 model): skip the float conversion
+        self.raw_uint8 = raw_uint8
+        mean_t = torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1)
+        std_t = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+        # (x / 255 - mean) / std == x * scale + shift
+        self.scale = 1.0 / (255.0 * std_t)
+        self.shift = -mean_t / std_t
+
+    @classmethod
+    def from_transform(cls, tf: transforms.Compose, dtype: torch.dtype = torch.float32) -> "Preprocessor":
+        """Build from an eval transform made of Resize((h, w)), then ToTensor (+ Normalize) or PILToTensor."""
+        size, mean, std, raw_uint8 = None, (0.0, 0.0, 0.0), (1.0, 1.0, 1.0), False
+        for t in tf.transforms:
+            if isinstance(t, transforms.Resize) and isinstance(t.size, (tuple, list)) and len(t.size) == 2:
+                size = (int(t.size[0]), int(t.size[1]))
+            elif isinstance(t, transforms.Normalize):
+                mean, std = t.mean, t.std
+            elif isinstance(t, transforms.PILToTensor):
+                raw_uint8 = True
+            elif not isinstance(t, transforms.ToTensor):
+                raise ValueError(f"Unsupported transform for tensor preprocessing: {t}")
+        if size is None:
+            raise ValueError("Tensor preprocessing needs a fixed-size Resize((h, w))")
+        return cls(size, mean, std, dtype, raw_uint8)
+
+    @staticmethod
+    def as_hwc(image: Decoded) -> torch.Tensor:
+        """uint8 [H, W, 3] view of a decoded image: tensor decoder outputs are not copied, PIL images once."""
+        if isinstance(image, Image.Image):
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            return torch.from_numpy(np.array(image))
+        return image.permute(1, 2, 0)
+
+    def resize_uint8(self, images: Sequence[Decoded]) -> torch.Tensor:
+        """uint8 [N, 3, H, W] batch, one interpolate call per distinct source size."""
+        hwc = [self.as_hwc(image) for image in images]
+        out = batch_buffer(len(hwc), (3,) + self.size, torch.uint8)
+        groups: Dict[Tuple[int, int], List[int]] = {}
+        for i, x in enumerate(hwc):
+            groups.setdefault(tuple(x.shape[:2]), []).append(i)
+        for shape, idx in groups.items():
+            # NHWC storage viewed as NCHW: the channels_last layout the uint8 kernels are fastest on
+            batch = torch.stack([hwc[i] for i in idx]).permute(0, 3, 1, 2)
+            if shape != self.size:
+                batch = F.interpolate(batch, size=self.size, mode="bilinear", antialias=True, align_corners=False)
+            out[idx] = batch
+        return out
+
+    def normalize(self, x: torch.Tensor) -> torch.Tensor:
+        """uint8 batch -> normalized ``dtype`` batch: one conversion into a pooled buffer, then one in-place multiply-add."""
+        out = batch_buffer(x.size(0), tuple(x.shape[1:]), torch.float32).copy_(x)
+        torch.addcmul(self.shift, out, self.scale, out=out)
+        return out if self.dtype == torch.float32 else out.to(self.dtype)
+
+    def __call__(self, images: Sequence[Decoded]) -> torch.Tensor:
+        x = self.resize_uint8(images)
+        return x if self.raw_uint8 else self.normalize(x)
+
+
+_preprocessors: "weakref.WeakKeyDictionary[transforms.Compose, Preprocessor]" = weakref.WeakKeyDictionary()
+
+
+def preprocessor_for(tf: transforms.Compose) -> Preprocessor:
+    """Cached Preprocessor for a loaded model's transform."""
+    pre = _preprocessors.get(tf)
+    if pre is None:
+        pre = _preprocessors[tf] = Preprocessor.from_transform(tf)
+    return pre
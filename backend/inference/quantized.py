@@ -0,0 +1,31 @@
+"""Loading of INT8 variants published by tools/quantize.py."""
+
+import os
+import threading
+from typing import Dict, Tuple
+
+import torch
+
+
+def quantized_path(ckpt_path: str) -> str:
+    return os.path.splitext(ckpt_path)[0] + ".int8.pt"
+
+
+def quantized_report_path(ckpt_path: str) -> str:
+    return os.path.splitext(ckpt_path)[0] + ".int8.json"
+
+
+_models: Dict[Tuple[str, float], torch.jit.ScriptModule] = {}
+_models_lock = threading.Lock()
+
+
+def load_quantized(path: str) -> torch.jit.ScriptModule:
+    """Return a cached TorchScript INT8 model; reloaded only when the file changes."""
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = torch.jit.load(path, map_location="cpu")
+            model.eval()
+            _models[key] = model
+        return model
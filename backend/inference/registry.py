@@ -0,0 +1,82 @@
+"""Process-wide cache of loaded models, so checkpoints are loaded once instead of per request."""
+
+import importlib
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from inference.batching import image_size
+from inference.cascade import CascadeModel, first_stage_path, load_cascade_threshold
+from inference.config import MODEL_MODULES, checkpoint_path
+
+
+class ModelRegistry:
+    def __init__(self) -> None:
+        self._entries: Dict[str, Tuple[float, tuple]] = {}
+        self._locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in MODEL_MODULES}
+
+    def get(self, name: str) -> Optional[tuple]:
+        """What the model's ``load_checkpoint`` returns, or None when the checkpoint is missing.
+
+        A checkpoint rewritten on disk (newer mtime) is reloaded on the next call.
+        """
+        path = checkpoint_path(name)
+        if not os.path.exists(path):
+            return None
+        mtime = os.path.getmtime(path)
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with self._locks[name]:
+            entry = self._entries.get(name)
+            if entry is None or entry[0] != mtime:
+                entry = (mtime, self._load(name, path))
+                self._entries[name] = entry
+        return entry[1]
+
+    def _load(self, name: str, path: str) -> tuple:
+        module = importlib.import_module(MODEL_MODULES[name])
+        loaded = module.load_checkpoint(path)
+        threshold = load_cascade_threshold(name, path)
+        if threshold is None:
+            return loaded
+        first = module.load_checkpoint(first_stage_path(name))
+        # Both stages get the same preprocessed batch
+        if repr(first[1]) != repr(loaded[1]) or first[2:] != loaded[2:]:
+            print(f"Warning: first-stage {name} has a different transform or label map, serving without cascade")
+            return loaded
+        return (CascadeModel(first[0], loaded[0], threshold),) + loaded[1:]
+
+    def preload(self) -> Dict[str, bool]:
+        loaded = {}
+        for name in MODEL_MODULES:
+            try:
+                loaded[name] = self.get(name) is not None
+            except Exception as e:
+                print(f"Warning: failed to load {name}: {e}")
+                loaded[name] = False
+        return loaded
+
+    def max_image_size(self) -> int:
+        """Largest input size among loaded models: the resolution a shared decode has to keep."""
+        return max((image_size(loaded[1]) for _, loaded in self._entries.values()), default=224)
+
+    def versions(self) -> Dict[str, int]:
+        """Loaded models and the checkpoint mtime they were loaded from, recorded with each stored analysis."""
+        return {name: int(mtime) for name, (mtime, _) in self._entries.items()}
+
+    def status(self) -> Dict[str, dict]:
+        """Loaded models with their serving wrapper and, for compiled ones, compile progress."""
+        out = {}
+        for name, (_, loaded) in self._entries.items():
+            model = loaded[0]
+            info = {"serving": type(model).__name__}
+            if isinstance(model, CascadeModel):
+                info["cascade"] = model.status()
+            elif hasattr(model, "status"):
+                info["compile"] = model.status()
+            out[name] = info
+        return out
+
+
+registry = ModelRegistry()
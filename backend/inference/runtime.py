@@ -0,0 +1,60 @@
+"""Load-time hook that turns a freshly loaded eager model into the configured serving model."""
+
+import os
+
+from typing import Tuple
+
+import torch
+import torch.nn as nn
+from torchvision import transforms
+
+from inference.compiled import apply_compile
+from inference.batching import image_size
+from inference.config import get_option, model_name
+from inference.fold import fold_normalization
+from inference.onnx_backend import load_predictor, onnx_path, ort
+from inference.precision import apply_precision
+from inference.quantized import load_quantized, quantized_path
+
+
+def _is_fresh(artifact_path: str, ckpt_path: str) -> bool:
+    """True when a derived artifact exists and was built after the checkpoint was written."""
+    return os.path.exists(artifact_path) and os.path.getmtime(artifact_path) >= os.path.getmtime(ckpt_path)
+
+
+def prepare_model(model: nn.Module, ckpt_path: str, tf: transforms.Compose) -> Tuple[nn.Module, transforms.Compose]:
+    """Apply the per-model settings (see inference.config) to an eager model and its eval transform.
+
+    Returns the serving model and the transform its inputs need, which differs from
+    ``tf`` when the normalization is folded into the model.
+    """
+    name = model_name(ckpt_path)
+
+    backend = get_option(name, "backend", "torch")
+    if backend == "onnx":
+        path = onnx_path(ckpt_path)
+        if ort is None:
+            print(f"Warning: onnxruntime not installed, serving {name} with torch")
+        elif not _is_fresh(path, ckpt_path):
+            print(f"Warning: {path} missing or older than {ckpt_path}, serving {name} with torch. Run tools/export_onnx.py.")
+        else:
+            num_threads = get_option(name, "num_threads")
+            return load_predictor(path, num_threads=int(num_threads) if num_threads else None), tf
+    elif backend != "torch":
+        raise ValueError(f"Unsupported inference backend for {name}: {backend}")
+
+    # INT8 variants are only published by tools/quantize.py when they pass the accuracy guardrail.
+    # "auto" serves one when present; quantized kernels are CPU-only.
+    quantized = get_option(name, "quantized", "auto")
+    if quantized != "off" and not torch.cuda.is_available():
+        path = quantized_path(ckpt_path)
+        if _is_fresh(path, ckpt_path):
+            return load_quantized(path), tf
+        elif quantized == "on":
+            print(f"Warning: {path} missing or older than {ckpt_path}, serving {name} in fp32. Run tools/quantize.py.")
+
+    size = image_size(tf)
+    model, tf = fold_normalization(model, tf, name, size)
+    # A uint8-folded model is fed PILToTensor output directly
+    input_dtype = torch.uint8 if any(isinstance(t, transforms.PILToTensor) for t in tf.transforms) else torch.float32
+    return apply_compile(apply_precision(model, name), name, size, input_dtype), tf
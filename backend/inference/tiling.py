@@ -0,0 +1,150 @@
+"""Tiled inference for small-detail models (window cracks, tire sidewalls).
+
+Instead of squashing the whole photo to the model input, the image is cut into an
+overlapping grid of tiles at (close to) native resolution, plus the whole image for
+context, and all of them run as one batch. The image-level verdict is the tile with
+the highest positive score, and its box is reported so the frontend can point at it.
+
+``tile_grid`` ("3x3", or "3" for a square grid) and ``tile_overlap`` (fraction of a
+tile shared with its neighbour, default 0.25) are per-model settings; the endpoints
+accept the same two as query parameters to trade latency for recall per request.
+Rows and columns are clamped to ``tile_grid_max`` (default 4) and the tiles run through
+the model ``tile_batch`` (default 8) at a time, so a request cannot ask for an
+arbitrarily large batch.
+"""
+
+import re
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+from torchvision.transforms.functional import to_pil_image
+
+from inference.batching import image_size, run_batch
+from inference.config import get_option
+from inference.decoders import ImageInput, decode_pil
+
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in original pixels
+
+# Models the tiled mode is meant for
+TILED_MODELS = ("unified_windows", "damaged_windows", "tire_classification")
+
+
+def positive_indices(name: str, class_to_idx: Dict[str, int]) -> Optional[List[int]]:
+    """Classes whose summed probability is a tile's score; None scores by top-class confidence.
+
+    damaged_windows has no negative class (every class is a damage type), so its tiles
+    are ranked by how confident the model is.
+    """
+    if name == "unified_windows":
+        return [i for cls, i in class_to_idx.items() if cls != "normal"]
+    if name == "tire_classification":
+        return [i for cls, i in class_to_idx.items() if cls.lower() == "flat-tire"]
+    return None
+
+
+_GRID = re.compile(r"\s*(\d{1,6})\s*(?:x\s*(\d{1,6}))?\s*")
+
+
+def parse_grid(value: str) -> Tuple[int, int]:
+    """"RxC" or "N" (square); ValueError for anything else."""
+    match = _GRID.fullmatch(value.lower())
+    if match is None:
+        raise ValueError(f"Tile grid must look like '3x3' or '3', got {value!r}")
+    rows, cols = int(match.group(1)), int(match.group(2) or match.group(1))
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Tile grid must be at least 1x1, got {value!r}")
+    return rows, cols
+
+
+def tiling_settings(name: Optional[str], grid: Optional[str] = None, overlap: Optional[float] = None) -> Tuple[int, int, float]:
+    rows, cols = parse_grid(grid or get_option(name, "tile_grid", "3x3"))
+    limit = int(get_option(name, "tile_grid_max", "4"))
+    rows, cols = min(rows, limit), min(cols, limit)
+    if overlap is None:
+        overlap = float(get_option(name, "tile_overlap", "0.25"))
+    return rows, cols, min(max(overlap, 0.0), 0.9)
+
+
+def _spans(length: int, count: int, overlap: float, min_tile: int) -> List[Tuple[int, int]]:
+    """``count`` evenly spaced windows covering ``length``, each sharing ``overlap`` with the next.
+
+    Fewer windows are used when they would come out smaller than ``min_tile`` pixels.
+    """
+    while count > 1 and length / (count - (count - 1) * overlap) < min_tile:
+        count -= 1
+    tile = length / (count - (count - 1) * overlap)
+    step = tile * (1 - overlap)
+    return [(int(round(i * step)), min(length, int(round(i * step + tile)))) for i in range(count)]
+
+
+def tile_boxes(width: int, height: int, rows: int, cols: int, overlap: float, min_tile: int = 1) -> List[Box]:
+    xs = _spans(width, cols, overlap, min_tile)
+    ys = _spans(height, rows, overlap, min_tile)
+    return [(left, top, right, bottom) for top, bottom in ys for left, right in xs]
+
+
+def tile_scores(probs: torch.Tensor, positive: Optional[Sequence[int]]) -> torch.Tensor:
+    if positive is None:
+        return probs.max(dim=1).values
+    if not positive:
+        return probs.new_zeros(probs.shape[0])
+    return probs[:, list(positive)].sum(dim=1)
+
+
+@torch.inference_mode()
+def predict_tiled(
+    model: nn.Module,
+    tf: transforms.Compose,
+    image: ImageInput,
+    postprocess: Callable[[torch.Tensor], List[Dict]],
+    positive: Optional[Sequence[int]] = None,
+    name: Optional[str] = None,
+    grid: Optional[str] = None,
+    overlap: Optional[float] = None,
+    device: Optional[str] = None,
+) -> Dict:
+    """One image's result dict (from ``postprocess`` on the strongest tile), with a ``tiling`` entry."""
+    rows, cols, overlap = tiling_settings(name, grid, overlap)
+    size = image_size(tf)
+    if isinstance(image, torch.Tensor):
+        image = to_pil_image(image)
+    elif not isinstance(image, Image.Image):
+        # Only as much resolution as the tiles need: each stays >= the model input
+        image = decode_pil(image, size * max(rows, cols))
+    width, height = image.size
+
+    boxes = [(0, 0, width, height)] + tile_boxes(width, height, rows, cols, overlap, min_tile=size)
+    start = time.perf_counter()
+    chunk = max(1, int(get_option(name, "tile_batch", "8")))
+    parts = []
+    for i in range(0, len(boxes), chunk):
+        # Crop per chunk: only ``chunk`` tiles are ever held at once
+        crops = [image if i + j == 0 else image.crop(box) for j, box in enumerate(boxes[i:i + chunk])]
+        parts.append(run_batch(model, tf, crops, device)[0])
+    probs = torch.cat(parts)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+    scores = tile_scores(probs, positive)
+    best = int(scores.argmax())
+    left, top, right, bottom = boxes[best]
+    result = postprocess(probs[best:best + 1])[0]
+    result["tiling"] = {
+        "grid": [len({b[1] for b in boxes[1:]}), len({b[0] for b in boxes[1:]})],
+        "overlap": overlap,
+        "tiles": len(boxes) - 1,
+        "full_image_score": float(scores[0]),
+        "strongest_tile": {
+            "index": best,  # 0 is the whole image
+            "score": float(scores[best]),
+            "box": [left, top, right, bottom],
+            "box_normalized": [left / width, top / height, right / width, bottom / height],
+        },
+        "tile_scores": [round(float(s), 4) for s in scores[1:]],
+        "ms": round(elapsed_ms, 2),
+    }
+    return result
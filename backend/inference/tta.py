@@ -0,0 +1,99 @@
+"""Confidence-gated test-time augmentation.
+
+The single view runs first; only when its top probability is below the threshold are
+the extra views (flip, center / corner crops, a tighter scale) built and run as one
+batch, and all views' probabilities averaged. ``tta_threshold`` (default 0.8) and
+``tta_views`` (default 4, at most len(VIEWS)) are global settings; the endpoints'
+``tta`` query parameter turns the mode on per request.
+"""
+
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+from PIL import Image, ImageOps
+from torchvision import transforms
+from torchvision.transforms.functional import to_pil_image
+
+from inference.batching import image_size, run_batch
+from inference.config import get_option
+from inference.decoders import ImageInput, decode_pil
+
+
+def _crop(img: Image.Image, fraction: float, anchor: Tuple[float, float]) -> Image.Image:
+    """``fraction`` of each side, placed at ``anchor`` (0 = left/top, 0.5 = center, 1 = right/bottom)."""
+    w, h = img.size
+    cw, ch = max(1, int(w * fraction)), max(1, int(h * fraction))
+    left, top = int((w - cw) * anchor[0]), int((h - ch) * anchor[1])
+    return img.crop((left, top, left + cw, top + ch))
+
+
+# In the order they are added as tta_views grows; the first is the plain view
+VIEWS: List[Tuple[str, Callable[[Image.Image], Image.Image]]] = [
+    ("identity", lambda img: img),
+    ("hflip", ImageOps.mirror),
+    ("center_crop", lambda img: _crop(img, 0.85, (0.5, 0.5))),
+    ("hflip_center_crop", lambda img: ImageOps.mirror(_crop(img, 0.85, (0.5, 0.5)))),
+    ("top_left", lambda img: _crop(img, 0.8, (0.0, 0.0))),
+    ("top_right", lambda img: _crop(img, 0.8, (1.0, 0.0))),
+    ("bottom_left", lambda img: _crop(img, 0.8, (0.0, 1.0))),
+    ("bottom_right", lambda img: _crop(img, 0.8, (1.0, 1.0))),
+    ("zoom", lambda img: _crop(img, 0.7, (0.5, 0.5))),
+]
+
+
+def make_views(img: Image.Image, count: int) -> List[Image.Image]:
+    return [view(img) for _, view in VIEWS[:count]]
+
+
+@torch.inference_mode()
+def predict_tta(
+    model: torch.nn.Module,
+    tf: transforms.Compose,
+    image: ImageInput,
+    postprocess: Callable[[torch.Tensor], List[Dict]],
+    threshold: Optional[float] = None,
+    num_views: Optional[int] = None,
+    device: Optional[str] = None,
+) -> Dict:
+    """One image's result dict (from ``postprocess``), with a ``tta`` entry reporting whether it ran and its cost."""
+    if threshold is None:
+        threshold = float(get_option(None, "tta_threshold", "0.8"))
+    if num_views is None:
+        num_views = int(get_option(None, "tta_views", "4"))
+    num_views = max(1, min(num_views, len(VIEWS)))
+
+    # Keep enough resolution for the tightest crop to still cover the model input
+    if isinstance(image, torch.Tensor):
+        image = to_pil_image(image)
+    elif not isinstance(image, Image.Image):
+        image = decode_pil(image, math.ceil(image_size(tf) / 0.7))
+    start = time.perf_counter()
+    probs, _ = run_batch(model, tf, [image], device)
+    single_ms = (time.perf_counter() - start) * 1000.0
+    confidence = float(probs.max())
+
+    info = {
+        "applied": False,
+        "threshold": threshold,
+        "single_view_confidence": confidence,
+        "views": 1,
+        "single_view_ms": round(single_ms, 2),
+        "extra_ms": 0.0,
+    }
+    if confidence < threshold and num_views > 1:
+        start = time.perf_counter()
+        view_probs, _ = run_batch(model, tf, make_views(image, num_views)[1:], device)
+        extra_ms = (time.perf_counter() - start) * 1000.0
+        probs = torch.cat([probs, view_probs]).mean(dim=0, keepdim=True)
+        info.update({
+            "applied": True,
+            "views": num_views,
+            "view_names": [name for name, _ in VIEWS[:num_views]],
+            "extra_ms": round(extra_ms, 2),
+            "extra_cost_ratio": round(extra_ms / single_ms, 2) if single_ms else None,
+        })
+    result = postprocess(probs)[0]
+    result["tta"] = info
+    return result
@@ -0,0 +1,290 @@
+"""
+Shared HTTP clients for the Azure OpenAI calls.
+
+One pooled client per process (an ``httpx.AsyncClient`` for the request path, an
+``httpx.Client`` for the legacy synchronous report), so every completion reuses a
+warm keep-alive connection instead of paying a TCP + TLS handshake, with explicit
+connect/read/write/pool timeouts rather than the SDK's ten-minute default.
+
+Retries happen here, not in the OpenAI SDK (``max_retries=0``): connection errors and
+429/5xx responses are retried with full-jitter exponential backoff, honouring
+``Retry-After``, but only while a process-wide ``RetryBudget`` allows it. The budget
+lets retries add at most ``LLM_HTTP_RETRY_RATIO`` (default 10%) on top of the request
+rate, plus a small floor, so an outage does not turn every request into three.
+
+Settings (environment):
+    LLM_HTTP_MAX_CONNECTIONS     pool size (default 50)
+    LLM_HTTP_MAX_KEEPALIVE       idle connections kept open (default 20)
+    LLM_HTTP_KEEPALIVE_EXPIRY    seconds an idle connection is kept (default 90)
+    LLM_HTTP_CONNECT_TIMEOUT     seconds (default 5)
+    LLM_HTTP_READ_TIMEOUT        seconds between bytes received (default 30)
+    LLM_HTTP_WRITE_TIMEOUT       seconds (default 10)
+    LLM_HTTP_POOL_TIMEOUT        seconds to wait for a free connection (default 5)
+    LLM_HTTP_RETRIES             retries per request (default 2)
+    LLM_HTTP_BACKOFF_BASE / _MAX backoff seconds (default 0.25 / 4)
+    LLM_HTTP_RETRY_RATIO         retries allowed per request made (default 0.1)
+    LLM_HTTP_RETRY_MIN_PER_SEC   retries always allowed per second (default 1)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+
+def _env_float(key: str, default: str) -> float:
+    return float(os.getenv(key, default))
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "50")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=_env_float("LLM_HTTP_KEEPALIVE_EXPIRY", "90"),
+    )
+
+
+def http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=_env_float("LLM_HTTP_CONNECT_TIMEOUT", "5"),
+        read=_env_float("LLM_HTTP_READ_TIMEOUT", "30"),
+        write=_env_float("LLM_HTTP_WRITE_TIMEOUT", "10"),
+        pool=_env_float("LLM_HTTP_POOL_TIMEOUT", "5"),
+    )
+
+
+class RetryBudget:
+    """Token bucket shared by all requests: each request deposits ``ratio`` tokens, each retry spends one."""
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, window_seconds: float = 10.0) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        # The floor refills continuously, capped so an idle minute cannot bank a burst of retries
+        self.cap = max(1.0, min_per_second * window_seconds)
+        self._tokens = self.cap
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.denied = 0
+
+    @classmethod
+    def from_env(cls) -> "RetryBudget":
+        return cls(_env_float("LLM_HTTP_RETRY_RATIO", "0.1"), _env_float("LLM_HTTP_RETRY_MIN_PER_SEC", "1"))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.cap, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self.requests += 1
+            self._tokens = min(self.cap, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens < 1.0:
+                self.denied += 1
+                return False
+            self._tokens -= 1.0
+            self.retries += 1
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "retries_denied": self.denied,
+                "tokens": round(self._tokens, 2),
+                "ratio": self.ratio,
+                "min_per_second": self.min_per_second,
+            }
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _RetryPolicy:
+    def __init__(self, budget: RetryBudget) -> None:
+        self.budget = budget
+        self.retries = int(os.getenv("LLM_HTTP_RETRIES", "2"))
+        self.backoff_base = _env_float("LLM_HTTP_BACKOFF_BASE", "0.25")
+        self.backoff_max = _env_float("LLM_HTTP_BACKOFF_MAX", "4")
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """Seconds to wait before retry ``attempt`` (0-based), or None when no retry is allowed."""
+        if attempt >= self.retries or not self.budget.withdraw():
+            return None
+        # Full jitter: concurrent callers that failed together do not come back together
+        delay = random.uniform(0.0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        server_delay = _retry_after(response)
+        if server_delay is not None:
+            # Never wait longer than the backoff cap; the caller's deadline is tighter than the server's hint
+            delay = min(max(delay, server_delay), self.backoff_max)
+        return delay
+
+
+class PoolStats:
+    """Counts new connections against requests, read off the transport's connection pool."""
+
+    def __init__(self) -> None:
+        self._seen: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def observe(self, transport: Any) -> None:
+        connections = list(getattr(getattr(transport, "_pool", None), "connections", []))
+        with self._lock:
+            self.requests += 1
+            for connection in connections:
+                if connection not in self._seen:
+                    self._seen.add(connection)
+                    self.new_connections += 1
+
+    def status(self, transport: Any) -> Dict[str, Any]:
+        connections = list(getattr(getattr(transport, "_pool", None), "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        with self._lock:
+            return {
+                "connections": len(connections),
+                "idle": idle,
+                "active": len(connections) - idle,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "connection_reuse": round(1 - self.new_connections / self.requests, 3) if self.requests else None,
+            }
+
+
+class RetryingAsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, budget: RetryBudget) -> None:
+        self.transport = httpx.AsyncHTTPTransport(limits=http_limits(), retries=0)
+        self.policy = _RetryPolicy(budget)
+        self.stats = PoolStats()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.policy.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_EXCEPTIONS:
+                delay = self.policy.delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.stats.observe(self.transport)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self.policy.delay(attempt, response)
+                if delay is None:
+                    return response
+                await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RetryingTransport(httpx.BaseTransport):
+    def __init__(self, budget: RetryBudget) -> None:
+        self.transport = httpx.HTTPTransport(limits=http_limits(), retries=0)
+        self.policy = _RetryPolicy(budget)
+        self.stats = PoolStats()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.policy.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_EXCEPTIONS:
+                delay = self.policy.delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.stats.observe(self.transport)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self.policy.delay(attempt, response)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+retry_budget = RetryBudget.from_env()
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+
+
+def shared_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(transport=RetryingAsyncTransport(retry_budget), timeout=http_timeout())
+    return _async_client
+
+
+def shared_client() -> httpx.Client:
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(transport=RetryingTransport(retry_budget), timeout=http_timeout())
+    return _sync_client
+
+
+async def close_clients() -> None:
+    if _async_client is not None:
+        await _async_client.aclose()
+    if _sync_client is not None:
+        _sync_client.close()
+
+
+def pool_status() -> Dict[str, Any]:
+    limits = http_limits()
+    timeout = http_timeout()
+    clients = {}
+    for name, client in (("async", _async_client), ("sync", _sync_client)):
+        if client is not None and not client.is_closed:
+            transport = client._transport
+            clients[name] = transport.stats.status(transport.transport)
+    return {
+        "limits": {
+            "max_connections": limits.max_connections,
+            "max_keepalive_connections": limits.max_keepalive_connections,
+            "keepalive_expiry": limits.keepalive_expiry,
+        },
+        "timeouts": {"connect": timeout.connect, "read": timeout.read, "write": timeout.write, "pool": timeout.pool},
+        "clients": clients,
+        "retry_budget": retry_budget.status(),
+    }
@@ -4,38 +4,82 @@ using Azure OpenAI GPT-4 to transform technical analysis into business insights
 """
 
 import os
+import re
 import json
-from typing import Dict, Any
-from openai import AzureOpenAI
+import time
+import asyncio
+from typing import Dict, Any, AsyncIterator, Callable, Optional
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
-import httpx
+from services.http_client import http_timeout, shared_async_client, shared_client
+from services.report_cache import report_cache, report_key
 
 # Load environment variables
 load_dotenv()
 
+# Completion settings per report: max_tokens, temperature
+REPORT_SETTINGS = {
+    "driver": {"max_tokens": 350, "temperature": 0.6},
+    "passenger": {"max_tokens": 200, "temperature": 0.3},
+    "business": {"max_tokens": 400, "temperature": 0.4},
+    "recommendations": {"max_tokens": 400, "temperature": 0.4},
+}
+
+# Per-completion timeout for the concurrent path; a report that misses it gets its fallback
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "20"))
+
+# "parallel": four concurrent completions, each re-sending the analysis context.
+# "combined": one JSON-mode completion returning every section, so the context is sent once.
+LLM_REPORT_MODE = os.getenv("LLM_REPORT_MODE", "parallel")
+# The combined completion writes all four sections, so it gets a longer budget
+LLM_COMBINED_TIMEOUT_SECONDS = float(os.getenv("LLM_COMBINED_TIMEOUT_SECONDS", "40"))
+
+# One combined completion has room for all four sections
+REPORT_SETTINGS["combined"] = {
+    "max_tokens": sum(settings["max_tokens"] for settings in REPORT_SETTINGS.values()),
+    "temperature": 0.5,
+}
+
+REPORT_SECTIONS = ("driver_report", "passenger_report", "business_report", "recommendations")
+
+# How long /analyze-comprehensive waits for the reports before answering with templates
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "8"))
+
+# Streaming: the first token must arrive within the call timeout, later ones within this gap
+LLM_STREAM_IDLE_SECONDS = float(os.getenv("LLM_STREAM_IDLE_SECONDS", "10"))
+
 class CarAnalysisLLMService:
     def __init__(self):
         try:
-            # Create a custom HTTP client to handle the proxies compatibility issue
-            class CustomHTTPClient(httpx.Client):
-                def __init__(self, *args, **kwargs):
-                    kwargs.pop("proxies", None)  # Remove the 'proxies' argument if present
-                    super().__init__(*args, **kwargs)
-            
-            # Initialize Azure OpenAI client with custom HTTP client
+            # Both clients share one pooled keep-alive connection pool per process; retries
+            # happen in its transport under a global budget, so the SDK's own are disabled
             self.client = AzureOpenAI(
                 api_key=os.getenv("AZURE_OPENAI_API_KEY"),
                 api_version="2024-02-15-preview",
                 azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                http_client=CustomHTTPClient()
+                http_client=shared_client(),
+                timeout=http_timeout(),
+                max_retries=0
+            )
+            # Same deployment, used by generate_comprehensive_report_async to run the reports concurrently
+            self.async_client = AsyncAzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                api_version="2024-02-15-preview",
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                http_client=shared_async_client(),
+                timeout=http_timeout(),
+                max_retries=0
             )
             self.deployment_name = os.getenv("AZURE_OPENAI_GPT4O_DEPLOYMENT_NAME", "gpt-4o")
+            self.usage_totals: Dict[str, Dict[str, Any]] = {}
             self.available = True
         except Exception as e:
             print(f"Warning: LLM service initialization failed: {e}")
             print("LLM features will be disabled, but core analysis will work")
             self.client = None
+            self.async_client = None
             self.deployment_name = None
+            self.usage_totals = {}
             self.available = False
     
     def generate_comprehensive_report(self, technical_analysis: Dict[str, Any]) -> Dict[str, Any]:
@@ -83,6 +127,327 @@ class CarAnalysisLLMService:
                 "recommendations": self._generate_fallback_recommendations(technical_analysis, condition_score)
             }
     
+    async def generate_comprehensive_report_async(
+        self, technical_analysis: Dict[str, Any], mode: Optional[str] = None, use_cache: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Same result as generate_comprehensive_report, with the four completions run concurrently.
+        Each one is bounded by LLM_CALL_TIMEOUT_SECONDS and falls back on its own, so the
+        response takes as long as the slowest report and a single failure does not cost the others.
+        With mode "combined" (default: LLM_REPORT_MODE) one completion produces all sections instead.
+        Reports for an analysis with the same quantized signature as an earlier one come from
+        report_cache; results that needed any fallback are not cached.
+        """
+        mode = mode or LLM_REPORT_MODE
+        condition_score = self._calculate_condition_score(technical_analysis)
+
+        if not self.available or not self.async_client:
+            return self.fallback_reports(technical_analysis, condition_score)
+
+        key = report_key(technical_analysis) if use_cache else None
+        if key is not None:
+            cached, tier = report_cache.get(key)
+            if cached is not None:
+                return {
+                    **cached,
+                    "condition_score": condition_score,
+                    "usage": {"mode": "cache", "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "latency_ms": 0.0},
+                    "cache": {"hit": True, "tier": tier, "key": key},
+                }
+
+        analysis_context = self._prepare_analysis_context(technical_analysis)
+        if mode == "combined":
+            result = await self._generate_combined_async(technical_analysis, analysis_context, condition_score)
+        else:
+            result = await self._generate_parallel_async(technical_analysis, analysis_context, condition_score)
+        if key is not None and not result.get("fallback_sections"):
+            report_cache.put(key, result)
+        return result
+
+    def fallback_reports(self, technical_analysis: Dict[str, Any], condition_score: Optional[int] = None) -> Dict[str, Any]:
+        """Template reports, no LLM call: what the service answers with when the LLM is unavailable or late."""
+        if condition_score is None:
+            condition_score = self._calculate_condition_score(technical_analysis)
+        return {
+            "condition_score": condition_score,
+            "driver_report": self._generate_fallback_driver_report(technical_analysis),
+            "passenger_report": self._generate_fallback_passenger_report(technical_analysis),
+            "business_report": self._generate_fallback_business_report(technical_analysis),
+            "recommendations": self._generate_fallback_recommendations(technical_analysis, condition_score)
+        }
+
+    async def _generate_parallel_async(self, technical_analysis: Dict[str, Any], analysis_context: str, condition_score: int) -> Dict[str, Any]:
+        """Four concurrent completions, one per section."""
+        fallbacks = []
+        usage = self._new_usage("parallel")
+        start = time.perf_counter()
+
+        async def section(name: str, prompt: str, fallback: Callable[[], Any], parse: Callable[[str], Any] = lambda text: text):
+            try:
+                return parse(await self._complete_async(prompt, name, usage=usage))
+            except Exception as e:
+                fallbacks.append({"section": name, "error": str(e) or type(e).__name__})
+                return fallback()
+
+        driver_report, passenger_report, business_report, recommendations = await asyncio.gather(
+            section("driver", self._driver_prompt(analysis_context), lambda: self._generate_fallback_driver_report(technical_analysis)),
+            section("passenger", self._passenger_prompt(analysis_context), lambda: self._generate_fallback_passenger_report(technical_analysis)),
+            section("business", self._business_prompt(analysis_context), lambda: self._generate_fallback_business_report(technical_analysis)),
+            section(
+                "recommendations",
+                self._recommendations_prompt(analysis_context, condition_score),
+                lambda: self._generate_enhanced_fallback_recommendations(analysis_context, condition_score),
+                self._parse_recommendations,
+            ),
+        )
+        result = {
+            "condition_score": condition_score,
+            "driver_report": driver_report,
+            "passenger_report": passenger_report,
+            "business_report": business_report,
+            "recommendations": recommendations,
+            "usage": self._finish_usage(usage, start),
+        }
+        if fallbacks:
+            result["fallback_sections"] = fallbacks
+        return result
+
+    async def _generate_combined_async(self, technical_analysis: Dict[str, Any], analysis_context: str, condition_score: int) -> Dict[str, Any]:
+        """All sections from one JSON-mode completion; any section missing or malformed gets its own fallback."""
+        usage = self._new_usage("combined")
+        start = time.perf_counter()
+        fallbacks = []
+        try:
+            sections = self._parse_combined(
+                await self._complete_async(
+                    self._combined_prompt(analysis_context, condition_score), "combined",
+                    timeout=LLM_COMBINED_TIMEOUT_SECONDS, json_mode=True, usage=usage,
+                )
+            )
+        except Exception as e:
+            fallbacks.append({"section": "combined", "error": str(e) or type(e).__name__})
+            sections = None
+
+        section_fallbacks = {
+            "driver_report": lambda: self._generate_fallback_driver_report(technical_analysis),
+            "passenger_report": lambda: self._generate_fallback_passenger_report(technical_analysis),
+            "business_report": lambda: self._generate_fallback_business_report(technical_analysis),
+            "recommendations": lambda: self._generate_enhanced_fallback_recommendations(analysis_context, condition_score),
+        }
+        result: Dict[str, Any] = {"condition_score": condition_score}
+        for name in REPORT_SECTIONS:
+            if sections and name in sections:
+                result[name] = sections[name]
+            else:
+                result[name] = section_fallbacks[name]()
+                # A failed completion is already recorded as "combined"; a parsed one names each bad section
+                if sections is not None:
+                    fallbacks.append({"section": name, "error": "missing or malformed in combined response"})
+        result["usage"] = self._finish_usage(usage, start)
+        if fallbacks:
+            result["fallback_sections"] = fallbacks
+        return result
+
+    def _combined_prompt(self, context: str, score: int) -> str:
+        """One prompt for every section: the analysis context once, then each section's own instructions."""
+        return f"""
+        Ниже данные анализа автомобиля и четыре задания. Выполни все четыре и верни ОДИН JSON-объект
+        строго такого вида (без текста вне JSON):
+        {{
+          "driver_report": "текст задания 1",
+          "passenger_report": "текст задания 2",
+          "business_report": "текст задания 3",
+          "recommendations": [ {{ ... объекты рекомендаций из задания 4 ... }} ]
+        }}
+
+        {context}
+
+        === ЗАДАНИЕ 1: driver_report ===
+        {self._driver_prompt("")}
+
+        === ЗАДАНИЕ 2: passenger_report ===
+        {self._passenger_prompt("")}
+
+        === ЗАДАНИЕ 3: business_report ===
+        {self._business_prompt("")}
+
+        === ЗАДАНИЕ 4: recommendations (JSON-массив внутри объекта) ===
+        {self._recommendations_prompt("", score)}
+        """
+
+    @staticmethod
+    def _parse_combined(text: str) -> Dict[str, Any]:
+        """The valid sections of a combined response; tolerates code fences and text around the object."""
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+        try:
+            data = json.loads(text)
+        except ValueError:
+            start, end = text.find("{"), text.rfind("}")
+            if start < 0 or end <= start:
+                raise ValueError("no JSON object in combined response")
+            data = json.loads(text[start:end + 1])
+        if not isinstance(data, dict):
+            raise ValueError("combined response is not a JSON object")
+
+        sections = {}
+        for name in ("driver_report", "passenger_report", "business_report"):
+            value = data.get(name)
+            if isinstance(value, str) and value.strip():
+                sections[name] = value.strip()
+        recommendations = data.get("recommendations")
+        if isinstance(recommendations, dict):
+            # Sometimes wrapped as {"recommendations": {"items": [...]}}
+            recommendations = next((v for v in recommendations.values() if isinstance(v, list)), None)
+        if isinstance(recommendations, list) and recommendations and all(isinstance(r, dict) for r in recommendations):
+            sections["recommendations"] = recommendations
+        return sections
+
+    @staticmethod
+    def _new_usage(mode: str) -> Dict[str, Any]:
+        return {"mode": mode, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def _finish_usage(self, usage: Dict[str, Any], start: float) -> Dict[str, Any]:
+        usage["latency_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        totals = self.usage_totals.setdefault(usage["mode"], {"requests": 0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_ms": 0.0})
+        totals["requests"] += 1
+        for key in ("calls", "prompt_tokens", "completion_tokens", "latency_ms"):
+            totals[key] += usage[key]
+        return usage
+
+    def _complete(self, prompt: str, report: str) -> str:
+        response = self.client.chat.completions.create(
+            model=self.deployment_name,
+            messages=[{"role": "user", "content": prompt}],
+            **REPORT_SETTINGS[report]
+        )
+        return response.choices[0].message.content.strip()
+
+    async def _complete_async(
+        self, prompt: str, report: str, timeout: float = LLM_CALL_TIMEOUT_SECONDS, json_mode: bool = False, usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        # JSON mode rather than a json_schema response_format: the latter needs a newer API version than the one pinned here
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = await asyncio.wait_for(
+            self.async_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=[{"role": "user", "content": prompt}],
+                **REPORT_SETTINGS[report],
+                **extra
+            ),
+            timeout,
+        )
+        if usage is not None:
+            usage["calls"] += 1
+            if response.usage is not None:
+                usage["prompt_tokens"] += response.usage.prompt_tokens
+                usage["completion_tokens"] += response.usage.completion_tokens
+        return response.choices[0].message.content.strip()
+
+    async def _stream_async(self, prompt: str, report: str) -> AsyncIterator[str]:
+        """Text deltas of one streamed completion."""
+        stream = await asyncio.wait_for(
+            self.async_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                **REPORT_SETTINGS[report]
+            ),
+            LLM_CALL_TIMEOUT_SECONDS,
+        )
+        try:
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), LLM_STREAM_IDLE_SECONDS)
+                except StopAsyncIteration:
+                    return
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # An idle timeout, a cancelled pump or an abandoned generator must hand the pooled connection back
+            await stream.close()
+
+    async def stream_comprehensive_report(self, technical_analysis: Dict[str, Any], use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """
+        The four reports as a stream of events, so a client can show text from the first token:
+        {"type": "start", "condition_score"}, then interleaved {"type": "token", "section", "text"}
+        and one {"type": "section", "section", "value", "fallback"} per finished section, then
+        {"type": "done", "first_token_ms", "latency_ms"}. Sections stream concurrently; one that
+        fails mid-way, or recommendations that do not parse, end with the fallback value and
+        "error", and a report with any fallback is not cached. Cached reports are sent as whole sections.
+        """
+        start = time.perf_counter()
+        condition_score = self._calculate_condition_score(technical_analysis)
+        yield {"type": "start", "condition_score": condition_score}
+
+        key = report_key(technical_analysis) if use_cache else None
+        cached = report_cache.get(key)[0] if key is not None else None
+        if cached is not None or not self.available or not self.async_client:
+            fallback = cached is None
+            reports = cached or self.fallback_reports(technical_analysis, condition_score)
+            for name in REPORT_SECTIONS:
+                yield {"type": "section", "section": name, "value": reports[name], "fallback": fallback}
+            yield {"type": "done", "cached": cached is not None, "first_token_ms": None, "latency_ms": round((time.perf_counter() - start) * 1000.0, 1)}
+            return
+
+        analysis_context = self._prepare_analysis_context(technical_analysis)
+        sections = {
+            "driver_report": ("driver", self._driver_prompt(analysis_context), lambda: self._generate_fallback_driver_report(technical_analysis)),
+            "passenger_report": ("passenger", self._passenger_prompt(analysis_context), lambda: self._generate_fallback_passenger_report(technical_analysis)),
+            "business_report": ("business", self._business_prompt(analysis_context), lambda: self._generate_fallback_business_report(technical_analysis)),
+            "recommendations": (
+                "recommendations",
+                self._recommendations_prompt(analysis_context, condition_score),
+                lambda: self._generate_enhanced_fallback_recommendations(analysis_context, condition_score),
+            ),
+        }
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def pump(name: str, report: str, prompt: str, fallback: Callable[[], Any]) -> None:
+            parts = []
+            texts = self._stream_async(prompt, report)
+            try:
+                try:
+                    async for text in texts:
+                        parts.append(text)
+                        await events.put({"type": "token", "section": name, "text": text})
+                finally:
+                    # Runs the stream's cleanup now rather than whenever the generator is collected
+                    await texts.aclose()
+                value = "".join(parts).strip()
+                if name == "recommendations":
+                    value = self._parse_recommendations(value)
+                event = {"type": "section", "section": name, "value": value, "fallback": False}
+            except Exception as e:
+                event = {"type": "section", "section": name, "value": fallback(), "fallback": True, "error": str(e) or type(e).__name__}
+            await events.put(event)
+
+        tasks = [asyncio.create_task(pump(name, *spec)) for name, spec in sections.items()]
+        result: Dict[str, Any] = {"condition_score": condition_score}
+        first_token_ms = None
+        try:
+            pending = len(tasks)
+            while pending:
+                event = await events.get()
+                if event["type"] == "token" and first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start) * 1000.0, 1)
+                if event["type"] == "section":
+                    pending -= 1
+                    result[event["section"]] = event["value"]
+                    if event["fallback"]:
+                        result.setdefault("fallback_sections", []).append({"section": event["section"], "error": event.get("error")})
+                yield event
+        finally:
+            # The client went away: stop paying for the remaining tokens
+            for task in tasks:
+                task.cancel()
+            # Let the cancelled pumps run their cleanup, which closes their HTTP streams
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if key is not None and not result.get("fallback_sections"):
+            report_cache.put(key, result)
+        yield {"type": "done", "cached": False, "first_token_ms": first_token_ms, "latency_ms": round((time.perf_counter() - start) * 1000.0, 1)}
+
     def _prepare_analysis_context(self, analysis: Dict[str, Any]) -> str:
         """Prepare comprehensive context for LLM analysis using ALL model data"""
         is_damaged = analysis.get("is_damaged", False)
@@ -248,9 +613,9 @@ class CarAnalysisLLMService:
         
         return interpretation
     
-    def _generate_driver_report(self, context: str) -> str:
-        """Generate empowering report for driver rating optimization using detailed analysis"""
-        prompt = f"""
+    def _driver_prompt(self, context: str) -> str:
+        """Prompt for the empowering driver report (rating optimization) using detailed analysis"""
+        return f"""
         Ты - ПЕРСОНАЛЬНЫЙ AI-КОНСУЛЬТАНТ водителя inDrive по заработку. Используй ДЕТАЛЬНЫЕ данные анализа.
 
         {context}
@@ -282,19 +647,13 @@ class CarAnalysisLLMService:
         Объем: до 150 слов.
         Формат: используй простые заголовки без markdown (например, "1. ТОЧНАЯ ДИАГНОСТИКА:", а не "#### 1. ...").
         """
-        
-        response = self.client.chat.completions.create(
-            model=self.deployment_name,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=350,
-            temperature=0.6
-        )
-        
-        return response.choices[0].message.content.strip()
+
+    def _generate_driver_report(self, context: str) -> str:
+        return self._complete(self._driver_prompt(context), "driver")
     
-    def _generate_passenger_report(self, context: str) -> str:
-        """Generate trust-building report for passenger safety and comfort"""
-        prompt = f"""
+    def _passenger_prompt(self, context: str) -> str:
+        """Prompt for the trust-building passenger report (safety and comfort)"""
+        return f"""
         Ты - AI-система безопасности inDrive. Создай краткий, но убедительный отчет для ПАССАЖИРА перед поездкой.
 
         {context}
@@ -317,19 +676,13 @@ class CarAnalysisLLMService:
         Формат: как уведомление в приложении для пассажира, без использования markdown.
         Объем: до 80 слов.
         """
-        
-        response = self.client.chat.completions.create(
-            model=self.deployment_name,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=200,
-            temperature=0.3
-        )
-        
-        return response.choices[0].message.content.strip()
+
+    def _generate_passenger_report(self, context: str) -> str:
+        return self._complete(self._passenger_prompt(context), "passenger")
     
-    def _generate_business_report(self, context: str) -> str:
-        """Generate strategic business report for management using precise technical data"""
-        prompt = f"""
+    def _business_prompt(self, context: str) -> str:
+        """Prompt for the strategic business report for management using precise technical data"""
+        return f"""
         Ты - ВЕДУЩИЙ АНАЛИТИК inDrive по качеству автопарка. Используй ТОЧНЫЕ технические данные.
 
         {context}
@@ -361,19 +714,13 @@ class CarAnalysisLLMService:
         Объем: до 180 слов.
         Формат: используй простые заголовки без markdown (например, "1. ТЕХНИЧЕСКАЯ ОЦЕНКА:", а не "#### 1. ...").
         """
-        
-        response = self.client.chat.completions.create(
-            model=self.deployment_name,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=400,
-            temperature=0.4
-        )
-        
-        return response.choices[0].message.content.strip()
+
+    def _generate_business_report(self, context: str) -> str:
+        return self._complete(self._business_prompt(context), "business")
     
-    def _generate_recommendations(self, context: str, score: int) -> list:
-        """Generate highly specific, actionable recommendations"""
-        prompt = f"""
+    def _recommendations_prompt(self, context: str, score: int) -> str:
+        """Prompt for highly specific, actionable recommendations"""
+        return f"""
         На основе анализа автомобиля (оценка {score}/100) создай конкретные рекомендации в формате JSON.
 
         {context}
@@ -404,24 +751,27 @@ class CarAnalysisLLMService:
 
         Только JSON массив, без дополнительного текста.
         """
-        
+
+    @staticmethod
+    def _parse_recommendations(recommendations_text: str) -> list:
+        """The recommendation objects of a response; raises ValueError so the caller records its fallback."""
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", recommendations_text.strip())
         try:
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=400,
-                temperature=0.4
-            )
-            
-            recommendations_text = response.choices[0].message.content.strip()
-            # Try to parse JSON, fallback to structured recommendations if fails
-            try:
-                import json
-                return json.loads(recommendations_text)
-            except:
-                # Fallback to enhanced structured recommendations
-                return self._generate_enhanced_fallback_recommendations(context, score)
-        except:
+            data = json.loads(text)
+        except ValueError:
+            start, end = text.find("["), text.rfind("]")
+            if start < 0 or end <= start:
+                raise ValueError("no JSON array in recommendations response")
+            data = json.loads(text[start:end + 1])
+        if not isinstance(data, list) or not data or not all(isinstance(r, dict) for r in data):
+            raise ValueError("recommendations response is not a list of objects")
+        return data
+
+    def _generate_recommendations(self, context: str, score: int) -> list:
+        """Generate highly specific, actionable recommendations"""
+        try:
+            return self._parse_recommendations(self._complete(self._recommendations_prompt(context, score), "recommendations"))
+        except Exception:
             return self._generate_enhanced_fallback_recommendations(context, score)
     
     def _calculate_condition_score(self, analysis: Dict[str, Any]) -> int:
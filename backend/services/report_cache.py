@@ -0,0 +1,156 @@
+"""
+Cache of LLM reports keyed on a quantized signature of the technical analysis.
+
+Most analyses fall into a handful of outcome patterns (intact and clean at high
+confidence, a dent on the front bumper, ...), and the reports for two analyses with
+the same pattern are interchangeable. The signature keeps the booleans and predicted
+labels and buckets every confidence into the bands the report prompts already use
+(>95 / >80 / >60 / below, see ``_add_confidence_interpretation``), so those analyses
+share one cache entry.
+
+Two tiers: an in-memory LRU (``REPORT_CACHE_SIZE``, default 512 entries) and, when
+``REPORT_CACHE_DIR`` is set, one JSON file per signature that survives restarts.
+The condition score is not cached; it is recomputed from the exact probabilities.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+# Bump when the prompts change, so disk entries written by older prompts are not served
+PROMPT_VERSION = 1
+
+# Upper band edges in percent, as in CarAnalysisLLMService._add_confidence_interpretation
+CONFIDENCE_BANDS = ((95, "critical"), (80, "high"), (60, "medium"))
+
+
+def confidence_band(prob: Optional[float]) -> Optional[str]:
+    if prob is None:
+        return None
+    percent = float(prob) * 100
+    for edge, band in CONFIDENCE_BANDS:
+        if percent > edge:
+            return band
+    return "low"
+
+
+def analysis_signature(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of the technical analysis the reports depend on, with confidences banded."""
+    damage = analysis.get("damage_local") or {}
+    parts = analysis.get("damage_parts_local") or {}
+    dirty = analysis.get("dirty") or {}
+    rust_scratch = analysis.get("rust_scratch") or {}
+    signature = {
+        "v": PROMPT_VERSION,
+        "is_damaged": bool(analysis.get("is_damaged")),
+        "damage": confidence_band(damage.get("damage_prob")) if "error" not in damage else "error",
+    }
+    if parts:
+        signature["part"] = parts.get("pred_label", "error" if "error" in parts else None)
+        signature["part_band"] = confidence_band(parts.get("pred_score"))
+    if dirty:
+        signature["dirty"] = dirty.get("pred_label", "error" if "error" in dirty else None)
+        signature["dirty_band"] = confidence_band(dirty.get("pred_score"))
+    if rust_scratch:
+        signature["type"] = rust_scratch.get("pred_label")
+        signature["type_band"] = confidence_band(rust_scratch.get("pred_score"))
+    return signature
+
+
+def report_key(analysis: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(analysis_signature(analysis), sort_keys=True).encode()).hexdigest()
+
+
+class ReportCache:
+    def __init__(self, maxsize: int = 512, directory: Optional[str] = None) -> None:
+        self.maxsize = maxsize
+        self.directory = directory
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_tokens = 0
+        self.saved_calls = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ReportCache":
+        return cls(int(os.getenv("REPORT_CACHE_SIZE", "512")), os.getenv("REPORT_CACHE_DIR") or None)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """(cached reports, tier) or (None, None)."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                tier = "memory"
+        if entry is None and self.directory:
+            try:
+                with open(self._path(key)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+                tier = "disk"
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+        usage = entry.get("usage") or {}
+        with self._lock:
+            self.saved_tokens += usage.get("total_tokens", 0)
+            self.saved_calls += usage.get("calls", 0)
+        return entry, tier
+
+    def put(self, key: str, reports: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remember(key, reports)
+            self.stores += 1
+        if self.directory:
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(reports, f, ensure_ascii=False)
+                os.replace(tmp, self._path(key))
+            except OSError as e:
+                print(f"Warning: could not write report cache entry: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "maxsize": self.maxsize,
+                "disk_dir": self.directory,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else None,
+                "stores": self.stores,
+                "saved_llm_calls": self.saved_calls,
+                "saved_tokens": self.saved_tokens,
+            }
+
+
+report_cache = ReportCache.from_env()
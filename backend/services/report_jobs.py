@@ -0,0 +1,80 @@
+"""
+LLM report generations that outlived their request.
+
+When ``/analyze-comprehensive`` hits its LLM deadline it answers with template reports
+and hands the still-running generation to ``report_jobs``. The task keeps running
+(the request only waited on a shielded view of it), and once done its full response is
+kept here for ``REPORT_JOB_TTL`` seconds (default 600) under the job id returned to the
+client. At most ``REPORT_JOBS_MAX`` (default 1000) finished jobs are kept.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class ReportJobs:
+    def __init__(self, maxsize: int = 1000, ttl: float = 600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._finished: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls) -> "ReportJobs":
+        return cls(int(os.getenv("REPORT_JOBS_MAX", "1000")), float(os.getenv("REPORT_JOB_TTL", "600")))
+
+    def submit(self, task: asyncio.Task, finish: Callable[[Any], Dict[str, Any]]) -> str:
+        """Track ``task``; ``finish`` turns its result into the response served for the job."""
+        job_id = uuid.uuid4().hex
+        # The event loop only keeps weak references to tasks; this one must outlive its request
+        self._pending[job_id] = task
+        self.submitted += 1
+        task.add_done_callback(lambda done: self._done(job_id, done, finish))
+        return job_id
+
+    def _done(self, job_id: str, task: asyncio.Task, finish: Callable[[Any], Dict[str, Any]]) -> None:
+        self._pending.pop(job_id, None)
+        entry: Dict[str, Any] = {"job_id": job_id, "finished_at": time.time(), "expires": time.monotonic() + self.ttl}
+        try:
+            entry.update(status="done", result=finish(task.result()))
+            self.completed += 1
+        except BaseException as e:  # includes CancelledError on shutdown
+            entry.update(status="failed", error=str(e) or type(e).__name__)
+            self.failed += 1
+        self._finished[job_id] = entry
+        while len(self._finished) > self.maxsize:
+            self._finished.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if job_id in self._pending:
+            return {"job_id": job_id, "status": "pending"}
+        entry = self._finished.get(job_id)
+        if entry is None or entry["expires"] < time.monotonic():
+            self._finished.pop(job_id, None)
+            return None
+        return {key: value for key, value in entry.items() if key != "expires"}
+
+    async def stop(self) -> None:
+        for task in list(self._pending.values()):
+            task.cancel()
+        await asyncio.gather(*self._pending.values(), return_exceptions=True)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "finished": len(self._finished),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "ttl": self.ttl,
+        }
+
+
+report_jobs = ReportJobs.from_env()
@@ -0,0 +1,455 @@
+"""
+Persistence of analysis results.
+
+Each analysis (image hash, model versions, per-model outputs, condition score,
+timings) is queued by the request handler and written in batches by a background
+task, so a request never waits on the database. ``DATABASE_URL`` picks the backend:
+``postgresql://...`` uses an asyncpg connection pool (what docker-compose runs),
+``sqlite:///path.db`` uses aiosqlite as a local stand-in; unset means
+``sqlite:///analyses.db``. If the database cannot be reached at startup (e.g. Postgres
+still booting) the writer keeps reconnecting with capped exponential backoff while records
+wait in the bounded queue; ``/storage`` shows the state and counters.
+
+History reads (``history`` / ``get``) are keyset-paginated on the primary key, backed
+by (filter column, id) indexes, and go through a small TTL cache that is invalidated
+for the affected vehicle / driver / image whenever a batch is written.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+DEFAULT_DATABASE_URL = "sqlite:///analyses.db"
+
+# Columns the history endpoints may filter on
+HISTORY_FIELDS = ("vehicle_id", "driver_id", "image_hash")
+_HISTORY_INDEXES = [f"CREATE INDEX IF NOT EXISTS analyses_{name}_idx ON analyses ({name}, id DESC)" for name in HISTORY_FIELDS]
+
+# (version, postgres statements, sqlite statements), applied in order and recorded in schema_migrations
+MIGRATIONS: List[Tuple[int, List[str], List[str]]] = [
+    (
+        1,
+        [
+            """CREATE TABLE IF NOT EXISTS analyses (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ NOT NULL,
+                endpoint TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                vehicle_id TEXT,
+                driver_id TEXT,
+                model_versions JSONB NOT NULL,
+                outputs JSONB NOT NULL,
+                condition_score REAL,
+                timings JSONB NOT NULL
+            )""",
+        ],
+        [
+            """CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                vehicle_id TEXT,
+                driver_id TEXT,
+                model_versions TEXT NOT NULL,
+                outputs TEXT NOT NULL,
+                condition_score REAL,
+                timings TEXT NOT NULL
+            )""",
+        ],
+    ),
+    # Same DDL in both dialects: each history filter walks its own index newest-first
+    (2, _HISTORY_INDEXES, _HISTORY_INDEXES),
+]
+
+COLUMNS = ("created_at", "endpoint", "image_hash", "vehicle_id", "driver_id", "model_versions", "outputs", "condition_score", "timings")
+JSON_COLUMNS = {"model_versions", "outputs", "timings"}
+
+INSERT_SQL = f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({', '.join(f'${i}' for i in range(1, len(COLUMNS) + 1))})"
+
+
+@dataclass
+class AnalysisRecord:
+    endpoint: str
+    image_hash: str
+    outputs: Dict[str, Any]
+    model_versions: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    condition_score: Optional[float] = None
+    vehicle_id: Optional[str] = None
+    driver_id: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def row(self) -> tuple:
+        return tuple(_finite(getattr(self, column)) for column in COLUMNS)
+
+
+def _finite(value: Any) -> Any:
+    """``value`` with NaN / inf floats replaced by None: JSONB rejects them, which would fail the whole batch."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def _serialize(row: Dict[str, Any]) -> Dict[str, Any]:
+    created_at = row.get("created_at")
+    if isinstance(created_at, datetime):
+        row["created_at"] = created_at.isoformat()
+    return row
+
+
+class TTLCache:
+    """LRU dict whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key: tuple, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[tuple], bool]) -> None:
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def status(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else None}
+
+
+class PostgresBackend:
+    dialect = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 5) -> None:
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def connect(self) -> None:
+        import asyncpg
+
+        async def init(conn):
+            # JSONB columns take and return plain dicts
+            await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size, init=init)
+
+    async def execute(self, sql: str, *args) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute(sql, *args)
+
+    async def executemany(self, sql: str, rows: Sequence[tuple]) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(sql, rows)
+
+    async def fetch(self, sql: str, *args) -> List[Dict[str, Any]]:
+        async with self.pool.acquire() as conn:
+            return [dict(row) for row in await conn.fetch(sql, *args)]
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+
+class SQLiteBackend:
+    """Single aiosqlite connection (its own thread); same SQL as Postgres with ``$n`` rewritten to ``?``."""
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn = None
+
+    async def connect(self) -> None:
+        import aiosqlite
+
+        self.conn = await aiosqlite.connect(self.path)
+        self.conn.row_factory = aiosqlite.Row
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+
+    @staticmethod
+    def _sql(sql: str) -> str:
+        return re.sub(r"\$\d+", "?", sql)
+
+    @staticmethod
+    def _param(value: Any) -> Any:
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    async def execute(self, sql: str, *args) -> None:
+        await self.conn.execute(self._sql(sql), [self._param(a) for a in args])
+        await self.conn.commit()
+
+    async def executemany(self, sql: str, rows: Sequence[tuple]) -> None:
+        await self.conn.executemany(self._sql(sql), [[self._param(v) for v in row] for row in rows])
+        await self.conn.commit()
+
+    async def fetch(self, sql: str, *args) -> List[Dict[str, Any]]:
+        async with self.conn.execute(self._sql(sql), [self._param(a) for a in args]) as cursor:
+            rows = [dict(row) for row in await cursor.fetchall()]
+        for row in rows:
+            for column in JSON_COLUMNS & row.keys():
+                if isinstance(row[column], str):
+                    row[column] = json.loads(row[column])
+        return rows
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
+
+
+def backend_for(url: str):
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresBackend(url, int(os.getenv("STORAGE_POOL_MIN", "1")), int(os.getenv("STORAGE_POOL_MAX", "5")))
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):] or ":memory:")
+    raise ValueError(f"Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
+
+
+async def migrate(backend) -> List[int]:
+    """Apply pending MIGRATIONS; returns the versions applied."""
+    await backend.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)")
+    done = {row["version"] for row in await backend.fetch("SELECT version FROM schema_migrations")}
+    applied = []
+    for version, postgres, sqlite in MIGRATIONS:
+        if version in done:
+            continue
+        for statement in (postgres if backend.dialect == "postgres" else sqlite):
+            await backend.execute(statement)
+        await backend.execute("INSERT INTO schema_migrations (version) VALUES ($1)", version)
+        applied.append(version)
+    return applied
+
+
+class AnalysisStore:
+    """Queue of AnalysisRecords drained in batches by one background writer task."""
+
+    def __init__(
+        self, url: str, batch_size: int = 100, flush_seconds: float = 0.5, queue_size: int = 10000, cache_size: int = 1024, cache_ttl: float = 30.0,
+        retry_max_seconds: float = 30.0,
+    ) -> None:
+        self.url = url
+        self.retry_max_seconds = retry_max_seconds
+        self.connect_attempts = 0
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue_size = queue_size
+        self.backend = None
+        self.queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self.error: Optional[str] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.cache = TTLCache(cache_size, cache_ttl)
+
+    @classmethod
+    def from_env(cls) -> "AnalysisStore":
+        return cls(
+            os.getenv("DATABASE_URL") or DEFAULT_DATABASE_URL,
+            batch_size=int(os.getenv("STORAGE_BATCH_SIZE", "100")),
+            flush_seconds=float(os.getenv("STORAGE_FLUSH_SECONDS", "0.5")),
+            queue_size=int(os.getenv("STORAGE_QUEUE_SIZE", "10000")),
+            cache_size=int(os.getenv("HISTORY_CACHE_SIZE", "1024")),
+            cache_ttl=float(os.getenv("HISTORY_CACHE_TTL", "30")),
+            retry_max_seconds=float(os.getenv("STORAGE_RETRY_MAX_SECONDS", "30")),
+        )
+
+    @property
+    def available(self) -> bool:
+        """Connected and migrated; records queued before that are written once it is."""
+        return self._writer_task is not None and self.backend is not None
+
+    async def start(self) -> None:
+        """Start accepting records; connecting (with retries) happens in the writer task."""
+        try:
+            backend_for(self.url)
+        except ValueError as e:
+            # A malformed URL will not fix itself
+            self.error = str(e)
+            print(f"Warning: analysis storage unavailable ({e}); results will not be persisted")
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writer_task = asyncio.create_task(self._writer(self.queue))
+
+    async def _connect(self) -> None:
+        """Connect and migrate, retrying with capped, jittered exponential backoff until it succeeds."""
+        delay = 0.5
+        while True:
+            self.connect_attempts += 1
+            backend = backend_for(self.url)
+            try:
+                await backend.connect()
+                await migrate(backend)
+            except Exception as e:
+                self.error = str(e)
+                print(f"Warning: analysis storage unavailable ({e}); retrying in {delay:.1f}s")
+                await backend.close()
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.retry_max_seconds)
+                continue
+            self.backend = backend
+            self.error = None
+            return
+
+    def record(self, record: AnalysisRecord) -> bool:
+        """Queue a record for writing; never blocks. False when storage is off or the queue is full."""
+        if self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _writer(self, queue: asyncio.Queue) -> None:
+        """Write up to batch_size records at a time, waiting at most flush_seconds to fill a batch; None stops it."""
+        loop = asyncio.get_running_loop()
+        await self._connect()
+        while True:
+            record = await queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    await self._flush(batch)
+                    return
+                batch.append(record)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[AnalysisRecord]) -> None:
+        start = time.perf_counter()
+        try:
+            await self.backend.executemany(INSERT_SQL, [record.row() for record in batch])
+            self.written += len(batch)
+            # Cached history pages for these vehicles / drivers / images are now stale
+            touched = {(name, getattr(record, name)) for record in batch for name in HISTORY_FIELDS}
+            self.cache.invalidate(lambda key: key[:2] in touched)
+        except Exception as e:
+            self.failed += len(batch)
+            self.error = str(e)
+            print(f"Warning: failed to write {len(batch)} analyses: {e}")
+        self.batches += 1
+        self.write_seconds += time.perf_counter() - start
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush whatever is still queued (connecting first if need be, for at most ``timeout`` seconds), then close the backend."""
+        if self._writer_task is None:
+            return
+        queue, self.queue = self.queue, None  # no new records from here on
+
+        async def drain():
+            await queue.put(None)
+            await self._writer_task
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            # The database never came up: what is still queued is lost
+            self._writer_task.cancel()
+            await asyncio.gather(self._writer_task, return_exceptions=True)
+            while not queue.empty():
+                self.dropped += queue.get_nowait() is not None
+        self._writer_task = None
+        if self.backend is not None:
+            await self.backend.close()
+
+    async def history(self, field_name: str, value: str, before: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        """Analyses with ``field_name == value``, newest first; pass ``next_before`` back as ``before`` for the next page."""
+        if field_name not in HISTORY_FIELDS:
+            raise ValueError(f"Cannot filter history on {field_name!r}")
+        key = (field_name, value, before, limit)
+        hit, page = self.cache.get(key)
+        if hit:
+            return page
+        # One extra row tells whether another page exists
+        if before is None:
+            rows = await self.backend.fetch(f"SELECT * FROM analyses WHERE {field_name} = $1 ORDER BY id DESC LIMIT $2", value, limit + 1)
+        else:
+            rows = await self.backend.fetch(
+                f"SELECT * FROM analyses WHERE {field_name} = $1 AND id < $2 ORDER BY id DESC LIMIT $3", value, before, limit + 1,
+            )
+        items = [_serialize(row) for row in rows[:limit]]
+        page = {"items": items, "next_before": items[-1]["id"] if len(rows) > limit else None}
+        self.cache.put(key, page)
+        return page
+
+    async def get(self, analysis_id: int) -> Optional[Dict[str, Any]]:
+        key = ("id", analysis_id)
+        hit, row = self.cache.get(key)
+        if hit:
+            return row
+        rows = await self.backend.fetch("SELECT * FROM analyses WHERE id = $1", analysis_id)
+        row = _serialize(rows[0]) if rows else None
+        if row is not None:
+            # Stored analyses never change, so only eviction / TTL drops these
+            self.cache.put(key, row)
+        return row
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "connecting": self._writer_task is not None and self.backend is None,
+            "connect_attempts": self.connect_attempts,
+            "backend": self.backend.dialect if self.backend is not None else None,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_ms": round(self.write_seconds / self.batches * 1000.0, 2) if self.batches else None,
+            "error": self.error,
+            "history_cache": self.cache.status(),
+        }
+
+
+storage = AnalysisStore.from_env()
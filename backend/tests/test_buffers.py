@@ -0,0 +1,93 @@
+"""Pooled input buffers must never be shared by two batches in flight."""
+
+import threading
+
+import pytest
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+from inference.batching import run_batch
+from inference.buffers import BUCKETS, BufferPool
+from inference.config import override
+
+
+class HoldsInput(nn.Module):
+    """Waits for the other batch to be built and run before reading its own input."""
+
+    def __init__(self, barrier: threading.Barrier) -> None:
+        super().__init__()
+        self.barrier = barrier
+        self.seen = {}
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        before = x.clone()
+        self.barrier.wait(timeout=10)
+        self.barrier.wait(timeout=10)
+        self.seen[threading.current_thread().name] = torch.equal(before, x)
+        return x.float().mean(dim=(2, 3))[:, :2]
+
+
+def test_threads_get_their_own_buffers():
+    pool = BufferPool()
+    first_ready, second_done = threading.Event(), threading.Event()
+    intact = {}
+
+    def first() -> None:
+        buf = pool.get(3, (3, 8, 8), torch.float32).fill_(1)
+        first_ready.set()
+        second_done.wait(timeout=10)
+        intact["first"] = bool((buf == 1).all())
+
+    def second() -> None:
+        first_ready.wait(timeout=10)
+        pool.get(3, (3, 8, 8), torch.float32).fill_(2)
+        second_done.set()
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert intact == {"first": True}
+
+
+def test_distinct_keys_never_share_storage():
+    pool = BufferPool()
+    buffers = [
+        pool.get(3, (3, 8, 8), torch.float32),
+        pool.get(3, (3, 8, 8), torch.uint8),
+        pool.get(3, (3, 16, 16), torch.float32),
+        pool.get(5, (3, 8, 8), torch.float32),
+    ]
+    with torch.inference_mode():
+        buffers.append(pool.get(3, (3, 8, 8), torch.float32))
+    assert len({b.untyped_storage().data_ptr() for b in buffers}) == len(buffers)
+    # Past the largest bucket every batch gets its own tensor
+    n = BUCKETS[-1] + 1
+    assert pool.get(n, (3, 8, 8), torch.float32).data_ptr() != pool.get(n, (3, 8, 8), torch.float32).data_ptr()
+
+
+@pytest.mark.parametrize("preprocess", ["pil", "tensor"])
+def test_concurrent_batches_keep_their_inputs(preprocess):
+    barrier = threading.Barrier(2)
+    model = HoldsInput(barrier).eval()
+    tf = transforms.Compose([transforms.Resize((16, 16)), transforms.ToTensor()])
+    colors = {"red": (255, 0, 0), "green": (0, 255, 0)}
+    probs = {}
+
+    def predict(name: str) -> None:
+        images = [Image.new("RGB", (40, 30), colors[name])] * 3
+        probs[name] = run_batch(model, tf, images, "cpu")[0]
+
+    with override(preprocess=preprocess, reuse_buffers="on"):
+        threads = [threading.Thread(target=predict, args=(name,), name=name) for name in colors]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert model.seen == {"red": True, "green": True}
+    # Each batch's outputs come from its own images
+    assert bool((probs["red"][:, 0] > probs["red"][:, 1]).all())
+    assert bool((probs["green"][:, 0] < probs["green"][:, 1]).all())
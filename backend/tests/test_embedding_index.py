@@ -0,0 +1,83 @@
+"""Photo index matching: different photos must not match, even though pooled features all look alike."""
+
+import numpy as np
+import torch
+
+from inference import embedding_index
+from inference.embedding_index import EmbeddingIndex, PhotoIndex
+from tools.calibrate_photo_index import pair_scores, pick_duplicate_threshold
+
+
+DIM = 256
+
+
+def pooled_features(rng: np.random.Generator, count: int) -> np.ndarray:
+    """Non-negative, ReLU-pooled-like features: a large shared component plus a small per-photo one."""
+    shared = rng.uniform(0.5, 1.5, DIM)
+    return np.maximum(shared + 0.15 * rng.standard_normal((count, DIM)), 0.0).astype(np.float32)
+
+
+def near_copy(rng: np.random.Generator, features: np.ndarray) -> np.ndarray:
+    return np.maximum(features + 0.01 * rng.standard_normal(features.shape), 0.0).astype(np.float32)
+
+
+def uncalibrated(monkeypatch, tmp_path) -> PhotoIndex:
+    monkeypatch.setattr(embedding_index, "calibration_path", lambda: str(tmp_path / "photo_index.json"))
+    return PhotoIndex()
+
+
+def test_raw_cosine_cannot_tell_different_photos_apart():
+    features = pooled_features(np.random.default_rng(0), 2)
+    a, b = features / np.linalg.norm(features, axis=1, keepdims=True)
+    # The failure mode the calibration exists for
+    assert float(a @ b) > 0.97
+
+
+def test_uncalibrated_index_only_reuses_identical_uploads(monkeypatch, tmp_path):
+    index = uncalibrated(monkeypatch, tmp_path)
+    first, other = pooled_features(np.random.default_rng(1), 2)
+    index.add(torch.from_numpy(first), {"car": "first"}, "hash-first")
+
+    assert index.lookup(torch.from_numpy(other), "hash-other") is None
+    assert index.lookup(torch.from_numpy(near_copy(np.random.default_rng(2), first)), "hash-copy") is None
+    photo_id, payload, reuse = index.lookup(torch.from_numpy(first), "hash-first")
+    assert payload["result"] == {"car": "first"}
+    assert reuse["exact_match"]
+
+
+def test_calibrated_index_matches_near_copies_not_other_photos():
+    rng = np.random.default_rng(3)
+    fit, held = pooled_features(rng, 200), pooled_features(rng, 60)
+    center = fit.mean(axis=0)
+    copies = np.stack([near_copy(rng, x) for x in held])
+    scores = pair_scores(held, copies, np.arange(len(held)), center)
+    calibration = pick_duplicate_threshold(scores["positive"], scores["negative"], 0.0)
+    assert calibration["false_match_rate"] == 0.0
+    assert calibration["true_match_rate"] == 1.0
+
+    index = PhotoIndex({**calibration, "center": center})
+    for i, features in enumerate(held[:30]):
+        index.add(torch.from_numpy(features), {"photo": i}, f"hash-{i}")
+    for i, features in enumerate(held[30:]):
+        assert index.lookup(torch.from_numpy(features), f"other-{i}") is None
+    _, payload, reuse = index.lookup(torch.from_numpy(copies[7]), "recompressed")
+    assert payload["result"] == {"photo": 7}
+    assert not reuse["exact_match"]
+
+
+def test_threshold_respects_false_match_budget():
+    rng = np.random.default_rng(4)
+    negative = rng.uniform(-0.2, 0.9, 10000)
+    positive = rng.uniform(0.85, 1.0, 100)
+    result = pick_duplicate_threshold(positive, negative, 1e-3)
+    assert result["false_match_rate"] <= 1e-3
+    assert (negative >= result["threshold"]).sum() <= 10
+
+
+def test_default_size_fits_the_container(monkeypatch, tmp_path):
+    index = uncalibrated(monkeypatch, tmp_path)
+    index.index = EmbeddingIndex(dim=1280)
+    # float16 rows, doubled while growing: well inside the api container's 4 GB
+    assert index.max_entries() * 1280 * 2 * 2 <= 256 * 2 ** 20
+    monkeypatch.setenv("INFERENCE_PHOTO_INDEX_MAX", "10")
+    assert index.max_entries() == 10
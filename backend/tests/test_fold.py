@@ -0,0 +1,64 @@
+"""Normalization folded into the first conv must reproduce the unfolded model, borders included."""
+
+import pytest
+import torch
+import torch.nn as nn
+from torchvision import transforms
+
+from inference.config import override
+from inference.fold import FoldedConv, fold_normalization
+
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+SIZE = 32
+
+
+def make_model(bias: bool) -> nn.Module:
+    torch.manual_seed(0)
+    return nn.Sequential(
+        nn.Conv2d(3, 8, 3, stride=2, padding=1, bias=bias), nn.ReLU(),
+        nn.Conv2d(8, 4, 3, padding=1), nn.AdaptiveAvgPool2d(1), nn.Flatten(),
+    ).eval()
+
+
+def normalize(x: torch.Tensor) -> torch.Tensor:
+    return transforms.functional.normalize(x, MEAN, STD)
+
+
+@pytest.mark.parametrize("bias", [True, False])
+@pytest.mark.parametrize("size", [SIZE, 40])
+def test_folded_conv_matches_every_output_pixel(bias, size):
+    conv = make_model(bias)[0]
+    folded = FoldedConv(conv, MEAN, STD, 1.0, SIZE)
+    x = torch.rand(2, 3, size, size, generator=torch.Generator().manual_seed(1))
+    with torch.no_grad():
+        expected, actual = conv(normalize(x)), folded(x)
+    # Padded taps see the mean image, not zero: the outer ring is where a constant bias would be wrong
+    torch.testing.assert_close(actual[..., 0, :], expected[..., 0, :], rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(actual[..., :, -1], expected[..., :, -1], rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(actual, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_border_needs_the_bias_map():
+    conv = make_model(True)[0]
+    folded = FoldedConv(conv, MEAN, STD, 1.0, SIZE)
+    interior_bias = folded.bias_map[..., SIZE // 4, SIZE // 4]
+    assert not torch.allclose(folded.bias_map[..., 0, 0], interior_bias)
+
+
+@pytest.mark.parametrize("mode, scale", [("unit", 1.0), ("uint8", 255.0)])
+def test_folded_model_matches_unfolded(mode, scale):
+    tf = transforms.Compose([transforms.Resize((SIZE, SIZE)), transforms.ToTensor(), transforms.Normalize(MEAN, STD)])
+    x = torch.rand(3, 3, SIZE, SIZE, generator=torch.Generator().manual_seed(2))
+    if mode == "uint8":
+        x = (x * 255).round() / 255
+    with torch.no_grad():
+        expected = make_model(True)(normalize(x))
+    with override(fold_normalization=mode):
+        model, folded_tf = fold_normalization(make_model(True), tf, "test", SIZE)
+    assert isinstance(model[0], FoldedConv)
+    assert not any(isinstance(t, transforms.Normalize) for t in folded_tf.transforms)
+    inputs = (x * 255).round().to(torch.uint8) if mode == "uint8" else x
+    with torch.no_grad():
+        torch.testing.assert_close(model(inputs), expected, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,42 @@
+"""The dirty model sees uploads re-encoded as JPEG q90, as it always has."""
+
+import io
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+from inference.inference_dirty import JPEG_QUALITY, predict_batch, reencode_jpeg
+
+
+def png_upload() -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 256, (96, 128, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def baseline_input(upload: bytes) -> Image.Image:
+    """What the original endpoint fed the model: the upload saved as JPEG q90 and read back."""
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(upload)).convert("RGB").save(buf, format="JPEG", quality=90)
+    buf.seek(0)
+    return Image.open(buf).convert("RGB")
+
+
+def test_predictions_match_the_reencoded_upload():
+    torch.manual_seed(0)
+    model = nn.Sequential(nn.Conv2d(3, 4, 3), nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(4, 2)).eval()
+    tf = transforms.Compose([transforms.Resize((32, 32)), transforms.ToTensor()])
+    upload = png_upload()
+    with torch.inference_mode():
+        expected = torch.softmax(model(tf(baseline_input(upload)).unsqueeze(0)), dim=1)[0]
+    result = predict_batch(model, tf, [upload], {0: "clean", 1: "dirty"}, 1, device="cpu")[0]
+    assert JPEG_QUALITY == 90
+    assert torch.allclose(torch.tensor(result["probs"]), expected, atol=1e-6)
+
+
+def test_undecodable_input_is_left_for_the_batch_to_report():
+    assert reencode_jpeg(b"not an image") == b"not an image"
@@ -0,0 +1,100 @@
+"""Report generation around malformed LLM output: what is parsed, what falls back, and what gets cached."""
+
+import asyncio
+
+import pytest
+
+from services import llm_service as llm_service_module
+from services.llm_service import CarAnalysisLLMService
+
+
+RECOMMENDATIONS = '[{"priority": "high", "action": "Замените лобовое стекло"}]'
+
+
+@pytest.mark.parametrize("text", [
+    RECOMMENDATIONS,
+    "```json\n" + RECOMMENDATIONS + "\n```",
+    "```\n" + RECOMMENDATIONS + "\n```",
+    "Вот рекомендации:\n" + RECOMMENDATIONS,
+])
+def test_recommendations_are_parsed(text):
+    assert CarAnalysisLLMService._parse_recommendations(text) == [{"priority": "high", "action": "Замените лобовое стекло"}]
+
+
+@pytest.mark.parametrize("text", ["Рекомендации недоступны", "[]", '{"action": "x"}', '["x"]', "```json\n[{\"a\": 1}\n```"])
+def test_malformed_recommendations_raise(text):
+    with pytest.raises(ValueError):
+        CarAnalysisLLMService._parse_recommendations(text)
+
+
+ANALYSIS = {"damage": {"is_damaged": True, "confidence": 0.9}}
+
+
+def llm_service(monkeypatch, responses) -> CarAnalysisLLMService:
+    """A service whose completions return ``responses[report]``, with an isolated report cache."""
+    cache = {}
+    monkeypatch.setattr(llm_service_module.report_cache, "get", lambda key: (cache.get(key), "memory" if key in cache else None))
+    monkeypatch.setattr(llm_service_module.report_cache, "put", lambda key, value: cache.__setitem__(key, value))
+    service = CarAnalysisLLMService()
+    service.available = True
+    service.async_client = object()
+
+    async def complete(prompt, report, **kwargs):
+        return responses[report]
+
+    monkeypatch.setattr(service, "_complete_async", complete)
+    service.cache = cache
+    return service
+
+
+PARALLEL_OK = {"driver": "Водителю", "passenger": "Пассажиру", "business": "Бизнесу", "recommendations": RECOMMENDATIONS}
+
+
+def test_parallel_records_malformed_recommendations(monkeypatch):
+    service = llm_service(monkeypatch, {**PARALLEL_OK, "recommendations": "Извините, не могу"})
+    result = asyncio.run(service.generate_comprehensive_report_async(ANALYSIS, mode="parallel"))
+    assert [f["section"] for f in result["fallback_sections"]] == ["recommendations"]
+    assert result["recommendations"]
+    assert result["driver_report"] == "Водителю"
+    assert not service.cache
+
+    service = llm_service(monkeypatch, PARALLEL_OK)
+    result = asyncio.run(service.generate_comprehensive_report_async(ANALYSIS, mode="parallel"))
+    assert "fallback_sections" not in result
+    assert len(service.cache) == 1
+
+
+@pytest.mark.parametrize("combined, failed", [
+    ('{"driver_report": "a", "passenger_report": "b", "business_report": "c", "recommendations": "нет"}', ["recommendations"]),
+    ('{"report": "everything in one string"}', ["driver_report", "passenger_report", "business_report", "recommendations"]),
+    ("not json at all", ["combined"]),
+])
+def test_combined_records_malformed_sections(monkeypatch, combined, failed):
+    service = llm_service(monkeypatch, {"combined": combined})
+    result = asyncio.run(service.generate_comprehensive_report_async(ANALYSIS, mode="combined"))
+    assert [f["section"] for f in result["fallback_sections"]] == failed
+    assert all(result[name] for name in ("driver_report", "passenger_report", "business_report", "recommendations"))
+    assert not service.cache
+
+
+def test_stream_emits_malformed_recommendations_as_fallback(monkeypatch):
+    service = llm_service(monkeypatch, {})
+
+    async def stream(prompt, report):
+        text = "Извините, не могу" if report == "recommendations" else PARALLEL_OK[report]
+        for word in text.split(" "):
+            yield word + " "
+
+    monkeypatch.setattr(service, "_stream_async", stream)
+
+    async def collect():
+        return [event async for event in service.stream_comprehensive_report(ANALYSIS)]
+
+    events = asyncio.run(collect())
+    sections = {e["section"]: e for e in events if e["type"] == "section"}
+    assert sections["recommendations"]["fallback"]
+    assert "JSON" in sections["recommendations"]["error"]
+    assert isinstance(sections["recommendations"]["value"], list)
+    assert not sections["driver_report"]["fallback"]
+    assert events[-1]["type"] == "done"
+    assert not service.cache
@@ -0,0 +1,66 @@
+"""The batched uint8 Preprocessor against the torchvision transform pipeline it replaces."""
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from inference.preprocess import Preprocessor
+
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+SIZE = (224, 224)
+
+
+def random_image(rng: np.random.Generator, height: int, width: int) -> Image.Image:
+    # Pixel noise is the worst case for resampling differences; photos are smoother
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def in_levels(actual: torch.Tensor, expected: torch.Tensor) -> torch.Tensor:
+    """Absolute difference of two normalized batches in uint8 levels."""
+    return (actual - expected).abs() * torch.tensor(STD).view(1, 3, 1, 1) * 255
+
+
+def test_matches_the_transform_pipeline():
+    tf = transforms.Compose([transforms.Resize(SIZE), transforms.ToTensor(), transforms.Normalize(MEAN, STD)])
+    rng = np.random.default_rng(0)
+    # Downscaled, same size (no resize), upscaled, and a repeated size batched in one interpolate call
+    images = [random_image(rng, h, w) for h, w in [(480, 640), (224, 224), (100, 150), (480, 640), (1000, 333)]]
+    expected = torch.stack([tf(img) for img in images])
+    actual = Preprocessor.from_transform(tf)(images)
+    assert actual.shape == expected.shape and actual.dtype == torch.float32
+
+    diff = in_levels(actual, expected)
+    # Antialiased bilinear in torch and in PIL round a few pixels differently, by at most one level
+    assert float(diff.max()) <= 1.0 + 1e-3
+    assert float((diff > 0.5).float().mean()) < 0.01
+    torch.testing.assert_close(actual[1], expected[1], rtol=0, atol=1e-5)
+
+
+def test_uint8_pipeline_matches_pil_to_tensor():
+    tf = transforms.Compose([transforms.Resize(SIZE), transforms.PILToTensor()])
+    images = [random_image(np.random.default_rng(1), 300, 400), random_image(np.random.default_rng(2), 224, 224)]
+    expected = torch.stack([tf(img) for img in images])
+    actual = Preprocessor.from_transform(tf)(images)
+    assert actual.dtype == torch.uint8
+    assert int((actual.int() - expected.int()).abs().max()) <= 1
+    assert torch.equal(actual[1], expected[1])
+
+
+def test_tensor_decoder_output_matches_pil_input():
+    tf = transforms.Compose([transforms.Resize(SIZE), transforms.ToTensor(), transforms.Normalize(MEAN, STD)])
+    image = random_image(np.random.default_rng(3), 320, 240)
+    pre = Preprocessor.from_transform(tf)
+    from_pil = pre([image]).clone()
+    from_tensor = pre([transforms.functional.pil_to_tensor(image)])
+    torch.testing.assert_close(from_tensor, from_pil, rtol=0, atol=0)
+
+
+def test_unsupported_transforms_are_rejected():
+    with pytest.raises(ValueError):
+        Preprocessor.from_transform(transforms.Compose([transforms.Resize(224), transforms.ToTensor()]))
+    with pytest.raises(ValueError):
+        Preprocessor.from_transform(transforms.Compose([transforms.Resize(SIZE), transforms.CenterCrop(200), transforms.ToTensor()]))
@@ -0,0 +1,169 @@
+"""AnalysisStore against the aiosqlite backend: migrations, batched writes, history paging and its cache."""
+
+import asyncio
+import math
+import time
+
+from services.storage import MIGRATIONS, AnalysisRecord, AnalysisStore, SQLiteBackend, TTLCache, migrate
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_store(path, **kwargs) -> AnalysisStore:
+    kwargs.setdefault("flush_seconds", 0.05)
+    return AnalysisStore(f"sqlite:///{path}", **kwargs)
+
+
+def record(vehicle_id="car-1", driver_id="driver-1", image_hash="hash-1", outputs=None) -> AnalysisRecord:
+    return AnalysisRecord(
+        endpoint="analyze", image_hash=image_hash, outputs=outputs or {"is_damaged": False},
+        vehicle_id=vehicle_id, driver_id=driver_id, timings={"total_ms": 1.0},
+    )
+
+
+async def wait_written(store: AnalysisStore, count: int, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while store.written + store.failed < count:
+        assert time.monotonic() < deadline, store.status()
+        await asyncio.sleep(0.01)
+
+
+def test_migrations_apply_once(tmp_path):
+    async def scenario():
+        backend = SQLiteBackend(str(tmp_path / "analyses.db"))
+        await backend.connect()
+        try:
+            assert await migrate(backend) == [version for version, _, _ in MIGRATIONS]
+            assert await migrate(backend) == []
+            indexes = {row["name"] for row in await backend.fetch("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            assert {"analyses_vehicle_id_idx", "analyses_driver_id_idx", "analyses_image_hash_idx"} <= indexes
+        finally:
+            await backend.close()
+
+    run(scenario())
+
+
+def test_writer_batches_and_flushes_on_stop(tmp_path):
+    async def scenario():
+        store = make_store(tmp_path / "analyses.db", batch_size=3)
+        await store.start()
+        for _ in range(7):
+            assert store.record(record())
+        await store.stop()
+        assert store.written == 7
+        assert store.failed == 0
+        # Everything was queued before the first write: 3 + 3 + 1
+        assert store.batches == 3
+        assert not store.record(record())
+
+        reopened = make_store(tmp_path / "analyses.db")
+        await reopened.start()
+        while not reopened.available:
+            await asyncio.sleep(0.01)
+        page = await reopened.history("vehicle_id", "car-1", limit=100)
+        await reopened.stop()
+        assert len(page["items"]) == 7
+
+    run(scenario())
+
+
+def test_history_keyset_pagination(tmp_path):
+    async def scenario():
+        store = make_store(tmp_path / "analyses.db")
+        await store.start()
+        for i in range(5):
+            store.record(record(vehicle_id="car-1", image_hash=f"hash-{i}"))
+        store.record(record(vehicle_id="car-2"))
+        await wait_written(store, 6)
+
+        ids, before, pages = [], None, 0
+        while True:
+            page = await store.history("vehicle_id", "car-1", before=before, limit=2)
+            pages += 1
+            ids.extend(item["id"] for item in page["items"])
+            assert all(item["vehicle_id"] == "car-1" for item in page["items"])
+            before = page["next_before"]
+            if before is None:
+                break
+        await store.stop()
+        assert pages == 3
+        assert ids == sorted(ids, reverse=True)
+        assert len(set(ids)) == 5
+        assert page["items"][0]["outputs"] == {"is_damaged": False}
+
+    run(scenario())
+
+
+def test_history_cache_invalidated_by_writes(tmp_path):
+    async def scenario():
+        store = make_store(tmp_path / "analyses.db")
+        await store.start()
+        store.record(record(driver_id="driver-1"))
+        await wait_written(store, 1)
+
+        first = await store.history("driver_id", "driver-1")
+        assert await store.history("driver_id", "driver-1") is first
+        assert store.cache.hits == 1
+        other = await store.history("driver_id", "driver-2")
+
+        store.record(record(driver_id="driver-1"))
+        await wait_written(store, 2)
+        refreshed = await store.history("driver_id", "driver-1")
+        assert len(refreshed["items"]) == 2
+        # Pages of untouched drivers stay cached
+        assert await store.history("driver_id", "driver-2") is other
+        await store.stop()
+
+    run(scenario())
+
+
+def test_ttl_cache_expiry_and_lru():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.put(("a",), 1)
+    cache.put(("b",), 2)
+    assert cache.get(("a",)) == (True, 1)
+    cache.put(("c",), 3)
+    # "b" was least recently used
+    assert cache.get(("b",)) == (False, None)
+    time.sleep(0.06)
+    assert cache.get(("a",)) == (False, None)
+    assert cache.status()["entries"] == 1
+
+
+def test_non_finite_floats_do_not_fail_the_batch(tmp_path):
+    async def scenario():
+        store = make_store(tmp_path / "analyses.db")
+        await store.start()
+        store.record(record(outputs={"probs": [float("nan"), 0.5], "score": float("inf")}))
+        store.record(record())
+        await wait_written(store, 2)
+        page = await store.history("vehicle_id", "car-1")
+        await store.stop()
+        assert store.failed == 0
+        outputs = page["items"][-1]["outputs"]
+        assert outputs == {"probs": [None, 0.5], "score": None}
+        assert not any(isinstance(value, float) and math.isnan(value) for value in outputs["probs"])
+
+    run(scenario())
+
+
+def test_writer_retries_until_database_is_reachable(tmp_path):
+    async def scenario():
+        directory = tmp_path / "not-yet"
+        store = make_store(directory / "analyses.db")
+        await store.start()
+        assert store.record(record())
+        while store.connect_attempts < 1 or store.error is None:
+            await asyncio.sleep(0.01)
+        assert not store.available
+        assert store.status()["connecting"]
+
+        directory.mkdir()
+        await wait_written(store, 1)
+        assert store.available
+        assert store.connect_attempts >= 2
+        await store.stop()
+
+    run(scenario())
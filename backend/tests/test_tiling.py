@@ -0,0 +1,56 @@
+"""Tile grid parsing, clamping and chunked tile batches."""
+
+import pytest
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+from inference.config import override
+from inference.tiling import parse_grid, predict_tiled, tile_boxes, tiling_settings
+
+
+class BatchSizes(nn.Module):
+    """Two-class model that records the batch sizes it is called with."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sizes = []
+        self.head = nn.Linear(3, 2)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        self.sizes.append(x.shape[0])
+        return self.head(x.mean(dim=(2, 3)))
+
+
+def postprocess(probs: torch.Tensor):
+    return [{"pred_idx": int(p.argmax())} for p in probs]
+
+
+@pytest.mark.parametrize("value", ["abc", "3x", "x3", "3x3x3", "-1", "0x2", "9" * 50])
+def test_bad_grids_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_grid(value)
+
+
+def test_grid_is_clamped():
+    assert parse_grid("2x3") == (2, 3)
+    assert parse_grid("5") == (5, 5)
+    assert tiling_settings(None, "3x300000")[:2] == (3, 4)
+    with override(tile_grid_max="2"):
+        assert tiling_settings(None, "100x100")[:2] == (2, 2)
+    rows, cols, overlap = tiling_settings(None, "100x100")
+    assert len(tile_boxes(4000, 3000, rows, cols, overlap, 224)) <= 16
+
+
+def test_tiles_run_in_chunks():
+    model = BatchSizes().eval()
+    tf = transforms.Compose([transforms.Resize((16, 16)), transforms.ToTensor()])
+    image = Image.new("RGB", (64, 64), (120, 30, 200))
+    with override(tile_batch="3"):
+        result = predict_tiled(model, tf, image, postprocess, None, grid="3x3", overlap=0.0)
+    # Whole image + 9 tiles, never more than 3 per forward pass
+    assert sum(model.sizes) == 10
+    assert max(model.sizes) == 3
+    assert result["tiling"]["tiles"] == 9
+    assert len(result["tiling"]["tile_scores"]) == 9
@@ -0,0 +1,114 @@
+"""Decode time, decoded size and prediction drift per decoder backend and upload size.
+
+Usage (from backend/):
+    python -m tools.benchmark_decode --images datasets/some/valid [--models damage_binary]
+
+Every installed decoder backend (INFERENCE_DECODER) is timed with and without
+reduced-resolution decoding (INFERENCE_DECODE_DRAFT), per bucket of source image size,
+against a full-resolution PIL decode. Drift is measured on each model's predictions;
+reduced-resolution decoding is off by default and should only be turned on for a
+deployment whose drift this reports as negligible.
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import torch
+from PIL import Image
+
+from inference.batching import image_size, preprocess
+from inference.config import MODELS_DIR
+from inference.decoders import available_decoders, decode
+from tools.common import available_models, compare_probs, list_images, load_eager
+
+
+# Source size buckets in megapixels: (label, upper bound)
+SIZE_BUCKETS = [("<1MP", 1.0), ("1-4MP", 4.0), ("4-8MP", 8.0), (">=8MP", float("inf"))]
+
+
+def source_bucket(payload: bytes) -> str:
+    width, height = Image.open(io.BytesIO(payload)).size
+    megapixels = width * height / 1e6
+    return next(label for label, bound in SIZE_BUCKETS if megapixels < bound)
+
+
+def decoded_pixels(image) -> int:
+    return image.size[0] * image.size[1] if isinstance(image, Image.Image) else image.shape[-2] * image.shape[-1]
+
+
+def decode_stats(payloads: List[bytes], backend: str, min_size: Optional[int]) -> Dict[str, float]:
+    """Median decode ms and mean decoded megapixels / RGB megabytes over the payloads."""
+    timings, pixels = [], []
+    for payload in payloads:
+        start = time.perf_counter()
+        image = decode(payload, min_size, backend)
+        timings.append((time.perf_counter() - start) * 1000.0)
+        pixels.append(decoded_pixels(image))
+    timings.sort()
+    mean_pixels = sum(pixels) / len(pixels)
+    return {
+        "decode_ms": round(timings[len(timings) // 2], 2),
+        "megapixels": round(mean_pixels / 1e6, 3),
+        "rgb_mb": round(mean_pixels * 3 / 2 ** 20, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image decoder backends and draft-mode decoding")
+    parser.add_argument("--images", type=str, required=True, help="Directory of real (ideally full-size phone) photos")
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--num_samples", type=int, default=64)
+    parser.add_argument("--min_size", type=int, default=224, help="Target size for reduced-resolution decoding")
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "decode_report.json"))
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.num_samples)
+    if not paths:
+        raise SystemExit(f"No images found in {args.images}")
+    payloads = []
+    for p in paths:
+        with open(p, "rb") as f:
+            payloads.append(f.read())
+    by_bucket: Dict[str, List[bytes]] = {}
+    for payload in payloads:
+        by_bucket.setdefault(source_bucket(payload), []).append(payload)
+
+    backends = available_decoders()
+    decoding = []
+    for label, _ in SIZE_BUCKETS:
+        if label not in by_bucket:
+            continue
+        entry = {"bucket": label, "samples": len(by_bucket[label]), "backends": {}}
+        for backend in backends:
+            entry["backends"][backend] = {
+                "full": decode_stats(by_bucket[label], backend, None),
+                "draft": decode_stats(by_bucket[label], backend, args.min_size),
+            }
+        print(json.dumps(entry))
+        decoding.append(entry)
+
+    drift = []
+    for name in available_models(args.models):
+        model, tf, _ = load_eager(name)
+        size = image_size(tf)
+        with torch.inference_mode():
+            reference = model(torch.stack([preprocess(tf, decode(p, None, "pil")) for p in payloads]))
+            entry = {"model": name, "image_size": size, "backends": {}}
+            for backend in backends:
+                for mode, min_size in (("full", None), ("draft", size)):
+                    candidate = model(torch.stack([preprocess(tf, decode(p, min_size, backend)) for p in payloads]))
+                    entry["backends"][f"{backend}_{mode}"] = compare_probs(reference, candidate)
+        print(json.dumps(entry))
+        drift.append(entry)
+
+    with open(args.report, "w") as f:
+        json.dump({"images": args.images, "decoders": backends, "decoding": decoding, "drift": drift}, f, indent=2)
+    print(json.dumps({"report": args.report}))
+
+
+if __name__ == "__main__":
+    main()
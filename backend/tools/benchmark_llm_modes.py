@@ -0,0 +1,110 @@
+"""Token use and latency of the two report modes: four parallel completions vs one combined JSON completion.
+
+Usage (from backend/):
+    python -m tools.benchmark_llm_modes [--analyses analyses.json] [--repeats 3]
+
+``--analyses`` is a JSON list of /analyze results (e.g. exported from the analyses
+table); without it a few built-in outcome patterns are used. Needs the Azure OpenAI
+environment variables. Serve the cheaper mode via LLM_REPORT_MODE=combined.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from typing import Dict, List
+
+from inference.config import MODELS_DIR
+from services.llm_service import llm_service
+
+
+MODES = ("parallel", "combined")
+
+# Typical outcomes: intact and clean, intact and dirty, damaged with a located part
+SAMPLE_ANALYSES: List[Dict] = [
+    {
+        "is_damaged": False,
+        "damage_source": "local",
+        "damage_local": {"damaged": False, "damage_prob": 0.03, "pred_idx": 0, "probs": [0.97, 0.03]},
+        "damage_parts_local": None,
+        "dirty": {"pred_idx": 0, "pred_label": "clean", "pred_score": 0.92, "probs": [0.92, 0.08], "is_dirty": False},
+    },
+    {
+        "is_damaged": False,
+        "damage_source": "local",
+        "damage_local": {"damaged": False, "damage_prob": 0.21, "pred_idx": 0, "probs": [0.79, 0.21]},
+        "damage_parts_local": None,
+        "dirty": {"pred_idx": 1, "pred_label": "dirty", "pred_score": 0.88, "probs": [0.12, 0.88], "is_dirty": True},
+    },
+    {
+        "is_damaged": True,
+        "damage_source": "local",
+        "damage_local": {"damaged": True, "damage_prob": 0.97, "pred_idx": 1, "probs": [0.03, 0.97]},
+        "damage_parts_local": {"pred_idx": 4, "pred_label": "bumper-dent", "pred_score": 0.84, "probs": [0.02, 0.03, 0.05, 0.06, 0.84]},
+        "dirty": None,
+    },
+]
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    n = len(runs)
+    latencies = sorted(run["usage"]["latency_ms"] for run in runs)
+    return {
+        "runs": n,
+        "calls_per_report": sum(run["usage"]["calls"] for run in runs) / n,
+        "prompt_tokens": sum(run["usage"]["prompt_tokens"] for run in runs) / n,
+        "completion_tokens": sum(run["usage"]["completion_tokens"] for run in runs) / n,
+        "total_tokens": sum(run["usage"]["total_tokens"] for run in runs) / n,
+        "latency_ms_mean": round(sum(latencies) / n, 1),
+        "latency_ms_p50": latencies[n // 2],
+        "latency_ms_max": latencies[-1],
+        "reports_with_fallbacks": sum(1 for run in runs if run.get("fallback_sections")),
+    }
+
+
+async def run(analyses: List[Dict], repeats: int) -> Dict[str, Dict]:
+    results = {}
+    for mode in MODES:
+        runs = []
+        for _ in range(repeats):
+            for analysis in analyses:
+                report = await llm_service.generate_comprehensive_report_async(analysis, mode, use_cache=False)
+                runs.append(report)
+                print(json.dumps({"mode": mode, "usage": report["usage"], "fallbacks": report.get("fallback_sections", [])}))
+        results[mode] = summarize(runs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare parallel and combined LLM report generation")
+    parser.add_argument("--analyses", type=str, default=None, help="JSON list of technical analyses")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "llm_modes_report.json"))
+    args = parser.parse_args()
+
+    if not llm_service.available:
+        raise SystemExit("LLM service unavailable: set the Azure OpenAI environment variables")
+    analyses = SAMPLE_ANALYSES
+    if args.analyses:
+        with open(args.analyses) as f:
+            analyses = json.load(f)
+
+    results = asyncio.run(run(analyses, args.repeats))
+    parallel, combined = results["parallel"], results["combined"]
+    report = {
+        "analyses": len(analyses),
+        "repeats": args.repeats,
+        "modes": results,
+        "reduction": {
+            "prompt_tokens": round(1 - combined["prompt_tokens"] / parallel["prompt_tokens"], 3) if parallel["prompt_tokens"] else None,
+            "total_tokens": round(1 - combined["total_tokens"] / parallel["total_tokens"], 3) if parallel["total_tokens"] else None,
+            "latency_ms_mean": round(1 - combined["latency_ms_mean"] / parallel["latency_ms_mean"], 3) if parallel["latency_ms_mean"] else None,
+        },
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({"report": args.report, "reduction": report["reduction"]}))
+
+
+if __name__ == "__main__":
+    main()
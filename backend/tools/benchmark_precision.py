@@ -0,0 +1,75 @@
+"""Per-model speedup and probability drift of channels_last / bf16 autocast against fp32 NCHW.
+
+Usage (from backend/):
+    python -m tools.benchmark_precision [--models damage_binary] [--images datasets/some/valid]
+
+Enable a mode for serving with INFERENCE_PRECISION_<MODEL>=bf16 and/or
+INFERENCE_MEMORY_FORMAT_<MODEL>=channels_last.
+"""
+
+import argparse
+import json
+import os
+
+import torch
+
+from inference.config import MODELS_DIR
+from inference.precision import PrecisionWrapper, cpu_supports_bf16
+from tools.common import available_models, batches, compare_probs, load_eager, sample_inputs, time_per_batch
+
+
+MODES = {
+    "channels_last": {"bf16": False, "channels_last": True},
+    "bf16": {"bf16": True, "channels_last": False},
+    "bf16_channels_last": {"bf16": True, "channels_last": True},
+}
+
+
+def benchmark_model(name: str, args) -> dict:
+    model, tf, _ = load_eager(name)
+    x = sample_inputs(tf, args.images, args.num_samples)
+    with torch.inference_mode():
+        reference = torch.cat([model(b) for b in batches(x, 16)])
+    baseline_ms = {bs: time_per_batch(model, x[:1].repeat(bs, 1, 1, 1)) for bs in args.batch_sizes}
+
+    report = {"model": name, "samples": int(x.size(0)), "fp32_ms": {str(k): round(v, 2) for k, v in baseline_ms.items()}, "modes": {}}
+    for mode, flags in MODES.items():
+        # Wrap a fresh copy: channels_last converts the weights in place
+        wrapped = PrecisionWrapper(load_eager(name)[0], **flags).eval()
+        with torch.inference_mode():
+            candidate = torch.cat([wrapped(b) for b in batches(x, 16)])
+        entry = {**compare_probs(reference, candidate), "latency": []}
+        for bs in args.batch_sizes:
+            ms = time_per_batch(wrapped, x[:1].repeat(bs, 1, 1, 1))
+            entry["latency"].append({"batch_size": bs, "ms": round(ms, 2), "speedup": round(baseline_ms[bs] / ms, 2)})
+        report["modes"][mode] = entry
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bf16 autocast and channels_last inference")
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--images", type=str, default=None, help="Directory of real images for drift; random inputs otherwise")
+    parser.add_argument("--num_samples", type=int, default=32)
+    parser.add_argument("--batch_sizes", type=int, nargs="*", default=[1, 8])
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "precision_report.json"))
+    args = parser.parse_args()
+
+    native = cpu_supports_bf16()
+    print(json.dumps({"native_bf16": native, "cpu_capability": torch.backends.cpu.get_cpu_capability()}))
+    if not native:
+        print("Warning: no native bf16 on this CPU; bf16 timings are emulated and serving would fall back to fp32")
+
+    reports = []
+    for name in available_models(args.models):
+        report = benchmark_model(name, args)
+        print(json.dumps(report))
+        reports.append(report)
+
+    with open(args.report, "w") as f:
+        json.dump({"native_bf16": native, "models": reports}, f, indent=2)
+    print(json.dumps({"report": args.report}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Per-batch time and numerical parity of the batched tensor Preprocessor against the PIL transforms.
+
+Usage (from backend/):
+    python -m tools.benchmark_preprocess --images datasets/some/valid [--models damage_binary]
+
+Serve with the tensor path via INFERENCE_PREPROCESS=tensor.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import torch
+
+from inference.batching import image_size
+from inference.config import MODELS_DIR
+from inference.decoders import decode
+from inference.preprocess import Preprocessor
+from tools.common import available_models, compare_probs, list_images, load_eager
+
+
+def median_ms(fn, iters: int = 10) -> float:
+    timings = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched tensor preprocessing against PIL transforms")
+    parser.add_argument("--images", type=str, required=True)
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--num_samples", type=int, default=32)
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "preprocess_report.json"))
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.num_samples)
+    if not paths:
+        raise SystemExit(f"No images found in {args.images}")
+
+    reports = []
+    for name in available_models(args.models):
+        model, tf, _ = load_eager(name)
+        pre = Preprocessor.from_transform(tf)
+        images = []
+        for p in paths:
+            with open(p, "rb") as f:
+                images.append(decode(f.read(), image_size(tf), "pil"))
+
+        reference = torch.stack([tf(img) for img in images])
+        candidate = pre(images)
+        with torch.inference_mode():
+            drift = compare_probs(model(reference), model(candidate))
+        pil_ms = median_ms(lambda: torch.stack([tf(img) for img in images]))
+        tensor_ms = median_ms(lambda: pre(images))
+        report = {
+            "model": name,
+            "samples": len(images),
+            "max_abs_input_diff": float((reference - candidate).abs().max()),
+            "pil_ms": round(pil_ms, 2),
+            "tensor_ms": round(tensor_ms, 2),
+            "speedup": round(pil_ms / tensor_ms, 2),
+            **drift,
+        }
+        print(json.dumps(report))
+        reports.append(report)
+
+    with open(args.report, "w") as f:
+        json.dump({"images": args.images, "models": reports}, f, indent=2)
+    print(json.dumps({"report": args.report}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Calibrate first-stage confidence thresholds for the cascade serving mode.
+
+Usage (from backend/):
+    python -m tools.calibrate_cascade [--models dirty_binary] [--max_accuracy_drop 0.005]
+
+Train the first stage with the task's usual trainer and a light arch, e.g.
+    python trains/train_dirty.py --arch mobilenet_v2 --output_dir models/first_stage
+    python trains/train_scratch_dent.py --arch simple --output_dir models/first_stage
+
+On held-out images this picks the lowest threshold (fewest escalations to the full
+model) whose cascade accuracy stays within --max_accuracy_drop of the full model,
+and writes it to <stem>.cascade.json. Tasks where no threshold helps get no config.
+
+Held-out images are the task's val folder, --val_dir, or else every image of its train
+folder outside the trainer's exact training split (tools.datasets.held_out_splits).
+Both stages come from the same seeded trainer, so neither has seen them; pass
+--train_subset_size when the checkpoints were trained with a non-default --subset_size.
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, Optional
+
+import torch
+from torch.utils.data import DataLoader
+
+from inference.cascade import cascade_config_path, first_stage_path
+from inference.config import MODELS_DIR, checkpoint_path
+from tools.common import available_models, image_size, load_eager, time_per_batch
+from tools.datasets import SampleDataset, held_out_splits, subsample
+
+
+def collect_logits(model, loader):
+    outputs, labels = [], []
+    with torch.inference_mode():
+        for images, targets in loader:
+            outputs.append(model(images).float())
+            labels.append(targets)
+    return torch.cat(outputs), torch.cat(labels)
+
+
+def pick_threshold(first_logits, full_logits, labels, max_accuracy_drop: float) -> Dict[str, Optional[float]]:
+    """Lowest confidence threshold keeping cascade accuracy within the allowed drop of the full model."""
+    confidence, first_pred = torch.softmax(first_logits, dim=-1).max(dim=-1)
+    first_correct = (first_pred == labels).float()
+    full_correct = (full_logits.argmax(dim=-1) == labels).float()
+    n = labels.numel()
+    full_accuracy = float(full_correct.mean())
+
+    # Answering the k most confident images with the first stage and escalating the rest
+    order = confidence.argsort(descending=True)
+    conf_sorted = confidence[order]
+    answered_correct = torch.cat([torch.zeros(1), first_correct[order].cumsum(0)])
+    escalated_correct = torch.cat([full_correct[order].flip(0).cumsum(0).flip(0), torch.zeros(1)])
+    cascade_accuracy = (answered_correct + escalated_correct) / n
+
+    best_k = 0
+    for k in range(n, 0, -1):
+        # A threshold can only split between distinct confidences
+        if k < n and conf_sorted[k - 1] == conf_sorted[k]:
+            continue
+        if full_accuracy - float(cascade_accuracy[k]) <= max_accuracy_drop:
+            best_k = k
+            break
+    return {
+        "threshold": float(conf_sorted[best_k - 1]) if best_k else None,
+        "full_accuracy": full_accuracy,
+        "first_stage_accuracy": float(first_correct.mean()),
+        "cascade_accuracy": float(cascade_accuracy[best_k]),
+        "escalation_rate": (n - best_k) / n,
+    }
+
+
+def calibrate(name: str, args) -> dict:
+    first_path = first_stage_path(name)
+    report = {"model": name, "first_stage": first_path, "published": False}
+    if not os.path.exists(first_path):
+        return {**report, "reason": "no first-stage checkpoint"}
+    full, tf, meta = load_eager(name)
+    first, first_tf, first_meta = load_eager(name, first_path)
+    if repr(first_tf) != repr(tf) or first_meta.get("class_to_idx") != meta.get("class_to_idx"):
+        return {**report, "reason": "first stage has a different transform or label map"}
+
+    _, val = held_out_splits(
+        name, meta["class_to_idx"], data_root=args.data_root, val_dir=args.val_dir, subset_size=args.train_subset_size,
+    )
+    val = subsample(val, args.val_samples)
+    loader = DataLoader(SampleDataset(val, tf), batch_size=args.batch_size, num_workers=args.num_workers)
+    full_logits, labels = collect_logits(full, loader)
+    first_logits, _ = collect_logits(first, loader)
+
+    result = pick_threshold(first_logits, full_logits, labels, args.max_accuracy_drop)
+    size = image_size(tf)
+    x = torch.randn(1, 3, size, size)
+    first_ms, full_ms = time_per_batch(first, x), time_per_batch(full, x)
+    report.update(result)
+    report.update({
+        "samples": int(labels.numel()),
+        "max_accuracy_drop": args.max_accuracy_drop,
+        "first_stage_arch": first_meta.get("arch"),
+        "full_arch": meta.get("arch"),
+        "first_stage_ms": round(first_ms, 2),
+        "full_ms": round(full_ms, 2),
+        "expected_ms": round(first_ms + result["escalation_rate"] * full_ms, 2),
+    })
+
+    config_path = cascade_config_path(checkpoint_path(name))
+    if result["threshold"] is not None and report["expected_ms"] < full_ms:
+        with open(config_path, "w") as f:
+            json.dump(report, f, indent=2)
+        report["published"] = True
+    elif os.path.exists(config_path):
+        os.remove(config_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate cascade thresholds to a target accuracy loss")
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--data_root", type=str, default=None, help="Override the task dataset root (single model runs)")
+    parser.add_argument("--val_dir", type=str, default=None, help="Held-out image directory (single model runs)")
+    parser.add_argument(
+        "--train_subset_size", type=int, default=None,
+        help="--subset_size the checkpoint was trained with, for tasks without a val folder (default: the trainer's default)",
+    )
+    parser.add_argument("--max_accuracy_drop", type=float, default=0.005, help="Absolute top-1 accuracy drop allowed")
+    parser.add_argument("--val_samples", type=int, default=0, help="0 = whole validation split")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_workers", type=int, default=2)
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "cascade_report.json"))
+    args = parser.parse_args()
+
+    reports = []
+    for name in available_models(args.models):
+        report = calibrate(name, args)
+        print(json.dumps(report))
+        reports.append(report)
+
+    with open(args.report, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(json.dumps({"report": args.report, "published": [r["model"] for r in reports if r["published"]]}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Calibrate near-duplicate photo matching for the photo index.
+
+Usage (from backend/):
+    python -m tools.calibrate_photo_index [--images path/to/photos] [--max_false_match_rate 0.0001]
+
+Embeds held-out photos (the damage task's validation images, or --images) with the
+damage checkpoint, the same features the service indexes, together with near copies of
+each (JPEG recompression, downscaling, a border crop, and all three). Half of the photos
+fix the mean embedding the index centers on; on the other half every pair of distinct
+photos is a negative and every photo / near-copy pair a positive. The published
+threshold is the lowest whose false-match rate on the negatives stays within
+--max_false_match_rate, and it is written with the center to <MODELS_DIR>/photo_index.json
+when it still recognizes at least --min_true_match_rate of the near copies.
+"""
+
+import argparse
+import io
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+from inference.config import MODELS_DIR, checkpoint_path
+from inference.embedding_index import calibration_path, embedding_tap
+from tools.common import list_images, load_eager
+from tools.datasets import held_out_splits, subsample
+
+
+MODEL = "damage_binary"
+
+
+def near_copies(image: Image.Image) -> List[Image.Image]:
+    """What a re-upload of the same photo typically looks like."""
+    def recompress(img: Image.Image, quality: int = 60) -> Image.Image:
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality)
+        buf.seek(0)
+        return Image.open(buf).convert("RGB")
+
+    w, h = image.size
+    downscaled = image.resize((max(1, int(w * 0.6)), max(1, int(h * 0.6))), Image.BILINEAR)
+    cropped = image.crop((int(w * 0.05), int(h * 0.05), int(w * 0.95), int(h * 0.95)))
+    return [recompress(image), downscaled, cropped, recompress(cropped.resize(downscaled.size, Image.BILINEAR))]
+
+
+def embed(model, tf, images: List[Image.Image], batch_size: int = 32) -> np.ndarray:
+    tap = embedding_tap(model)
+    if tap.layer is None:
+        raise RuntimeError("The damage model has no final Linear to take embeddings from")
+    out = []
+    with torch.inference_mode():
+        for start in range(0, len(images), batch_size):
+            batch = torch.stack([tf(img) for img in images[start:start + batch_size]])
+            with tap.capture():
+                model(batch)
+            out.append(tap.features.numpy())
+    return np.concatenate(out).astype(np.float32)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def pair_scores(originals: np.ndarray, copies: np.ndarray, copy_owner: np.ndarray, center: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+    """Cosine of every photo / near-copy pair (positives) and every pair of distinct photos (negatives)."""
+    shift = center if center is not None else 0.0
+    a = _normalize(originals - shift)
+    b = _normalize(copies - shift)
+    positive = np.einsum("ij,ij->i", a[copy_owner], b)
+    sims = a @ a.T
+    negative = sims[np.triu_indices(len(a), k=1)]
+    return {"positive": positive, "negative": negative}
+
+
+def pick_duplicate_threshold(positive: np.ndarray, negative: np.ndarray, max_false_match_rate: float) -> Dict[str, float]:
+    """Lowest threshold whose false-match rate on ``negative`` is within the budget, and what it catches."""
+    ranked = np.sort(negative)[::-1]
+    allowed = int(np.floor(max_false_match_rate * ranked.size))
+    # Strictly above the first negative beyond the budget
+    threshold = float(np.nextafter(ranked[allowed], np.float32(np.inf))) if allowed < ranked.size else float(ranked[-1])
+    return {
+        "threshold": threshold,
+        "false_match_rate": float((negative >= threshold).mean()) if negative.size else 0.0,
+        "true_match_rate": float((positive >= threshold).mean()) if positive.size else 0.0,
+        "negative_pairs": int(negative.size),
+        "positive_pairs": int(positive.size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the photo index duplicate threshold on held-out pairs")
+    parser.add_argument("--images", type=str, default=None, help="Directory of held-out photos; default: the damage task's val split")
+    parser.add_argument("--data_root", type=str, default=None, help="Override the damage dataset root")
+    parser.add_argument("--num_samples", type=int, default=600)
+    parser.add_argument("--max_false_match_rate", type=float, default=1e-4)
+    parser.add_argument("--min_true_match_rate", type=float, default=0.5)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "photo_index_report.json"))
+    args = parser.parse_args()
+
+    model, tf, meta = load_eager(MODEL)
+    if args.images:
+        paths = list_images(args.images)
+        paths = [paths[i] for i in sorted(np.random.default_rng(0).permutation(len(paths))[:args.num_samples])] if args.num_samples else paths
+    else:
+        _, val = held_out_splits(MODEL, meta["class_to_idx"], data_root=args.data_root)
+        paths = [path for path, _ in subsample(val, args.num_samples)]
+    if len(paths) < 4:
+        raise SystemExit(f"Need at least 4 held-out photos, found {len(paths)}")
+
+    images = [Image.open(path).convert("RGB") for path in paths]
+    fit, held = images[0::2], images[1::2]
+    center = embed(model, tf, fit, args.batch_size).mean(axis=0)
+
+    copies, owner = [], []
+    for i, image in enumerate(held):
+        for copy in near_copies(image):
+            copies.append(copy)
+            owner.append(i)
+    originals = embed(model, tf, held, args.batch_size)
+    copy_embeddings = embed(model, tf, copies, args.batch_size)
+    owner = np.asarray(owner)
+
+    raw = pair_scores(originals, copy_embeddings, owner, None)
+    centered = pair_scores(originals, copy_embeddings, owner, center)
+    result = pick_duplicate_threshold(centered["positive"], centered["negative"], args.max_false_match_rate)
+    report = {
+        "model": MODEL,
+        "checkpoint_mtime": int(os.path.getmtime(checkpoint_path(MODEL))),
+        "photos": len(held),
+        "fit_photos": len(fit),
+        "max_false_match_rate": args.max_false_match_rate,
+        **result,
+        # Why the index centers: uncentered, distinct photos already score close to 1
+        "raw_negative_p99": float(np.percentile(raw["negative"], 99)),
+        "centered_negative_p99": float(np.percentile(centered["negative"], 99)),
+        "published": result["true_match_rate"] >= args.min_true_match_rate,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if report["published"]:
+        with open(calibration_path(), "w") as f:
+            json.dump({**report, "center": center.tolist()}, f)
+    elif os.path.exists(calibration_path()):
+        # A stale calibration would keep serving matches this run could not justify
+        os.remove(calibration_path())
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
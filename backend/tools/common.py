@@ -0,0 +1,99 @@
+"""Helpers shared by the model tooling scripts (run them from backend/ as ``python -m tools.<name>``)."""
+
+import glob
+import importlib
+import os
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+from inference.batching import image_size
+from inference.checkpoint_io import load_checkpoint_data
+from inference.config import MODEL_MODULES, checkpoint_path, override
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Settings that make load_checkpoint return the plain eager fp32 model
+EAGER_SETTINGS = {
+    "backend": "torch",
+    "quantized": "off",
+    "precision": "fp32",
+    "memory_format": "contiguous",
+    "compile": "off",
+    "fold_normalization": "off",
+}
+
+
+def available_models(names: Optional[List[str]] = None) -> List[str]:
+    """Model names with a checkpoint on disk, optionally restricted to ``names``."""
+    selected = names or list(MODEL_MODULES)
+    unknown = [n for n in selected if n not in MODEL_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown models: {unknown}. Known: {list(MODEL_MODULES)}")
+    return [n for n in selected if os.path.exists(checkpoint_path(n))]
+
+
+def load_eager(name: str, ckpt_path: Optional[str] = None) -> Tuple[nn.Module, transforms.Compose, dict]:
+    """Load a checkpoint (default: the model's own) as a plain eager fp32 model, ignoring serving settings.
+
+    Returns the model, its eval transform and the checkpoint metadata (everything but the weights).
+    """
+    ckpt_path = ckpt_path or checkpoint_path(name)
+    module = importlib.import_module(MODEL_MODULES[name])
+    with override(name, **EAGER_SETTINGS):
+        loaded = module.load_checkpoint(ckpt_path)
+    data = load_checkpoint_data(ckpt_path)
+    meta = {k: v for k, v in data.items() if k != "model_state_dict"}
+    return loaded[0], loaded[1], meta
+
+
+def list_images(root: str, limit: Optional[int] = None) -> List[str]:
+    paths = sorted(
+        p for p in glob.glob(os.path.join(root, "**", "*"), recursive=True)
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def sample_inputs(tf: transforms.Compose, images_dir: Optional[str], count: int) -> torch.Tensor:
+    """Preprocessed real images when a directory is given, otherwise random tensors."""
+    paths = list_images(images_dir, count) if images_dir else []
+    if paths:
+        return torch.stack([tf(Image.open(p).convert("RGB")) for p in paths])
+    size = image_size(tf)
+    return torch.randn(count, 3, size, size)
+
+
+def time_per_batch(fn: Callable[[torch.Tensor], torch.Tensor], x: torch.Tensor, iters: int = 20, warmup: int = 3) -> float:
+    """Median wall time of fn(x) in milliseconds."""
+    with torch.inference_mode():
+        for _ in range(warmup):
+            fn(x)
+        timings = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            fn(x)
+            timings.append((time.perf_counter() - start) * 1000.0)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def batches(x: torch.Tensor, batch_size: int) -> Iterator[torch.Tensor]:
+    for i in range(0, x.size(0), batch_size):
+        yield x[i:i + batch_size]
+
+
+def compare_probs(reference: torch.Tensor, candidate: torch.Tensor) -> Dict[str, float]:
+    """Parity metrics between two logit batches."""
+    p_ref = torch.softmax(reference.float(), dim=-1)
+    p_new = torch.softmax(candidate.float(), dim=-1)
+    return {
+        "max_abs_prob_diff": float((p_ref - p_new).abs().max()),
+        "mean_abs_prob_diff": float((p_ref - p_new).abs().mean()),
+        "top1_agreement": float((p_ref.argmax(-1) == p_new.argmax(-1)).float().mean()),
+    }
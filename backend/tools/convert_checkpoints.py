@@ -0,0 +1,78 @@
+"""Convert <stem>.pt checkpoints into a memory-mappable safetensors store.
+
+Usage (from backend/):
+    python -m tools.convert_checkpoints [--models damage_binary] [--measure]
+
+Writes <stem>.safetensors (weights) and <stem>.json (class maps, arch, image size, ...)
+next to each checkpoint. The loaders prefer the store while it is newer than the .pt
+(INFERENCE_SAFETENSORS=off disables it). --measure loads each model in a fresh process
+from both formats and reports peak RSS.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import torch
+from safetensors.torch import save_file
+
+from inference.checkpoint_io import store_paths
+from inference.config import MODEL_MODULES, checkpoint_path
+from tools.common import available_models
+
+
+_MEASURE_SNIPPET = """
+import importlib, resource, sys
+from inference.config import checkpoint_path
+name, module = sys.argv[1], sys.argv[2]
+importlib.import_module(module).load_checkpoint(checkpoint_path(name))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def convert(name: str) -> dict:
+    ckpt = checkpoint_path(name)
+    data = torch.load(ckpt, map_location="cpu")
+    state_dict = {k: v.contiguous() for k, v in data.pop("model_state_dict").items()}
+    weights_path, meta_path = store_paths(ckpt)
+    save_file(state_dict, weights_path + ".tmp")
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+    os.replace(weights_path + ".tmp", weights_path)
+    return {
+        "model": name,
+        "safetensors": weights_path,
+        "metadata": meta_path,
+        "pt_bytes": os.path.getsize(ckpt),
+        "safetensors_bytes": os.path.getsize(weights_path),
+    }
+
+
+def peak_rss_kb(name: str, use_store: bool) -> int:
+    env = dict(os.environ, INFERENCE_SAFETENSORS="auto" if use_store else "off")
+    out = subprocess.run(
+        [sys.executable, "-c", _MEASURE_SNIPPET, name, MODEL_MODULES[name]],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return int(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert checkpoints to a memory-mapped safetensors store")
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--measure", action="store_true", help="Compare peak RSS of loading from .pt vs the store")
+    args = parser.parse_args()
+
+    for name in available_models(args.models):
+        report = convert(name)
+        if args.measure:
+            report["peak_rss_kb_pt"] = peak_rss_kb(name, use_store=False)
+            report["peak_rss_kb_safetensors"] = peak_rss_kb(name, use_store=True)
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Allocations per steady-state request, to catch regressions on the request path.
+
+Usage (from backend/):
+    python -m tools.count_allocations [--models damage_binary] [--images datasets/some/valid] [--max_tensor_allocations 40]
+
+Loads each model with the serving settings, warms it up, then counts for one
+predict_arrays call the tensor allocations (torch profiler memory events) and the
+Python heap blocks (tracemalloc). Exits non-zero when a threshold is exceeded.
+INFERENCE_REUSE_BUFFERS=off shows the cost without the pooled input buffers.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import sys
+import tracemalloc
+from typing import Optional
+
+from PIL import Image
+from torch.profiler import ProfilerActivity, profile
+
+from inference.batching import image_size, predict_arrays
+from inference.config import MODEL_MODULES, checkpoint_path
+from tools.common import available_models, list_images
+
+
+def request_payload(size: int, images_dir: Optional[str] = None) -> bytes:
+    paths = list_images(images_dir, 1) if images_dir else []
+    if paths:
+        with open(paths[0], "rb") as f:
+            return f.read()
+    buf = io.BytesIO()
+    Image.new("RGB", (size * 4, size * 3), (120, 130, 140)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def count_request(model, tf, payloads) -> dict:
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        predict_arrays(model, tf, payloads)
+    allocations = [e for e in prof.events() if e.name == "[memory]" and e.cpu_memory_usage > 0]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    predict_arrays(model, tf, payloads)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = [d for d in after.compare_to(before, "lineno") if d.count_diff > 0]
+    return {
+        "tensor_allocations": len(allocations),
+        "tensor_bytes": int(sum(e.cpu_memory_usage for e in allocations)),
+        "python_blocks": int(sum(d.count_diff for d in blocks)),
+        "python_bytes": int(sum(d.size_diff for d in blocks)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count allocations per steady-state request")
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--images", type=str, default=None, help="Use a real image; a synthetic JPEG otherwise")
+    parser.add_argument("--batch_sizes", type=int, nargs="*", default=[1, 8])
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--max_tensor_allocations", type=int, default=None)
+    parser.add_argument("--max_python_blocks", type=int, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for name in available_models(args.models):
+        loaded = importlib.import_module(MODEL_MODULES[name]).load_checkpoint(checkpoint_path(name))
+        model, tf = loaded[0], loaded[1]
+        payload = request_payload(image_size(tf), args.images)
+        for bs in args.batch_sizes:
+            payloads = [payload] * bs
+            for _ in range(args.warmup):
+                predict_arrays(model, tf, payloads)
+            report = {"model": name, "batch_size": bs, **count_request(model, tf, payloads)}
+            over = (
+                (args.max_tensor_allocations is not None and report["tensor_allocations"] > args.max_tensor_allocations)
+                or (args.max_python_blocks is not None and report["python_blocks"] > args.max_python_blocks)
+            )
+            report["within_budget"] = not over
+            failed = failed or over
+            print(json.dumps(report))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Labeled image lists for each task, in the layouts the trainers in trains/ read.
+
+Labels are mapped through the checkpoint's own ``class_to_idx`` so they line up with
+the model outputs regardless of the column/folder order on disk.
+"""
+
+import os
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import transforms
+
+from tools.common import IMAGE_EXTENSIONS
+
+
+Sample = Tuple[str, int]
+
+# Defaults mirror the trains/ scripts. A val subdir of None means the trainer
+# carved its validation set out of the train split (80/20), after drawing a
+# stratified subset of ``subset_size`` images (its --subset_size default).
+TASK_DATASETS: Dict[str, Dict[str, Any]] = {
+    "damage_binary": {"root": os.path.join("data", "damage-anujms", "data1a"), "train": "training", "val": "validation"},
+    "damage_parts": {"root": os.path.join("datasets", "car-damage.v1i.multiclass"), "train": "train", "val": "valid"},
+    "dirty_binary": {"root": "dirt finding", "train": "train", "val": "valid"},
+    "damaged_windows": {"root": os.path.join("datasets", "damaged_windows"), "train": "train", "val": None, "subset_size": 300},
+    "unified_windows": {"root": os.path.join("datasets", "unified_windows"), "train": "train", "val": None, "subset_size": 400},
+    "scratch_dent": {"root": os.path.join("datasets", "scratch-dent-car.v1i.multiclass"), "train": "train", "val": None, "subset_size": 400},
+    "tire_classification": {"root": os.path.join("datasets", "full vs flat tire.v1i.multiclass"), "train": "train", "val": None, "subset_size": 800},
+}
+
+
+def read_split(split_dir: str, class_to_idx: Dict[str, int]) -> List[Sample]:
+    """Read a ``_classes.csv`` (one-hot) directory or an ImageFolder directory."""
+    samples: List[Sample] = []
+    csv_path = os.path.join(split_dir, "_classes.csv")
+    if os.path.exists(csv_path):
+        df = pd.read_csv(csv_path)
+        df.columns = [c.strip() for c in df.columns]
+        class_names = [c for c in df.columns if c != "filename" and c in class_to_idx]
+        if not class_names:
+            raise RuntimeError(f"No checkpoint classes {list(class_to_idx)} in {csv_path}")
+        one_hot = df[class_names].to_numpy()
+        for fname, row in zip(df["filename"], one_hot):
+            if row.max() <= 0:
+                continue
+            path = os.path.join(split_dir, str(fname).strip())
+            if os.path.exists(path):
+                samples.append((path, class_to_idx[class_names[int(row.argmax())]]))
+    else:
+        for class_name, idx in class_to_idx.items():
+            class_dir = os.path.join(split_dir, class_name)
+            if not os.path.isdir(class_dir):
+                continue
+            for fname in sorted(os.listdir(class_dir)):
+                if fname.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append((os.path.join(class_dir, fname), idx))
+    if not samples:
+        raise RuntimeError(f"No labeled images found in {split_dir}")
+    return samples
+
+
+def discover_classes(name: str, data_root: Optional[str] = None) -> Dict[str, int]:
+    """class_to_idx read from a task's train split, for training without an existing checkpoint.
+
+    ``_classes.csv`` layouts keep the column order, ImageFolder layouts sort the folder names.
+    """
+    spec = TASK_DATASETS[name]
+    split_dir = os.path.join(data_root or spec["root"], spec["train"])
+    csv_path = os.path.join(split_dir, "_classes.csv")
+    if os.path.exists(csv_path):
+        columns = [c.strip() for c in pd.read_csv(csv_path, nrows=0).columns]
+        names = [c for c in columns if c != "filename"]
+    else:
+        names = sorted(d for d in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, d)))
+    if not names:
+        raise RuntimeError(f"No classes found in {split_dir}")
+    return {class_name: i for i, class_name in enumerate(names)}
+
+
+def task_splits(name: str, class_to_idx: Dict[str, int], data_root: Optional[str] = None, seed: int = 42) -> Tuple[List[Sample], List[Sample]]:
+    """(train, val) samples for training a new model on a task.
+
+    Tasks without a dedicated validation folder get a seeded 80/20 split of train. It is
+    not the split the task's own checkpoint was trained with: to evaluate or calibrate
+    that checkpoint use ``held_out_splits``.
+    """
+    spec = TASK_DATASETS[name]
+    root = data_root or spec["root"]
+    train = read_split(os.path.join(root, spec["train"]), class_to_idx)
+    if spec["val"]:
+        return train, read_split(os.path.join(root, spec["val"]), class_to_idx)
+    shuffled = list(train)
+    random.Random(seed).shuffle(shuffled)
+    cut = int(0.8 * len(shuffled))
+    return shuffled[:cut], shuffled[cut:]
+
+
+def _trainer_samples(split_dir: str, class_to_idx: Dict[str, int]) -> List[Tuple[str, int, bool]]:
+    """(path, label, labeled) in the order the trainer's dataset lists them.
+
+    The CSV trainers keep every row whose file exists, labeling all-zero rows as class 0,
+    so those rows are kept here too (flagged unlabeled) to keep the indices aligned.
+    """
+    csv_path = os.path.join(split_dir, "_classes.csv")
+    if not os.path.exists(csv_path):
+        return [(path, label, True) for path, label in read_split(split_dir, class_to_idx)]
+    df = pd.read_csv(csv_path)
+    df.columns = [c.strip() for c in df.columns]
+    class_names = sorted(class_to_idx, key=class_to_idx.get)
+    missing = [c for c in class_names if c not in df.columns]
+    if missing:
+        raise RuntimeError(f"Checkpoint classes {missing} not in {csv_path}")
+    samples = []
+    for fname, row in zip(df["filename"], df[class_names].astype(int).to_numpy()):
+        path = os.path.join(split_dir, str(fname).strip())
+        if os.path.exists(path):
+            # argmax returns the first maximum, like the trainers' max(range(...), key=...)
+            samples.append((path, int(row.argmax()), bool(row.max() > 0)))
+    return samples
+
+
+def held_out_splits(
+    name: str, class_to_idx: Dict[str, int], data_root: Optional[str] = None, val_dir: Optional[str] = None,
+    subset_size: Optional[int] = None, seed: int = 42,
+) -> Tuple[List[Sample], List[Sample]]:
+    """(train, held_out) for evaluating or calibrating the task's trained checkpoint.
+
+    ``held_out`` never contains an image the checkpoint was trained on: the dedicated
+    validation folder, or ``val_dir`` when given, or otherwise every image of the train
+    folder outside the trainer's training split. That split is reproduced exactly:
+    ``random.seed(seed)`` drives the stratified ``--subset_size`` draw and shuffle, then
+    ``random_split`` runs on the default generator seeded with ``seed``. ``subset_size``
+    must match the value the checkpoint was trained with (default: the trainer's default;
+    0 means the whole folder). ``train`` is the trainer's training split.
+    """
+    spec = TASK_DATASETS[name]
+    root = data_root or spec["root"]
+    train_dir = os.path.join(root, spec["train"])
+    if val_dir or spec["val"]:
+        return read_split(train_dir, class_to_idx), read_split(val_dir or os.path.join(root, spec["val"]), class_to_idx)
+
+    samples = _trainer_samples(train_dir, class_to_idx)
+    chosen = samples
+    subset_size = spec.get("subset_size") if subset_size is None else subset_size
+    if subset_size and subset_size < len(samples):
+        rng = random.Random(seed)
+        by_class: List[List[Tuple[str, int, bool]]] = [[] for _ in class_to_idx]
+        for sample in samples:
+            by_class[sample[1]].append(sample)
+        per_class = subset_size // len(class_to_idx)
+        chosen = []
+        for class_samples in by_class:
+            if class_samples:
+                chosen.extend(rng.sample(class_samples, min(per_class, len(class_samples))))
+        rng.shuffle(chosen)
+    order = torch.randperm(len(chosen), generator=torch.Generator().manual_seed(seed)).tolist()
+    trained = [chosen[i] for i in order[:int(0.8 * len(chosen))]]
+    trained_paths = {path for path, _, _ in trained}
+    held_out = [(path, label) for path, label, labeled in samples if labeled and path not in trained_paths]
+    if not held_out:
+        raise RuntimeError(f"No held-out images left in {train_dir}; pass a separate validation directory")
+    return [(path, label) for path, label, labeled in trained if labeled], held_out
+
+
+class SampleDataset(Dataset):
+    def __init__(self, samples: List[Sample], transform: transforms.Compose) -> None:
+        self.samples = samples
+        self.transform = transform
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, idx: int):
+        path, label = self.samples[idx]
+        img = Image.open(path).convert("RGB")
+        return self.transform(img), label
+
+
+def subsample(samples: List[Sample], count: int, seed: int = 0) -> List[Sample]:
+    if count <= 0 or count >= len(samples):
+        return list(samples)
+    return random.Random(seed).sample(samples, count)
+
+
+def accuracy(model, loader, device: str = "cpu") -> float:
+    correct = 0
+    total = 0
+    with torch.inference_mode():
+        for images, targets in loader:
+            preds = model(images.to(device)).argmax(dim=1).cpu()
+            correct += int((preds == targets).sum())
+            total += int(targets.numel())
+    return correct / max(1, total)
+
+
+# (path, task index, label); task and label are -1 for unlabeled images
+TaggedSample = Tuple[str, int, int]
+
+
+class TaggedDataset(Dataset):
+    """Images pooled from several tasks, each item tagged with its task and label."""
+
+    def __init__(self, samples: List[TaggedSample], transform: transforms.Compose) -> None:
+        self.samples = samples
+        self.transform = transform
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, idx: int):
+        path, task, label = self.samples[idx]
+        img = Image.open(path).convert("RGB")
+        return self.transform(img), task, label
@@ -0,0 +1,75 @@
+"""Export every trained checkpoint to ONNX and report parity/throughput against eager PyTorch.
+
+Usage (from backend/):
+    python -m tools.export_onnx [--models damage_binary scratch_dent] [--images datasets/some/valid]
+
+Serve a model with onnxruntime by setting INFERENCE_BACKEND_<MODEL>=onnx (or INFERENCE_BACKEND=onnx).
+"""
+
+import argparse
+import json
+import os
+
+import torch
+
+from inference.config import MODELS_DIR, checkpoint_path
+from inference.onnx_backend import OnnxPredictor, export_onnx, onnx_path
+from tools.common import available_models, batches, compare_probs, image_size, load_eager, sample_inputs, time_per_batch
+
+
+def export_and_compare(name: str, images_dir: str, num_samples: int, batch_sizes, opset: int) -> dict:
+    model, tf, _ = load_eager(name)
+    out_path = export_onnx(model, image_size(tf), onnx_path(checkpoint_path(name)), opset=opset)
+    predictor = OnnxPredictor(out_path)
+
+    x = sample_inputs(tf, images_dir, num_samples)
+    with torch.inference_mode():
+        reference = torch.cat([model(b) for b in batches(x, 16)])
+    candidate = torch.cat([predictor(b) for b in batches(x, 16)])
+
+    report = {
+        "model": name,
+        "onnx": out_path,
+        "onnx_bytes": os.path.getsize(out_path),
+        "samples": int(x.size(0)),
+        **compare_probs(reference, candidate),
+        "throughput": [],
+    }
+    for bs in batch_sizes:
+        xb = x[:bs] if x.size(0) >= bs else x[:1].repeat(bs, 1, 1, 1)
+        torch_ms = time_per_batch(model, xb)
+        onnx_ms = time_per_batch(predictor, xb)
+        report["throughput"].append({
+            "batch_size": bs,
+            "torch_ms": round(torch_ms, 2),
+            "onnx_ms": round(onnx_ms, 2),
+            "torch_img_per_s": round(bs * 1000.0 / torch_ms, 1),
+            "onnx_img_per_s": round(bs * 1000.0 / onnx_ms, 1),
+            "speedup": round(torch_ms / onnx_ms, 2),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export checkpoints to ONNX and compare with eager PyTorch")
+    parser.add_argument("--models", nargs="*", default=None, help="Model names (checkpoint stems); default: all found")
+    parser.add_argument("--images", type=str, default=None, help="Directory of real images for parity; random inputs otherwise")
+    parser.add_argument("--num_samples", type=int, default=32)
+    parser.add_argument("--batch_sizes", type=int, nargs="*", default=[1, 8, 32])
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "onnx_report.json"))
+    args = parser.parse_args()
+
+    reports = []
+    for name in available_models(args.models):
+        report = export_and_compare(name, args.images, args.num_samples, args.batch_sizes, args.opset)
+        print(json.dumps(report))
+        reports.append(report)
+
+    with open(args.report, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(json.dumps({"report": args.report, "models": [r["model"] for r in reports]}))
+
+
+if __name__ == "__main__":
+    main()
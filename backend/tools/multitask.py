@@ -0,0 +1,64 @@
+"""Evaluation shared by the multi-task trainers: per-task accuracy against the task models, and serving cost.
+
+The trainers live in trains/ and are run from backend/ as
+``python -m trains.train_distill_multitask`` / ``python -m trains.train_multitask``.
+"""
+
+from typing import Dict, List
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import transforms
+
+from inference.multitask import MultiTaskModel, TaskView
+from tools.common import available_models, image_size, load_eager, time_per_batch
+from tools.datasets import Sample, SampleDataset, accuracy
+
+
+def param_count(model: nn.Module) -> int:
+    return sum(p.numel() for p in model.parameters())
+
+
+def student_accuracy(student: MultiTaskModel, tf: transforms.Compose, val_splits: Dict[str, List[Sample]], batch_size: int = 32, num_workers: int = 2) -> Dict[str, float]:
+    student.eval()
+    return {
+        task: accuracy(TaskView(student, task), DataLoader(SampleDataset(val, tf), batch_size=batch_size, num_workers=num_workers))
+        for task, val in val_splits.items()
+    }
+
+
+def compare_with_task_models(
+    student: MultiTaskModel, tf: transforms.Compose, val_splits: Dict[str, List[Sample]], batch_size: int = 32, num_workers: int = 2,
+) -> dict:
+    """Per-task student vs task-model accuracy, and per-image latency / size of one student vs all task models.
+
+    ``val_splits`` must be held out from the task models (tools.datasets.held_out_splits),
+    or their accuracy is measured on their own training images. Tasks without a task
+    checkpoint on disk only get the student accuracy.
+    """
+    student_acc = student_accuracy(student, tf, val_splits, batch_size, num_workers)
+    tasks = {task: {"samples": len(val), "student_accuracy": student_acc[task]} for task, val in val_splits.items()}
+    task_models_ms = 0.0
+    task_models_params = 0
+    for task in available_models(list(val_splits)):
+        model, task_tf, _ = load_eager(task)
+        loader = DataLoader(SampleDataset(val_splits[task], task_tf), batch_size=batch_size, num_workers=num_workers)
+        teacher_acc = accuracy(model, loader)
+        size = image_size(task_tf)
+        task_models_ms += time_per_batch(model, torch.randn(1, 3, size, size))
+        task_models_params += param_count(model)
+        tasks[task]["task_model_accuracy"] = teacher_acc
+        tasks[task]["accuracy_delta"] = student_acc[task] - teacher_acc
+    size = image_size(tf)
+    student_ms = time_per_batch(student, torch.randn(1, 3, size, size))
+    return {
+        "tasks": tasks,
+        "cost": {
+            "task_models_ms_per_image": round(task_models_ms, 2),
+            "student_ms_per_image": round(student_ms, 2),
+            "speedup": round(task_models_ms / student_ms, 2) if student_ms else None,
+            "task_models_params": task_models_params,
+            "student_params": param_count(student),
+        },
+    }
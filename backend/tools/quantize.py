@@ -0,0 +1,146 @@
+"""INT8 post-training quantization with an accuracy guardrail.
+
+Usage (from backend/):
+    python -m tools.quantize --mode static [--models scratch_dent] [--max_accuracy_drop 0.01]
+
+Static mode calibrates activation ranges on a sample of the images the checkpoint was
+trained on; dynamic mode only quantizes the Linear layers. The quantized model is
+published next to its checkpoint (<stem>.int8.pt) only when its accuracy on held-out
+images (see tools.datasets.held_out_splits) stays within --max_accuracy_drop of fp32. The inference loaders pick it up automatically
+(INFERENCE_QUANTIZED_<MODEL>=off disables that).
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from inference.config import MODELS_DIR, checkpoint_path
+from inference.quantized import quantized_path, quantized_report_path
+from tools.common import available_models, image_size, load_eager, time_per_batch
+from tools.datasets import SampleDataset, accuracy, held_out_splits, subsample
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model: nn.Module, calib_loader: DataLoader, example: torch.Tensor, engine: str) -> nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for images, _ in calib_loader:
+            prepared(images)
+    return convert_fx(prepared)
+
+
+def state_dict_bytes(model: nn.Module) -> int:
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell()
+
+
+def quantize_model(name: str, args) -> dict:
+    model, tf, meta = load_eager(name)
+    train, val = held_out_splits(
+        name, meta["class_to_idx"], data_root=args.data_root, val_dir=args.val_dir, subset_size=args.train_subset_size,
+    )
+    calib = subsample(train, args.calibration_samples)
+    val = subsample(val, args.val_samples)
+    calib_loader = DataLoader(SampleDataset(calib, tf), batch_size=args.batch_size, num_workers=args.num_workers)
+    val_loader = DataLoader(SampleDataset(val, tf), batch_size=args.batch_size, num_workers=args.num_workers)
+
+    size = image_size(tf)
+    example = torch.randn(1, 3, size, size)
+    if args.mode == "static":
+        qmodel = quantize_static(model, calib_loader, example, args.engine)
+    else:
+        qmodel = quantize_dynamic(model)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(qmodel.eval(), example))
+
+    acc_fp32 = accuracy(model, val_loader)
+    acc_int8 = accuracy(scripted, val_loader)
+    drop = acc_fp32 - acc_int8
+
+    tmp_path = quantized_path(checkpoint_path(name)) + ".tmp"
+    torch.jit.save(scripted, tmp_path)
+
+    report = {
+        "model": name,
+        "mode": args.mode,
+        "engine": args.engine,
+        "calibration_samples": len(calib) if args.mode == "static" else 0,
+        "val_samples": len(val),
+        "acc_fp32": round(acc_fp32, 4),
+        "acc_int8": round(acc_int8, 4),
+        "acc_drop": round(drop, 4),
+        "max_accuracy_drop": args.max_accuracy_drop,
+        "bytes_fp32": state_dict_bytes(model),
+        "bytes_int8": os.path.getsize(tmp_path),
+        "latency": [],
+    }
+    report["size_ratio"] = round(report["bytes_int8"] / report["bytes_fp32"], 3)
+    for bs in args.batch_sizes:
+        x = torch.randn(bs, 3, size, size)
+        fp32_ms = time_per_batch(model, x)
+        int8_ms = time_per_batch(scripted, x)
+        report["latency"].append({
+            "batch_size": bs,
+            "fp32_ms": round(fp32_ms, 2),
+            "int8_ms": round(int8_ms, 2),
+            "speedup": round(fp32_ms / int8_ms, 2),
+        })
+
+    report["published"] = drop <= args.max_accuracy_drop
+    if report["published"]:
+        os.replace(tmp_path, quantized_path(checkpoint_path(name)))
+    else:
+        os.remove(tmp_path)
+        print(f"Refusing to publish {name}: accuracy drop {drop:.4f} exceeds {args.max_accuracy_drop:.4f}")
+    with open(quantized_report_path(checkpoint_path(name)), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 post-training quantization with accuracy guardrail")
+    parser.add_argument("--models", nargs="*", default=None, help="Model names (checkpoint stems); default: all found")
+    parser.add_argument("--mode", type=str, default="static", choices=["static", "dynamic"])
+    parser.add_argument("--engine", type=str, default="x86", choices=["x86", "fbgemm", "qnnpack"])
+    parser.add_argument("--data_root", type=str, default=None, help="Override the task dataset root (single model runs)")
+    parser.add_argument("--val_dir", type=str, default=None, help="Held-out image directory (single model runs)")
+    parser.add_argument(
+        "--train_subset_size", type=int, default=None,
+        help="--subset_size the checkpoint was trained with, for tasks without a val folder (default: the trainer's default)",
+    )
+    parser.add_argument("--calibration_samples", type=int, default=256)
+    parser.add_argument("--val_samples", type=int, default=0, help="0 = whole validation split")
+    parser.add_argument("--max_accuracy_drop", type=float, default=0.01, help="Absolute top-1 accuracy drop allowed")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_workers", type=int, default=2)
+    parser.add_argument("--batch_sizes", type=int, nargs="*", default=[1, 8])
+    parser.add_argument("--report", type=str, default=os.path.join(MODELS_DIR, "quantization_report.json"))
+    args = parser.parse_args()
+
+    reports = []
+    for name in available_models(args.models):
+        report = quantize_model(name, args)
+        print(json.dumps(report))
+        reports.append(report)
+
+    with open(args.report, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(json.dumps({"report": args.report, "published": [r["model"] for r in reports if r["published"]]}))
+
+
+if __name__ == "__main__":
+    main()
@@ -189,6 +189,12 @@ def build_model(arch: str, num_classes: int) -> nn.Module:
         in_features = model.classifier[-1].in_features
         model.classifier[-1] = nn.Linear(in_features, num_classes)
         return model
+    if arch == "mobilenet_v2":
+        weights = models.MobileNet_V2_Weights.IMAGENET1K_V1
+        model = models.mobilenet_v2(weights=weights)
+        in_features = model.classifier[-1].in_features
+        model.classifier[-1] = nn.Linear(in_features, num_classes)
+        return model
     raise ValueError(f"Unsupported arch: {arch}")
 
 
@@ -310,7 +316,7 @@ def parse_args() -> TrainConfig:
     parser.add_argument("--weight_decay", type=float, default=1e-4)
     parser.add_argument("--num_workers", type=int, default=2)
     parser.add_argument("--image_size", type=int, default=224)
-    parser.add_argument("--arch", type=str, default="efficientnet_b0", choices=["efficientnet_b0", "resnet18"])
+    parser.add_argument("--arch", type=str, default="efficientnet_b0", choices=["efficientnet_b0", "resnet18", "mobilenet_v2"])
     args = parser.parse_args()
     return TrainConfig(
         data_root=args.data_root,
@@ -536,6 +542,12 @@ def build_model(arch: str, num_classes: int) -> nn.Module:
         in_features = model.classifier[-1].in_features
         model.classifier[-1] = nn.Linear(in_features, num_classes)
         return model
+    if arch == "mobilenet_v2":
+        weights = models.MobileNet_V2_Weights.IMAGENET1K_V1
+        model = models.mobilenet_v2(weights=weights)
+        in_features = model.classifier[-1].in_features
+        model.classifier[-1] = nn.Linear(in_features, num_classes)
+        return model
     raise ValueError(f"Unsupported arch: {arch}")
 
 
@@ -667,7 +679,7 @@ def parse_args() -> TrainConfig:
         "--arch",
         type=str,
         default="efficientnet_b0",
-        choices=["efficientnet_b0", "resnet18"],
+        choices=["efficientnet_b0", "resnet18", "mobilenet_v2"],
     )
     args = parser.parse_args()
     return TrainConfig(
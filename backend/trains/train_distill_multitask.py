@@ -0,0 +1,212 @@
+"""Distill the task checkpoints into one multi-task student (shared backbone + one head per task).
+
+Run from backend/:
+    python -m trains.train_distill_multitask --arch mobilenet_v2 [--unlabeled_dir uploads/] [--epochs 5]
+
+Every training image is labeled by every teacher, so the pooled task datasets (and
+any unlabeled photos) supervise all heads at once; the image's own label, when it
+has one, adds a hard cross-entropy term for its task. Saves models/multitask.pt and
+a report comparing per-task student accuracy with each teacher, and the cost of one
+student pass with running all teachers.
+
+Both are scored on images no teacher was trained on (tools.datasets.held_out_splits);
+the student trains on each teacher's own training split.
+"""
+
+import argparse
+import json
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn.functional as F
+from torch.optim import AdamW
+from torch.utils.data import DataLoader
+from torchvision import transforms
+
+from inference.multitask import MULTITASK_CKPT, MultiTaskModel, save_checkpoint, task_num_classes
+from tools.common import available_models, image_size, list_images, load_eager
+from tools.datasets import TaggedDataset, TaggedSample, held_out_splits, subsample
+from tools.multitask import compare_with_task_models, student_accuracy
+
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+@dataclass
+class DistillConfig:
+    tasks: List[str]
+    arch: str
+    image_size: int
+    epochs: int
+    batch_size: int
+    learning_rate: float
+    weight_decay: float
+    temperature: float
+    hard_label_weight: float
+    samples_per_task: int
+    unlabeled_dir: Optional[str]
+    num_workers: int
+    seed: int
+    output: str
+    report: str
+
+
+class Teacher:
+    """A task checkpoint plus the resize/normalize that maps the shared [0, 1] batch to its inputs."""
+
+    def __init__(self, task: str) -> None:
+        self.model, tf, self.meta = load_eager(task)
+        self.size = image_size(tf)
+        normalize = next(t for t in tf.transforms if isinstance(t, transforms.Normalize))
+        self.mean = torch.tensor(normalize.mean).view(1, 3, 1, 1)
+        self.std = torch.tensor(normalize.std).view(1, 3, 1, 1)
+
+    @torch.no_grad()  # not inference_mode: the targets are saved for the student's backward pass
+    def logits(self, x: torch.Tensor) -> torch.Tensor:
+        if x.shape[-1] != self.size:
+            x = F.interpolate(x, size=(self.size, self.size), mode="bilinear", antialias=True, align_corners=False)
+        return self.model((x - self.mean.to(x.device)) / self.std.to(x.device)).float()
+
+
+def build_samples(cfg: DistillConfig, teachers: Dict[str, Teacher]):
+    """Pooled train samples tagged with their task, plus per-task validation splits held out from the teachers."""
+    train: List[TaggedSample] = []
+    val_splits = {}
+    for task_idx, task in enumerate(cfg.tasks):
+        task_train, task_val = held_out_splits(task, teachers[task].meta["class_to_idx"])
+        train.extend((path, task_idx, label) for path, label in subsample(task_train, cfg.samples_per_task, cfg.seed))
+        val_splits[task] = task_val
+    if cfg.unlabeled_dir:
+        train.extend((path, -1, -1) for path in list_images(cfg.unlabeled_dir))
+    random.Random(cfg.seed).shuffle(train)
+    return train, val_splits
+
+
+def distill_loss(student_logits: torch.Tensor, teacher_logits: torch.Tensor, temperature: float) -> torch.Tensor:
+    """Hinton KL term, scaled by T^2 so its gradients stay comparable across temperatures."""
+    return F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=-1),
+        F.softmax(teacher_logits / temperature, dim=-1),
+        reduction="batchmean",
+    ) * temperature ** 2
+
+
+def train_epoch(student, teachers, loader, optimizer, cfg: DistillConfig, device: str) -> float:
+    student.train()
+    normalize = transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+    running = 0.0
+    for batch_idx, (x, task_ids, labels) in enumerate(loader):
+        x, task_ids, labels = x.to(device), task_ids.to(device), labels.to(device)
+        targets = {task: teachers[task].logits(x) for task in cfg.tasks}
+        outputs = student(normalize(x))
+        loss = sum(distill_loss(outputs[task], targets[task], cfg.temperature) for task in cfg.tasks)
+        for task_idx, task in enumerate(cfg.tasks):
+            mask = task_ids == task_idx
+            if cfg.hard_label_weight > 0 and mask.any():
+                loss = loss + cfg.hard_label_weight * F.cross_entropy(outputs[task][mask], labels[mask])
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        running += loss.item()
+        if batch_idx % 10 == 0:
+            print(f"  Batch {batch_idx}/{len(loader)}, Loss: {loss.item():.4f}")
+    return running / max(1, len(loader))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the task models into one multi-task student")
+    parser.add_argument("--tasks", nargs="*", default=None, help="Task checkpoints to distill; default: all found")
+    parser.add_argument("--arch", type=str, default="mobilenet_v2", choices=["mobilenet_v2", "efficientnet_b0", "resnet18"])
+    parser.add_argument("--image_size", type=int, default=224)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--learning_rate", type=float, default=3e-4)
+    parser.add_argument("--weight_decay", type=float, default=1e-4)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--hard_label_weight", type=float, default=0.5, help="Weight of the CE term on labeled images (0 = pure distillation)")
+    parser.add_argument("--samples_per_task", type=int, default=0, help="Cap on train images drawn from each task dataset (0 = all)")
+    parser.add_argument("--unlabeled_dir", type=str, default=None, help="Extra unlabeled photos, labeled by the teachers only")
+    parser.add_argument("--num_workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=MULTITASK_CKPT)
+    parser.add_argument("--report", type=str, default=os.path.join("models", "multitask_report.json"))
+    args = parser.parse_args()
+
+    cfg = DistillConfig(
+        tasks=available_models(args.tasks),
+        arch=args.arch,
+        image_size=args.image_size,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        weight_decay=args.weight_decay,
+        temperature=args.temperature,
+        hard_label_weight=args.hard_label_weight,
+        samples_per_task=args.samples_per_task,
+        unlabeled_dir=args.unlabeled_dir,
+        num_workers=args.num_workers,
+        seed=args.seed,
+        output=args.output,
+        report=args.report,
+    )
+    if not cfg.tasks:
+        raise SystemExit("No task checkpoints found to distill")
+
+    torch.manual_seed(cfg.seed)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    teachers = {task: Teacher(task) for task in cfg.tasks}
+    for teacher in teachers.values():
+        teacher.model.to(device)
+    train, val_splits = build_samples(cfg, teachers)
+    print(json.dumps({"tasks": cfg.tasks, "train_images": len(train)}))
+
+    # Teachers and student see the same augmented [0, 1] batch; each normalizes it its own way
+    train_tf = transforms.Compose([
+        transforms.Resize((cfg.image_size, cfg.image_size)),
+        transforms.RandomHorizontalFlip(p=0.5),
+        transforms.ToTensor(),
+    ])
+    eval_tf = transforms.Compose([
+        transforms.Resize((cfg.image_size, cfg.image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD),
+    ])
+    loader = DataLoader(TaggedDataset(train, train_tf), batch_size=cfg.batch_size, shuffle=True, num_workers=cfg.num_workers)
+
+    student = MultiTaskModel(cfg.arch, {task: task_num_classes(t.meta) for task, t in teachers.items()}, pretrained=True).to(device)
+    optimizer = AdamW(student.parameters(), lr=cfg.learning_rate, weight_decay=cfg.weight_decay)
+
+    best_mean_acc = -1.0
+    best_state = None
+    for epoch in range(1, cfg.epochs + 1):
+        loss = train_epoch(student, teachers, loader, optimizer, cfg, device)
+        student.cpu()
+        val_acc = student_accuracy(student, eval_tf, val_splits, cfg.batch_size, cfg.num_workers)
+        mean_acc = sum(val_acc.values()) / len(val_acc)
+        print(json.dumps({"epoch": epoch, "loss": round(loss, 4), "val_accuracy": val_acc, "mean_val_accuracy": round(mean_acc, 4)}))
+        if mean_acc > best_mean_acc:
+            best_mean_acc = mean_acc
+            best_state = {k: v.clone() for k, v in student.state_dict().items()}
+            os.makedirs(os.path.dirname(cfg.output) or ".", exist_ok=True)
+            save_checkpoint(
+                cfg.output, student, cfg.image_size, IMAGENET_MEAN, IMAGENET_STD,
+                {task: t.meta for task, t in teachers.items()},
+                trained_with="distillation", val_accuracy=val_acc,
+            )
+            print(json.dumps({"saved": cfg.output, "val_acc": round(mean_acc, 4)}))
+        student.to(device)
+
+    student.load_state_dict(best_state)
+    report = compare_with_task_models(student.cpu(), eval_tf, val_splits, cfg.batch_size, cfg.num_workers)
+    with open(cfg.report, "w") as f:
+        json.dump({"arch": cfg.arch, "trained_with": "distillation", **report}, f, indent=2)
+    print(json.dumps({"report": cfg.report, "cost": report["cost"]}))
+
+
+if __name__ == "__main__":
+    main()
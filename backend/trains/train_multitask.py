@@ -0,0 +1,219 @@
+"""Train one shared backbone with a head per task, jointly on all task datasets.
+
+Run from backend/:
+    python -m trains.train_multitask --arch efficientnet_b0 [--sampling sqrt] [--loss_weights damage_parts=2 dirty_binary=0.5]
+
+Batches are drawn across the task datasets (ImageFolder for damage, ``_classes.csv``
+for the others; see tools/datasets.py). Each image trains only its own task's head;
+every task's mean loss in the batch is scaled by its weight. Class maps come from the
+existing task checkpoint when there is one, otherwise from the dataset. Saves the same
+checkpoint format as the distillation trainer (models/multitask.pt), which
+inference.multitask loads as one backbone plus heads.
+
+Each task trains on the split its task checkpoint was trained on and is validated,
+against that checkpoint too, on the images it held out (tools.datasets.held_out_splits),
+so the comparison report never scores a task model on its own training images.
+"""
+
+import argparse
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.optim import AdamW
+from torch.utils.data import DataLoader, WeightedRandomSampler
+from torchvision import transforms
+
+from inference.config import checkpoint_path
+from inference.multitask import MULTITASK_CKPT, MultiTaskModel, save_checkpoint, task_num_classes
+from tools.common import load_eager
+from tools.datasets import TASK_DATASETS, TaggedDataset, TaggedSample, discover_classes, held_out_splits
+from tools.multitask import compare_with_task_models, student_accuracy
+
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Task share of each batch is proportional to dataset_size ** exponent
+SAMPLING_EXPONENTS = {"proportional": 1.0, "sqrt": 0.5, "uniform": 0.0}
+
+
+@dataclass
+class TrainConfig:
+    tasks: List[str]
+    arch: str
+    image_size: int
+    epochs: int
+    batch_size: int
+    learning_rate: float
+    weight_decay: float
+    sampling: str
+    steps_per_epoch: int
+    loss_weights: Dict[str, float]
+    num_workers: int
+    output: str
+    report: str
+
+
+def task_metadata(task: str) -> dict:
+    """class_to_idx and extras, from the task checkpoint when present so the heads keep its label order."""
+    if os.path.exists(checkpoint_path(task)):
+        return load_eager(task)[2]
+    meta = {"class_to_idx": discover_classes(task)}
+    # Same inference as train_damage.py / train_dirty.py
+    if task == "damage_binary":
+        meta["damage_class_index"] = next(i for name, i in meta["class_to_idx"].items() if "damage" in name.lower())
+    elif task == "dirty_binary":
+        names = sorted(meta["class_to_idx"], key=meta["class_to_idx"].get)
+        meta["positive_label"] = next((name for name in names if "dirt" in name.lower()), names[-1])
+    return meta
+
+
+def build_sampler(train: List[TaggedSample], tasks: List[str], sampling: str, num_samples: int) -> WeightedRandomSampler:
+    counts = [0] * len(tasks)
+    for _, task_idx, _ in train:
+        counts[task_idx] += 1
+    exponent = SAMPLING_EXPONENTS[sampling]
+    shares = [count ** exponent if count else 0.0 for count in counts]
+    total = sum(shares)
+    # Per-sample weight = task share / task size, so each task gets its share of every epoch
+    weights = [shares[task_idx] / total / counts[task_idx] for _, task_idx, _ in train]
+    return WeightedRandomSampler(weights, num_samples=num_samples, replacement=True)
+
+
+def train_epoch(model: nn.Module, loader: DataLoader, optimizer, cfg: TrainConfig, device: str) -> Dict[str, float]:
+    model.train()
+    running = {task: 0.0 for task in cfg.tasks}
+    seen = {task: 0 for task in cfg.tasks}
+    for batch_idx, (x, task_ids, labels) in enumerate(loader):
+        x, task_ids, labels = x.to(device), task_ids.to(device), labels.to(device)
+        outputs = model(x)
+        loss = x.new_zeros(())
+        for task_idx, task in enumerate(cfg.tasks):
+            mask = task_ids == task_idx
+            if not mask.any():
+                continue
+            task_loss = F.cross_entropy(outputs[task][mask], labels[mask])
+            loss = loss + cfg.loss_weights.get(task, 1.0) * task_loss
+            running[task] += task_loss.item() * int(mask.sum())
+            seen[task] += int(mask.sum())
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        if batch_idx % 10 == 0:
+            print(f"  Batch {batch_idx}/{len(loader)}, Loss: {loss.item():.4f}")
+    return {task: running[task] / seen[task] for task in cfg.tasks if seen[task]}
+
+
+def parse_loss_weights(items: List[str]) -> Dict[str, float]:
+    weights = {}
+    for item in items:
+        task, _, value = item.partition("=")
+        if task not in TASK_DATASETS or not value:
+            raise ValueError(f"Expected <task>=<weight> with a known task, got {item!r}")
+        weights[task] = float(value)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Joint multi-task training with a shared backbone")
+    parser.add_argument("--tasks", nargs="*", default=None, help="Default: every task whose dataset is present")
+    parser.add_argument("--arch", type=str, default="efficientnet_b0", choices=["efficientnet_b0", "resnet18", "mobilenet_v2"])
+    parser.add_argument("--image_size", type=int, default=224)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--learning_rate", type=float, default=3e-4)
+    parser.add_argument("--weight_decay", type=float, default=1e-4)
+    parser.add_argument("--sampling", type=str, default="sqrt", choices=list(SAMPLING_EXPONENTS))
+    parser.add_argument("--steps_per_epoch", type=int, default=0, help="0 = one pass over the pooled train set")
+    parser.add_argument("--loss_weights", nargs="*", default=[], help="Per-task loss weights as task=weight (default 1)")
+    parser.add_argument("--num_workers", type=int, default=2)
+    parser.add_argument("--output", type=str, default=MULTITASK_CKPT)
+    parser.add_argument("--report", type=str, default=os.path.join("models", "multitask_report.json"))
+    args = parser.parse_args()
+
+    tasks = args.tasks or [t for t, spec in TASK_DATASETS.items() if os.path.isdir(os.path.join(spec["root"], spec["train"]))]
+    cfg = TrainConfig(
+        tasks=tasks,
+        arch=args.arch,
+        image_size=args.image_size,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        weight_decay=args.weight_decay,
+        sampling=args.sampling,
+        steps_per_epoch=args.steps_per_epoch,
+        loss_weights=parse_loss_weights(args.loss_weights),
+        num_workers=args.num_workers,
+        output=args.output,
+        report=args.report,
+    )
+    if not cfg.tasks:
+        raise SystemExit("No task datasets found")
+
+    metas = {task: task_metadata(task) for task in cfg.tasks}
+    train: List[TaggedSample] = []
+    val_splits = {}
+    for task_idx, task in enumerate(cfg.tasks):
+        task_train, task_val = held_out_splits(task, metas[task]["class_to_idx"])
+        train.extend((path, task_idx, label) for path, label in task_train)
+        val_splits[task] = task_val
+    print(json.dumps({"tasks": cfg.tasks, "train_images": len(train), "val_images": {t: len(v) for t, v in val_splits.items()}}))
+
+    train_tf = transforms.Compose([
+        transforms.Resize((cfg.image_size, cfg.image_size)),
+        transforms.RandomHorizontalFlip(p=0.5),
+        transforms.ColorJitter(brightness=0.1, contrast=0.1, saturation=0.1),
+        transforms.ToTensor(),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD),
+    ])
+    eval_tf = transforms.Compose([
+        transforms.Resize((cfg.image_size, cfg.image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD),
+    ])
+    num_samples = cfg.steps_per_epoch * cfg.batch_size if cfg.steps_per_epoch else len(train)
+    loader = DataLoader(
+        TaggedDataset(train, train_tf),
+        batch_size=cfg.batch_size,
+        sampler=build_sampler(train, cfg.tasks, cfg.sampling, num_samples),
+        num_workers=cfg.num_workers,
+    )
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = MultiTaskModel(cfg.arch, {task: task_num_classes(meta) for task, meta in metas.items()}, pretrained=True).to(device)
+    optimizer = AdamW(model.parameters(), lr=cfg.learning_rate, weight_decay=cfg.weight_decay)
+
+    best_mean_acc = -1.0
+    best_state = None
+    for epoch in range(1, cfg.epochs + 1):
+        losses = train_epoch(model, loader, optimizer, cfg, device)
+        model.cpu()
+        val_acc = student_accuracy(model, eval_tf, val_splits, cfg.batch_size, cfg.num_workers)
+        mean_acc = sum(val_acc.values()) / len(val_acc)
+        print(json.dumps({"epoch": epoch, "train_loss": losses, "val_accuracy": val_acc, "mean_val_accuracy": round(mean_acc, 4)}))
+        if mean_acc > best_mean_acc:
+            best_mean_acc = mean_acc
+            best_state = {k: v.clone() for k, v in model.state_dict().items()}
+            os.makedirs(os.path.dirname(cfg.output) or ".", exist_ok=True)
+            save_checkpoint(
+                cfg.output, model, cfg.image_size, IMAGENET_MEAN, IMAGENET_STD, metas,
+                trained_with="joint", sampling=cfg.sampling, loss_weights=cfg.loss_weights, val_accuracy=val_acc,
+            )
+            print(json.dumps({"saved": cfg.output, "val_acc": round(mean_acc, 4)}))
+        model.to(device)
+
+    model.load_state_dict(best_state)
+    report = compare_with_task_models(model.cpu(), eval_tf, val_splits, cfg.batch_size, cfg.num_workers)
+    with open(cfg.report, "w") as f:
+        json.dump({"arch": cfg.arch, "trained_with": "joint", "sampling": cfg.sampling, "loss_weights": cfg.loss_weights, **report}, f, indent=2)
+    print(json.dumps({"report": cfg.report, "cost": report["cost"]}))
+
+
+if __name__ == "__main__":
+    main()